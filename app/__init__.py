@@ -35,6 +35,19 @@ def create_app():
 
     
     cors.init_app(app)
+
+    from .services.metrics import REGISTRY
+    from .services.registry import SimulationRegistry
+    app.extensions['simulation_registry'] = SimulationRegistry()
+    from .services.runs import get_runs
+    get_runs(app)
+    from .services.tracing import TRACER
+    REGISTRY.enabled = app.config.get('SIMULATION_METRICS_ENABLED', True)
+    TRACER.configure(
+        enabled=app.config.get('SIMULATION_TRACE_ENABLED', False),
+        capacity=app.config.get('SIMULATION_TRACE_CAPACITY', 100000),
+        sample_every=app.config.get('SIMULATION_TRACE_SAMPLE_EVERY', 10),
+    )
     
 
     from .views.views import form_bp, home_bp, simulate_bp
@@ -10,6 +10,55 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URI", "sqlite:///database.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # float64 or float32 factor arrays for the in-memory simulation state
+    SIMULATION_STATE_DTYPE = os.getenv("SIMULATION_STATE_DTYPE", "float64")
+    # rows fetched per chunk when streaming the state out of the database
+    SIMULATION_LOAD_CHUNK_SIZE = int(os.getenv("SIMULATION_LOAD_CHUNK_SIZE", 50000))
+    # upper bound on the steps one /simulation/api/run_steps request may run
+    SIMULATION_MAX_RUN_STEPS = int(os.getenv("SIMULATION_MAX_RUN_STEPS", 10000))
+    # "inline" steps in the request process, "process" shards rows over a process pool
+    SIMULATION_EXECUTION_MODE = os.getenv("SIMULATION_EXECUTION_MODE", "inline")
+    # process pool size for the "process" mode; defaults to the number of cores
+    SIMULATION_WORKERS = int(os.getenv("SIMULATION_WORKERS", 0)) or None
+    # seed of the per-(step, simulation, block) random streams; unset draws a fresh seed per run
+    SIMULATION_SEED = int(os.getenv("SIMULATION_SEED")) if os.getenv("SIMULATION_SEED") else None
+    # live Socket.IO stream: steps per run, frames per second, unacknowledged frames per client
+    SIMULATION_STREAM_STEPS = int(os.getenv("SIMULATION_STREAM_STEPS", 500))
+    SIMULATION_STREAM_FPS = float(os.getenv("SIMULATION_STREAM_FPS", 10))
+    SIMULATION_STREAM_MAX_IN_FLIGHT = int(os.getenv("SIMULATION_STREAM_MAX_IN_FLIGHT", 2))
+    # write-behind persistence of step results into simulation_result / test_results
+    SIMULATION_RESULTS_ENABLED = os.getenv("SIMULATION_RESULTS_ENABLED", "1") == "1"
+    SIMULATION_RESULTS_BATCH_ROWS = int(os.getenv("SIMULATION_RESULTS_BATCH_ROWS", 50000))
+    SIMULATION_RESULTS_FLUSH_INTERVAL = float(os.getenv("SIMULATION_RESULTS_FLUSH_INTERVAL", 2.0))
+    SIMULATION_RESULTS_MAX_PENDING_ROWS = int(os.getenv("SIMULATION_RESULTS_MAX_PENDING_ROWS", 2000000))
+    # per-student test results every N steps of a run; 0 records only the last step
+    SIMULATION_RESULTS_TEST_EVERY = int(os.getenv("SIMULATION_RESULTS_TEST_EVERY", 0))
+    # write evolved factors and GPA back to the database every N steps (0: never) and at the end of a run
+    SIMULATION_COMMIT_EVERY = int(os.getenv("SIMULATION_COMMIT_EVERY", 0))
+    SIMULATION_COMMIT_ON_RUN_END = os.getenv("SIMULATION_COMMIT_ON_RUN_END", "1") == "1"
+    SIMULATION_SYNC_CHUNK_SIZE = int(os.getenv("SIMULATION_SYNC_CHUNK_SIZE", 50000))
+    # memory-mapped snapshot of the state; an empty cache is restored from it
+    SIMULATION_SNAPSHOT_DIR = os.getenv("SIMULATION_SNAPSHOT_DIR", "snapshots/state")
+    SIMULATION_SNAPSHOT_ON_RUN_END = os.getenv("SIMULATION_SNAPSHOT_ON_RUN_END", "0") == "1"
+    # seekable run timelines: a keyframe every N steps and exact "rng" (or lossy, larger "quantized")
+    # deltas in between; only the newest SIMULATION_TIMELINE_RETENTION timelines are kept (0: all)
+    SIMULATION_TIMELINE_ENABLED = os.getenv("SIMULATION_TIMELINE_ENABLED", "0") == "1"
+    SIMULATION_TIMELINE_DIR = os.getenv("SIMULATION_TIMELINE_DIR", "timelines")
+    SIMULATION_TIMELINE_KEYFRAME_EVERY = int(os.getenv("SIMULATION_TIMELINE_KEYFRAME_EVERY", 50))
+    SIMULATION_TIMELINE_DELTAS = os.getenv("SIMULATION_TIMELINE_DELTAS", "rng")
+    SIMULATION_TIMELINE_RETENTION = int(os.getenv("SIMULATION_TIMELINE_RETENTION", 20))
+    # stage, cache and engine phase timings exposed at /metrics in the Prometheus text format
+    SIMULATION_METRICS_ENABLED = os.getenv("SIMULATION_METRICS_ENABLED", "1") == "1"
+    # span tracing of every N-th step into a ring buffer, exported at /simulation/api/trace
+    SIMULATION_TRACE_ENABLED = os.getenv("SIMULATION_TRACE_ENABLED", "0") == "1"
+    SIMULATION_TRACE_CAPACITY = int(os.getenv("SIMULATION_TRACE_CAPACITY", 100000))
+    SIMULATION_TRACE_SAMPLE_EVERY = int(os.getenv("SIMULATION_TRACE_SAMPLE_EVERY", 10))
+    # namespaced runs (?run=<id>): how many may exist, state bytes of one run and of all runs,
+    # and seconds a run may sit idle before it is evicted
+    SIMULATION_MAX_RUNS = int(os.getenv("SIMULATION_MAX_RUNS", 32))
+    SIMULATION_RUN_MAX_BYTES = int(os.getenv("SIMULATION_RUN_MAX_BYTES", 512 * 2**20))
+    SIMULATION_RUNS_MAX_BYTES = int(os.getenv("SIMULATION_RUNS_MAX_BYTES", 4 * 2**30))
+    SIMULATION_RUN_TTL = float(os.getenv("SIMULATION_RUN_TTL", 3600))
 
 def get_config():
     return Config
@@ -202,6 +202,7 @@ class SimulationResult(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     simulation_id = db.Column(db.Integer, db.ForeignKey('simulation.id'), nullable=False)
+    step = db.Column(db.Integer, nullable=True)  # step of the run the metric was taken at
     graph_type = db.Column(db.String(50), nullable=False)  # e.g., "Student Performance" or "Factor Influence"
     metric_name = db.Column(db.String(100), nullable=False)
     value = db.Column(db.Float, nullable=False)
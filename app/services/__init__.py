@@ -1,7 +1,16 @@
 from .memory_state import state_wrapper
-from .loader import load_initial_data
+from .loader import load_initial_data, load_initial_state
 from .simulation_service import SimulationService
-from app.services.cache import get_cached_simulation_data, cache_lookup_data
+from .aggregates import RunningStats, step_summaries
+from .simulation_engine import SimulationEngine
+from .offload import offload
+from app.services.cache import (
+    get_cached_simulation_data, cache_state_snapshot, cache_lookup_data, get_cached_lookup_data,
+    get_cached_state, persist_dirty_state, current_step, reserve_steps, reset_stream_clock, stream_seed, LOOKUP_KEY
+)
+from app.services.registry import get_registry, invalidate_registry
+from app.services.runs import get_runs, database_generation
+from app.services.snapshot import read_snapshot, write_snapshot
 from app.utils.build_flat_lookup import build_lookup
 from log.logger import logger
 
@@ -13,15 +22,24 @@ def loader():
 
 def memory_state_population(simulation_data):
     """Initializes the memory state by loading data gotten from the database."""
-    return state_wrapper(simulation_data)
+    from flask import current_app
+    return state_wrapper(simulation_data, dtype=current_app.config.get("SIMULATION_STATE_DTYPE", "float64"))
+
+
+def stream_memory_state():
+    """Streams the memory state straight out of the database."""
+    from flask import current_app
+    return load_initial_state(
+        dtype=current_app.config.get("SIMULATION_STATE_DTYPE", "float64"),
+        chunk_size=current_app.config.get("SIMULATION_LOAD_CHUNK_SIZE", 50000)
+    )
 
 
 def load_memory():
     """Runs the simulation by loading data from the database and processing it."""
     logger.info("Starting memory population...")
     try:
-        loaded_data = loader()
-        memory_state = memory_state_population(loaded_data)
+        memory_state = stream_memory_state()
         logger.info("Memory initialized and populated successfully.")
         return memory_state
     except Exception as e:
@@ -35,12 +53,8 @@ def initialize_memory():
     app = create_app()
     with app.app_context():
         try:
-            logger.info("Loading initial data...")
-            initial_data = loader()
-            logger.info("Initial data loaded successfully.")
-
-            logger.info("Creating memory state...")
-            simulation_data = memory_state_population(initial_data)
+            logger.info("Streaming initial data into memory state...")
+            simulation_data = stream_memory_state()
             logger.info("Memory state created successfully.")
 
             return simulation_data
@@ -50,7 +64,8 @@ def initialize_memory():
 
 
 def mem_factors_flat_lookup():
-    """Build flat lookup for each memory factor type and cache the result."""
+    """Build the student row index and publish the memory state as the row-block cache."""
+    from flask import current_app
     try:
         simulation_data = get_cached_simulation_data()
         if not simulation_data:
@@ -58,24 +73,14 @@ def mem_factors_flat_lookup():
             raise RuntimeError("No simulation data found in cache. Please load memory first.")
 
         logger.info("Building flat lookup for memory factors...")
+        student_row_lookup = build_lookup(simulation_data)
+        cache_lookup_data(student_row_lookup, mem_factor_identifier=LOOKUP_KEY)
 
-        internal_factor_data = simulation_data.mem_internal_factors
-        internal_factors_flat_lookup = build_lookup(
-            mem_factor=internal_factor_data, mem_factor_identitier="mem_internal_factor"
-        )
-        cache_lookup_data(internal_factors_flat_lookup, mem_factor_identifier="mem_internal_factor")
-
-        institutional_factor_data = simulation_data.mem_institutional_factors
-        institutional_factors_flat_lookup = build_lookup(
-            mem_factor=institutional_factor_data, mem_factor_identitier="mem_institutional_factor"
-        )
-        cache_lookup_data(institutional_factors_flat_lookup, mem_factor_identifier="mem_institutional_factor")
-
-        external_factor_data = simulation_data.mem_external_factors
-        external_factors_flat_lookup = build_lookup(
-            mem_factor=external_factor_data, mem_factor_identitier="mem_external_factor"
-        )
-        cache_lookup_data(external_factors_flat_lookup, mem_factor_identifier="mem_external_factor")
+        logger.info("Caching memory factor blocks...")
+        cache_state_snapshot(simulation_data)
+        # a freshly loaded state starts over at step 0 of the configured streams
+        reset_stream_clock(current_app.config.get("SIMULATION_SEED"))
+        get_registry().refresh()
 
         logger.info("Flat lookup built and cached successfully.")
         return "Flat lookup built and cached successfully."
@@ -85,15 +90,277 @@ def mem_factors_flat_lookup():
         raise
 
 
-def run_simulation():
-    """Runs the simulation by processing cached data."""
-    simulation_service = SimulationService()
+def row_index(state, run_id=None):
+    """The cached row index of a run's state; built afresh when it is missing or does not match the state"""
+    index = get_cached_lookup_data(LOOKUP_KEY, run_id=run_id)
+    if index is None or len(index) != len(state):
+        index = build_lookup(state)
+    return index
+
+
+def run_simulation(run_id=None):
+    """Runs one step of every registered simulation on the cached data of a run (default: the shared state)."""
+    if run_id is not None:
+        get_runs().require(run_id)
+        get_runs().touch(run_id)
+    simulation_service = SimulationService(run_id)
     try:
         logger.info("Processing simulation...")
-        simulation_service.start_simulation_threading()
-        processed_simulation = simulation_service.process_simulation()
+        step = simulation_service.next_step()
+        processed_simulation = [
+            simulation_service.process_simulation(simulation, step=step) for simulation in simulation_service.simulations
+        ]
         logger.info("Simulation run successfully.")
         return processed_simulation
     except Exception as e:
         logger.exception("Error occurred during simulation run.")
         return str(e)
+
+
+def snapshot_dir(run_id=None):
+    from flask import current_app
+    if run_id is not None:
+        return get_runs().snapshot_dir(run_id)
+    return current_app.config.get("SIMULATION_SNAPSHOT_DIR", "snapshots/state")
+
+
+def snapshot_memory(state=None, rng=None, step=None, run_id=None):
+    """Write the cached (or given) state of a run to its snapshot directory.
+
+    The snapshot records the step the state is at and the run's random
+    streams (by default the namespace's step counter and stream seed), so
+    restore_memory resumes the run where the snapshot left it.
+    """
+    from flask import current_app
+    from app.services.rng import RandomStreams
+
+    if run_id is not None:
+        get_runs().require(run_id)
+    state = state if state is not None else get_cached_state(run_id=run_id)
+    if state is None:
+        raise RuntimeError("No simulation data found in cache. Please load memory first.")
+    if step is None:
+        step = current_step(run_id)
+    if rng is None:
+        rng = RandomStreams(stream_seed(current_app.config.get("SIMULATION_SEED"), run_id))
+    return offload(write_snapshot, snapshot_dir(run_id), state, index=row_index(state, run_id), rng=rng, step=step)
+
+
+def restore_memory(run_id=None):
+    """Map the last snapshot of a run back in and republish it as its row-block cache and row index.
+
+    The namespace's step counter and stream seed are set back to the
+    snapshot's, so the next step continues the snapshotted run. Returns the
+    Snapshot, or None when no snapshot has been written.
+    """
+    from flask import current_app
+
+    expire = None
+    if run_id is not None:
+        runs = get_runs()
+        runs.require(run_id)
+        expire = runs.key_ttl
+    snapshot = read_snapshot(snapshot_dir(run_id))
+    if snapshot is None:
+        return None
+    cache_lookup_data(snapshot.index, mem_factor_identifier=LOOKUP_KEY, run_id=run_id, expire=expire)
+    cache_state_snapshot(snapshot.state, run_id=run_id, expire=expire)
+    seed = snapshot.rng.entropy if snapshot.rng is not None else current_app.config.get("SIMULATION_SEED")
+    reset_stream_clock(seed, step=snapshot.step, run_id=run_id, expire=expire)
+    logger.info("Simulation state restored from snapshot at step %d.", snapshot.step)
+    return snapshot
+
+
+def cached_or_restored_state(run_id=None):
+    """The cached state of a run; after a cache flush it is restored from the last snapshot.
+
+    Raises RunNotFound for a run that does not exist (or was evicted).
+    """
+    if run_id is not None:
+        get_runs().require(run_id)
+    state = get_cached_state(run_id=run_id)
+    if state is None:
+        snapshot = restore_memory(run_id)
+        state = snapshot.state if snapshot else None
+    return state
+
+
+def run_simulation_steps(num_steps, every=1, simulation_ids=None, detail=False, run_id=None):
+    """Run num_steps steps on one hot copy of the cached state of a run (default: the shared state).
+
+    Steps continue the step counter and random streams of the run's
+    namespace, so a second call draws new numbers rather than replaying the
+    first. Yields ``{"step": n, "simulations": [...]}`` (n the namespace's
+    step number) of per-simulation aggregates after every `every`-th step of
+    the call and after the last one; running score stats
+    cover every step of the run and `detail` adds per-student scores. With
+    SIMULATION_EXECUTION_MODE "process" the rows are sharded over the process
+    pool. Emitted aggregates, and per-student scores every
+    SIMULATION_RESULTS_TEST_EVERY steps (else the last one), are queued for
+    the write-behind result writer. Factors and GPA are synced to the database
+    every SIMULATION_COMMIT_EVERY steps and when the run completes, and with
+    SIMULATION_SNAPSHOT_ON_RUN_END a completed run is snapshotted to disk.
+    Changed blocks are written back to the cache once the run ends, also when
+    the consumer stops early. An empty cache is restored from the last
+    snapshot first. With SIMULATION_TIMELINE_ENABLED every step is recorded
+    in a seekable run timeline whose id is added to the yielded records.
+    A named run is pinned against eviction while it steps and is never
+    committed to the database on its own; see commit_cached_state.
+    """
+    from flask import current_app
+    from app.services.parallel import ShardedRunner
+    from app.services.result_writer import get_result_writer
+    from app.services.state_sync import GradeBook, sync_in_app_context
+    from app.services.timeline import RunTimeline, inline_replay
+    from app.services.tracing import TRACER
+
+    state = cached_or_restored_state(run_id)
+    if state is None:
+        raise RuntimeError("No simulation data found in cache. Please load memory first.")
+    runs = get_runs() if run_id is not None else None
+
+    sharded = simulation_ids is None and current_app.config.get("SIMULATION_EXECUTION_MODE") == "process"
+    seed = stream_seed(current_app.config.get("SIMULATION_SEED"), run_id)
+    first_step = reserve_steps(num_steps, run_id)
+    runner = ShardedRunner(state, workers=current_app.config.get("SIMULATION_WORKERS"), seed=seed,
+                           first_step=first_step) if sharded else None
+    engine = SimulationEngine(seed)
+    running = RunningStats()
+    writer = get_result_writer()
+    test_every = current_app.config.get("SIMULATION_RESULTS_TEST_EVERY", 0)
+    # runs share the database: only the shared state is written back automatically
+    commit_every = current_app.config.get("SIMULATION_COMMIT_EVERY", 0) if runs is None else 0
+    commit_on_end = current_app.config.get("SIMULATION_COMMIT_ON_RUN_END", True) if runs is None else False
+    sync_chunk_size = current_app.config.get("SIMULATION_SYNC_CHUNK_SIZE", 50000)
+    grades = GradeBook(state, row_index(state, run_id)) if commit_every or commit_on_end else None
+    snapshot_on_end = current_app.config.get("SIMULATION_SNAPSHOT_ON_RUN_END", False)
+    timeline = None
+    if current_app.config.get("SIMULATION_TIMELINE_ENABLED", False):
+        timeline = offload(
+            RunTimeline.create, current_app.config.get("SIMULATION_TIMELINE_DIR", "timelines"), state,
+            keyframe_every=current_app.config.get("SIMULATION_TIMELINE_KEYFRAME_EVERY", 50),
+            deltas=current_app.config.get("SIMULATION_TIMELINE_DELTAS", "rng"),
+            retention=current_app.config.get("SIMULATION_TIMELINE_RETENTION", 20),
+            meta={"mode": "sharded" if sharded else "inline", "simulation_ids": simulation_ids, "run": run_id},
+        )
+
+    flask_app = current_app._get_current_object()
+
+    def commit_state():
+        # a sharded run evolves the shared copy; copy it back before reading the state
+        with TRACER.span("commit_state", "database"):
+            if runner:
+                runner.sync_back()
+            # database work stays on this green thread: the engine's pool and connections are green
+            sync_in_app_context(flask_app, state, offload(grades.gpa), sync_chunk_size)
+
+    logger.info("Running %d simulation steps over %d students (%s)...",
+                num_steps, len(state), "sharded" if sharded else "inline")
+    if runs:
+        runs.pin(run_id)
+    try:
+        for i in range(1, num_steps + 1):
+            # i counts the steps of this call, step_number those of the namespace
+            step_number = first_step + i - 1
+            record = None
+            # the step span ends before the record is handed to the consumer
+            with TRACER.step(step_number, mode="sharded" if sharded else "inline"):
+                replay = None
+                if timeline and timeline.deltas == "rng":
+                    replay = runner.replay_info() if runner else inline_replay(engine, step_number, simulation_ids)
+                # the sharded runner only waits on green futures; inline steps go to a native thread
+                step = runner.step() if runner else offload(engine.step_batch, state, simulation_ids=simulation_ids,
+                                                            step=step_number)
+                if timeline:
+                    offload(timeline.record, i, runner.state if runner else state, replay)
+                last = i == num_steps
+                if grades:
+                    offload(grades.add, step)
+                    if commit_every and i % commit_every == 0 and not last:
+                        commit_state()
+                record_tests = last or (test_every and i % test_every == 0)
+                if i % every == 0 or last or (writer and record_tests):
+                    summaries = offload(step_summaries, step, running, detail)
+                    if writer:
+                        writer.submit(step_number, summaries, step if record_tests else None)
+                    if i % every == 0 or last:
+                        record = {"step": step_number, "simulations": summaries}
+                        if timeline:
+                            record["run_id"] = timeline.run_id
+                        if runs:
+                            record["run"] = run_id
+                else:
+                    offload(running.add_step, step)
+            if runs:
+                runs.touch(run_id)
+            if record is not None:
+                yield record
+        if commit_on_end:
+            commit_state()
+        if snapshot_on_end:
+            if runner:
+                runner.sync_back()
+            snapshot_memory(state, rng=runner.engine.streams if runner else engine.streams,
+                            step=first_step + num_steps - 1, run_id=run_id)
+    finally:
+        if timeline:
+            timeline.close()
+        if runner:
+            runner.close()
+        try:
+            with TRACER.span("persist_dirty_state", "cache"):
+                if runs:
+                    runs.persist(state, run_id)
+                else:
+                    persist_dirty_state(state)
+        finally:
+            if runs:
+                runs.unpin(run_id)
+        logger.info("Simulation run finished; dirty state persisted.")
+
+
+def timeline_state(run_id, step):
+    """Per-simulation factor means of a recorded run after `step`"""
+    from flask import current_app
+    from app.services.timeline import RunTimeline
+
+    try:
+        timeline = RunTimeline.open(current_app.config.get("SIMULATION_TIMELINE_DIR", "timelines"), run_id)
+    except KeyError:
+        return None
+    if not 0 <= step <= timeline.steps:
+        raise ValueError(f"step must be between 0 and {timeline.steps}")
+    state = offload(timeline.seek, step)
+    simulations = []
+    for simulation_id in state.partition_ids().tolist():
+        rows = state.simulation_slice(simulation_id)
+        institutional = state.institutional_slice(simulation_id)
+        simulations.append({
+            "simulation_id": simulation_id,
+            "students": rows.stop - rows.start,
+            "avg_internal_factor": float(state.internal_factors[rows].mean()) if rows.stop > rows.start else None,
+            "avg_external_factor": float(state.external_factors[rows].mean()) if rows.stop > rows.start else None,
+            "avg_institutional_factor": (float(state.institutional_factors[institutional].mean())
+                                         if institutional.stop > institutional.start else None),
+        })
+    return {"run_id": run_id, "step": step, "steps": timeline.steps, "simulations": simulations}
+
+
+def commit_cached_state(run_id=None):
+    """Write the factors of the cached state of a run back to the database.
+
+    A run created before the database was last reseeded no longer matches the
+    students table and is refused.
+    """
+    from flask import current_app
+    from app.services.state_sync import sync_in_app_context
+
+    if run_id is not None:
+        generation = get_runs().require(run_id)["generation"]
+        if generation != database_generation():
+            raise RuntimeError(f"Run {run_id} was created before the database was reseeded; not committing it")
+    state = cached_or_restored_state(run_id)
+    if state is None:
+        raise RuntimeError("No simulation data found in cache. Please load memory first.")
+    return sync_in_app_context(current_app._get_current_object(), state, None,
+                               current_app.config.get("SIMULATION_SYNC_CHUNK_SIZE", 50000))
@@ -0,0 +1,137 @@
+"""Per-simulation aggregates of a StepResult.
+
+Every statistic is a reduction per simulation segment of the result arrays.
+Rows are mapped to their segment rather than assumed to be grouped, so a step
+over simulations given out of order (or any unsorted partition) still
+aggregates correctly. Payload size depends on the number of
+simulations and bins, not on the number of students; per-student scores are
+only added when detail is requested.
+"""
+
+import numpy as np
+
+# histograms use SCORE_BINS equal-width bins over SCORE_RANGE
+SCORE_RANGE = (0.0, 100.0)
+SCORE_BINS = 20
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def segments(simulation_ids):
+    """(sorted simulation ids, segment of every row, rows per segment); rows need not be grouped"""
+    ids, inverse, counts = np.unique(simulation_ids, return_inverse=True, return_counts=True)
+    return ids, inverse.reshape(-1), counts
+
+
+def segment_order(inverse, counts):
+    """Row order that groups every segment together, and the start of each segment in it"""
+    order = np.argsort(inverse, kind='stable')
+    starts = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    return order, starts
+
+
+def segment_means(values, inverse, counts):
+    if not len(values):
+        return np.empty(0)
+    return np.bincount(inverse, weights=values, minlength=len(counts)) / counts
+
+
+def segment_moments(scores, inverse, counts):
+    """Per-segment means and sums of squared deviations from them"""
+    means = segment_means(scores, inverse, counts)
+    if not len(scores):
+        return means, np.empty(0)
+    deviations = scores - means[inverse]
+    m2 = np.bincount(inverse, weights=deviations * deviations, minlength=len(counts))
+    return means, m2
+
+
+def score_histograms(scores, inverse, counts, bins=SCORE_BINS, score_range=SCORE_RANGE):
+    """(simulations x bins) counts over fixed bins spanning score_range"""
+    low, high = score_range
+    bin_index = ((scores - low) * (bins / (high - low))).astype(np.int64)
+    np.clip(bin_index, 0, bins - 1, out=bin_index)
+    return np.bincount(inverse * bins + bin_index, minlength=len(counts) * bins).reshape(len(counts), bins)
+
+
+class RunningStats:
+    """Count, mean and variance of every score seen per simulation, merged batch by batch"""
+
+    def __init__(self):
+        self.count = {}
+        self.mean = {}
+        self.m2 = {}
+
+    def update(self, simulation_id, count, mean, m2):
+        """Chan et al. merge of a batch's (count, mean, sum of squared deviations)"""
+        total = self.count.get(simulation_id, 0)
+        if not total:
+            self.count[simulation_id], self.mean[simulation_id], self.m2[simulation_id] = count, mean, m2
+            return
+        merged = total + count
+        delta = mean - self.mean[simulation_id]
+        self.mean[simulation_id] += delta * count / merged
+        self.m2[simulation_id] += m2 + delta * delta * total * count / merged
+        self.count[simulation_id] = merged
+
+    def add_step(self, step):
+        """Merge the scores of a StepResult that is not otherwise summarized"""
+        simulation_ids, inverse, counts = segments(step.simulation_ids)
+        means, m2 = segment_moments(step.scores, inverse, counts)
+        for simulation_id, count, mean, sq in zip(simulation_ids.tolist(), counts.tolist(),
+                                                  means.tolist(), m2.tolist()):
+            self.update(simulation_id, count, mean, sq)
+
+    def summary(self, simulation_id):
+        count = self.count.get(simulation_id, 0)
+        return {
+            "count": count,
+            "mean": self.mean.get(simulation_id),
+            "variance": self.m2[simulation_id] / count if count else None,
+        }
+
+
+def step_summaries(step, running=None, detail=False):
+    """One JSON-ready record per simulation of a StepResult.
+
+    `running` (RunningStats) is updated with this step's scores and reported
+    alongside; `detail` adds the per-student ids and scores.
+    """
+    simulation_ids, inverse, counts = segments(step.simulation_ids)
+    means, m2 = segment_moments(step.scores, inverse, counts)
+    histograms = score_histograms(step.scores, inverse, counts)
+    impacts = {
+        "avg_internal_factor": segment_means(step.internal_impact, inverse, counts),
+        "avg_external_factor": segment_means(step.external_impact, inverse, counts),
+        "avg_institutional_factor": segment_means(step.institutional_impact, inverse, counts),
+    }
+    # min, max, quantiles and detail need each simulation's rows side by side
+    order, starts = segment_order(inverse, counts)
+    scores = step.scores[order]
+
+    summaries = []
+    for i, simulation_id in enumerate(simulation_ids.tolist()):
+        segment = scores[starts[i]:starts[i] + counts[i]]
+        summary = {
+            "simulation_id": simulation_id,
+            "students": int(counts[i]),
+            "scores": {
+                "mean": float(means[i]),
+                "variance": float(m2[i] / counts[i]),
+                "min": float(segment.min()),
+                "max": float(segment.max()),
+                "quantiles": dict(zip(map(str, QUANTILES), np.quantile(segment, QUANTILES).tolist())),
+                "histogram": histograms[i].tolist(),
+            },
+            **{name: float(values[i]) for name, values in impacts.items()},
+        }
+        if running is not None:
+            running.update(simulation_id, int(counts[i]), float(means[i]), float(m2[i]))
+            summary["running"] = running.summary(simulation_id)
+        if detail:
+            rows = order[starts[i]:starts[i] + counts[i]]
+            summary["student_ids"] = step.student_ids[rows].tolist()
+            summary["student_scores"] = segment.tolist()
+        summaries.append(summary)
+    return summaries
+
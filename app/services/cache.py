@@ -1,16 +1,30 @@
 import redis
-import pickle
+import numpy as np
+from app.services import state_format
+from app.services.metrics import CACHE_SECONDS, record_cache_bytes, timed
 from log.logger import logger
 
 # establishing a connection to the Redis server
 redis_client = redis.Redis(host='localhost', port=6379, db=0)
 
+SIMULATION_DATA_KEY = 'simulation_data'
+LOOKUP_KEY = 'student_row_index'
+
+
+def run_key(key, run_id=None):
+    """Redis key of `key` in a run's namespace; run_id None is the shared default namespace"""
+    if run_id is None:
+        return key
+    return f"run:{run_id}:{key}"
+
 
 # store data in Redis
-def cache_simulation_data(data):
+@timed(CACHE_SECONDS, "cache_simulation_data")
+def cache_simulation_data(data, run_id=None):
     try:
-        serialized_data = pickle.dumps(data)
-        redis_client.set('simulation_data', serialized_data)
+        serialized_data = state_format.dumps(data)
+        redis_client.set(run_key(SIMULATION_DATA_KEY, run_id), serialized_data)
+        record_cache_bytes("cache_simulation_data", len(serialized_data))
         logger.info("Simulation data cached successfully.")
     except Exception as e:
         logger.error(f"Error caching simulation data: {str(e)}")
@@ -18,13 +32,15 @@ def cache_simulation_data(data):
 
 
 # retrieve and return stored data from Redis
-def get_cached_simulation_data():
+@timed(CACHE_SECONDS, "get_cached_simulation_data")
+def get_cached_simulation_data(run_id=None):
     logger.debug("Retrieving cached simulation data...")
     try:
-        serialized_data = redis_client.get('simulation_data')
+        serialized_data = redis_client.get(run_key(SIMULATION_DATA_KEY, run_id))
         if serialized_data:
+            record_cache_bytes("get_cached_simulation_data", len(serialized_data))
             logger.info("Cached simulation data retrieved successfully.")
-            return pickle.loads(serialized_data)
+            return state_format.loads(serialized_data)
         else:
             logger.warning("No cached simulation data found.")
             return None
@@ -33,27 +49,363 @@ def get_cached_simulation_data():
         raise RuntimeError(f"Error retrieving cached simulation data: {str(e)}")
 
 
-def cache_lookup_data(mem_factor, mem_factor_identifier):
-    """Cache mem factor lookup data"""
+@timed(CACHE_SECONDS, "cache_lookup_data")
+def cache_lookup_data(mem_factor, mem_factor_identifier, run_id=None, expire=None):
+    """Cache mem factor lookup data (a RowIndex is stored in the binary state format).
+
+    `expire` seconds bound the life of a run's key.
+    """
     try:
-        serialized_data = pickle.dumps(mem_factor)
-        redis_client.set(mem_factor_identifier, serialized_data)
-        logger.info(f"Successfully cached: {mem_factor_identifier}")
+        serialized_data = state_format.dumps(mem_factor)
+        redis_client.set(run_key(mem_factor_identifier, run_id), serialized_data, ex=expire)
+        record_cache_bytes("cache_lookup_data", len(serialized_data))
+        logger.info("Successfully cached: %s", mem_factor_identifier)
     except Exception as e:
         logger.error(f"Error caching lookup data for {mem_factor_identifier}: {str(e)}")
         raise RuntimeError(f"Error caching lookup data: {str(e)}")
 
 
-def get_cached_lookup_data(mem_factor_identifier):
+@timed(CACHE_SECONDS, "get_cached_lookup_data")
+def get_cached_lookup_data(mem_factor_identifier, run_id=None):
     try:
-        logger.debug(f"Retrieving cached lookup data for {mem_factor_identifier}...")
-        serialized_data = redis_client.get(mem_factor_identifier)
+        logger.debug("Retrieving cached lookup data for %s...", mem_factor_identifier)
+        serialized_data = redis_client.get(run_key(mem_factor_identifier, run_id))
         if serialized_data:
-            logger.info(f"Cached lookup data for {mem_factor_identifier} retrieved successfully.")
-            return pickle.loads(serialized_data)
+            record_cache_bytes("get_cached_lookup_data", len(serialized_data))
+            logger.debug("Cached lookup data for %s retrieved successfully.", mem_factor_identifier)
+            return state_format.loads(serialized_data)
         else:
-            logger.warning(f"No cached lookup data found for {mem_factor_identifier}.")
+            logger.warning("No cached lookup data found for %s.", mem_factor_identifier)
             return None
     except Exception as e:
         logger.error(f"Error retrieving cached lookup data for {mem_factor_identifier}: {str(e)}")
         raise RuntimeError(f"Error retrieving cached lookup data: {str(e)}")
+
+
+# block-structured simulation state, partitioned per simulation and persisted
+# incrementally between checkpoints
+STATE_BLOCK_SIZE = 4096
+STATE_PARTITIONS_KEY = 'simulation_state_partitions'
+STATE_INDEX_KEY = 'simulation_state_index'
+STATE_FAMILY_KEYS = {
+    'internal_factors': 'mem_internal_factor',
+    'external_factors': 'mem_external_factor',
+    'institutional_factors': 'mem_institutional_factor',
+}
+
+
+def partition_key(key, simulation_id, run_id=None):
+    """Redis key of one simulation's partition of a state key"""
+    return run_key(f"{key}:{simulation_id}", run_id)
+
+
+def _partition_keys(simulation_id, run_id=None):
+    return [partition_key(STATE_INDEX_KEY, simulation_id, run_id)] + [
+        partition_key(key, simulation_id, run_id) for key in STATE_FAMILY_KEYS.values()
+    ]
+
+
+def _block_ids(flags, block_size):
+    return np.unique(np.flatnonzero(flags) // block_size)
+
+
+def _all_blocks(values, block_size):
+    return range((len(values) + block_size - 1) // block_size)
+
+
+def _family_blocks(values, blocks, block_size):
+    """Serialize the selected row blocks of a factor array as {block: bytes}"""
+    return {
+        int(block): state_format.dumps(values[block * block_size:(block + 1) * block_size])
+        for block in blocks
+    }
+
+
+def _queue_partition_blocks(pipe, state, simulation_id, block_size, dirty_only, run_id=None, expire=None):
+    """Queue HSETs of one simulation's row blocks; returns the number of blocks and bytes queued"""
+    rows = state.simulation_slice(simulation_id)
+    institutional = state.institutional_slice(simulation_id)
+    families = {
+        'internal_factors': (state.internal_factors[rows], state.dirty_rows[rows]),
+        'external_factors': (state.external_factors[rows], state.dirty_rows[rows]),
+        'institutional_factors': (state.institutional_factors[institutional],
+                                  state.dirty_institutional_rows[institutional]),
+    }
+    queued = nbytes = 0
+    for family, key in STATE_FAMILY_KEYS.items():
+        values, dirty = families[family]
+        blocks = _block_ids(dirty, block_size) if dirty_only else _all_blocks(values, block_size)
+        payload = _family_blocks(values, blocks, block_size)
+        if payload:
+            pipe.hset(partition_key(key, simulation_id, run_id), mapping=payload)
+            if expire:
+                pipe.expire(partition_key(key, simulation_id, run_id), expire)
+            queued += len(payload)
+            nbytes += sum(len(block) for block in payload.values())
+    return queued, nbytes
+
+
+@timed(CACHE_SECONDS, "cache_state_snapshot")
+def cache_state_snapshot(state, block_size=STATE_BLOCK_SIZE, run_id=None, expire=None):
+    """Write every simulation partition of the state in one transaction (checkpoint).
+
+    With `expire`, every key written expires after that many seconds.
+    """
+    try:
+        partitions_key = run_key(STATE_PARTITIONS_KEY, run_id)
+        previous = [int(simulation_id) for simulation_id in redis_client.smembers(partitions_key)]
+        pipe = redis_client.pipeline(transaction=True)
+        for simulation_id in previous:
+            pipe.delete(*_partition_keys(simulation_id, run_id))
+        pipe.delete(partitions_key)
+
+        nbytes = 0
+        for simulation_id in state.partition_ids().tolist():
+            rows = state.simulation_slice(simulation_id)
+            institutional = state.institutional_slice(simulation_id)
+            index = {
+                "simulation_id": simulation_id,
+                "dtype": state.dtype.str,
+                "shapes": {
+                    "internal_factors": state.internal_factors[rows].shape,
+                    "external_factors": state.external_factors[rows].shape,
+                    "institutional_factors": state.institutional_factors[institutional].shape,
+                },
+                "block_size": block_size,
+            }
+            serialized_index = state_format.encode_arrays({"student_ids": state.student_ids[rows]}, meta=index)
+            pipe.set(partition_key(STATE_INDEX_KEY, simulation_id, run_id), serialized_index, ex=expire)
+            nbytes += len(serialized_index) + _queue_partition_blocks(
+                pipe, state, simulation_id, block_size, dirty_only=False, run_id=run_id, expire=expire)[1]
+            pipe.sadd(partitions_key, simulation_id)
+        if expire:
+            pipe.expire(partitions_key, expire)
+        pipe.execute()
+        record_cache_bytes("cache_state_snapshot", nbytes)
+        state.clear_dirty()
+        logger.info("Simulation state snapshot cached: %d students.", len(state))
+        return nbytes
+    except Exception as e:
+        logger.error("Error caching simulation state snapshot: %s", e)
+        raise RuntimeError(f"Error caching simulation state snapshot: {str(e)}")
+
+
+@timed(CACHE_SECONDS, "persist_dirty_state")
+def persist_dirty_state(state, block_size=STATE_BLOCK_SIZE, run_id=None, expire=None):
+    """Write only the row blocks changed since the last persist, in one pipelined batch.
+
+    With `expire`, the hashes written expire after that many seconds, so
+    blocks written after their run was deleted do not outlive it.
+    """
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        written = nbytes = 0
+        for simulation_id in state.partition_ids().tolist():
+            blocks, payload_bytes = _queue_partition_blocks(
+                pipe, state, simulation_id, block_size, dirty_only=True, run_id=run_id, expire=expire)
+            written += blocks
+            nbytes += payload_bytes
+        if written:
+            pipe.execute()
+        record_cache_bytes("persist_dirty_state", nbytes)
+        state.clear_dirty()
+        logger.debug("Persisted %d dirty state blocks.", written)
+        return written
+    except Exception as e:
+        logger.error("Error persisting dirty state blocks: %s", e)
+        raise RuntimeError(f"Error persisting dirty state blocks: {str(e)}")
+
+
+def _load_partition_index(payload):
+    """Partition index as a dict"""
+    if not state_format.is_binary(payload):
+        raise ValueError("Partition index is not in the binary state format; reload memory to rebuild the cache")
+    arrays, index = state_format.decode_arrays(payload)
+    index["student_ids"] = arrays["student_ids"]
+    return index
+
+
+def _has_every_block(blocks, rows, block_size):
+    """Whether the block fields of a family hash cover all of its rows"""
+    return sorted(int(field) for field in blocks) == list(range(-(-rows // block_size)))
+
+
+def _read_partitions(simulation_ids, operation, run_id=None):
+    """Fetch the index and every factor family of each partition in one round trip.
+
+    A partition with a missing (expired, evicted or half written) row block
+    is left out like one that is not cached at all.
+    """
+    from app.services.model_representation import SimulationState
+
+    pipe = redis_client.pipeline(transaction=False)
+    for simulation_id in simulation_ids:
+        pipe.get(partition_key(STATE_INDEX_KEY, simulation_id, run_id))
+        for key in STATE_FAMILY_KEYS.values():
+            pipe.hgetall(partition_key(key, simulation_id, run_id))
+    replies = pipe.execute()
+
+    nbytes = 0
+    states = []
+    width = 1 + len(STATE_FAMILY_KEYS)
+    for offset in range(0, len(replies), width):
+        serialized_index, *family_blocks = replies[offset:offset + width]
+        if not serialized_index:
+            continue
+        nbytes += len(serialized_index) + sum(len(payload) for blocks in family_blocks for payload in blocks.values())
+        index = _load_partition_index(serialized_index)
+        block_size = index["block_size"]
+        if not all(_has_every_block(blocks, index["shapes"][family][0], block_size)
+                   for family, blocks in zip(STATE_FAMILY_KEYS, family_blocks)):
+            logger.warning("Cached partition %s of run %s is missing row blocks; treating it as not cached.",
+                           index["simulation_id"], run_id)
+            continue
+        arrays = {}
+        for family, blocks in zip(STATE_FAMILY_KEYS, family_blocks):
+            values = np.empty(index["shapes"][family], dtype=index["dtype"])
+            for field, payload in blocks.items():
+                block = int(field)
+                values[block * block_size:(block + 1) * block_size] = state_format.loads(payload)
+            arrays[family] = values
+
+        student_ids = index["student_ids"]
+        states.append(SimulationState(
+            student_ids=student_ids,
+            simulation_ids=np.full(len(student_ids), index["simulation_id"], dtype=np.int64),
+            institutional_simulation_ids=np.full(
+                len(arrays["institutional_factors"]), index["simulation_id"], dtype=np.int64
+            ),
+            **arrays
+        ))
+    record_cache_bytes(operation, nbytes)
+    return states
+
+
+@timed(CACHE_SECONDS, "get_cached_partition")
+def get_cached_partition(simulation_id, run_id=None):
+    """Return the cached state of one simulation, or None when it is not cached"""
+    try:
+        states = _read_partitions([simulation_id], "get_cached_partition", run_id)
+        if not states:
+            logger.warning("No cached state partition found for simulation %s.", simulation_id)
+            return None
+        return states[0]
+    except Exception as e:
+        logger.error("Error retrieving cached state partition %s: %s", simulation_id, e)
+        raise RuntimeError(f"Error retrieving cached state partition: {str(e)}")
+
+
+@timed(CACHE_SECONDS, "get_cached_state")
+def get_cached_state(run_id=None):
+    """Reassemble the state of every cached simulation.
+
+    None when no snapshot exists or one of its partitions is incomplete.
+    """
+    from app.services.model_representation import SimulationState
+    try:
+        simulation_ids = sorted(
+            int(simulation_id) for simulation_id in redis_client.smembers(run_key(STATE_PARTITIONS_KEY, run_id)))
+        if not simulation_ids:
+            logger.warning("No cached simulation state found.")
+            return None
+        states = _read_partitions(simulation_ids, "get_cached_state", run_id)
+        if len(states) < len(simulation_ids):
+            logger.warning("Cached simulation state is incomplete; treating it as not cached.")
+            return None
+        return SimulationState.concatenate(states)
+    except Exception as e:
+        logger.error("Error retrieving cached simulation state: %s", e)
+        raise RuntimeError(f"Error retrieving cached simulation state: {str(e)}")
+
+
+# step counter and random stream entropy of a namespace; successive requests continue one run
+STEP_KEY = 'simulation_step'
+SEED_KEY = 'simulation_seed'
+
+
+def _clock_keys(run_id=None):
+    return [run_key(STEP_KEY, run_id), run_key(SEED_KEY, run_id)]
+
+
+def reset_stream_clock(seed=None, step=0, run_id=None, expire=None):
+    """Restart a namespace at `step` with the random streams of `seed` (a fresh one when None).
+
+    Returns the stream entropy.
+    """
+    from app.services.rng import RandomStreams
+    try:
+        entropy = RandomStreams(seed).entropy
+        pipe = redis_client.pipeline()
+        pipe.set(run_key(SEED_KEY, run_id), entropy, ex=expire)
+        pipe.set(run_key(STEP_KEY, run_id), int(step), ex=expire)
+        pipe.execute()
+        return entropy
+    except Exception as e:
+        logger.error("Error resetting the step counter of run %s: %s", run_id, e)
+        raise RuntimeError(f"Error resetting the step counter: {str(e)}")
+
+
+def stream_seed(default=None, run_id=None):
+    """Entropy of a namespace's random streams; fixed from `default` (fresh when None) on first use"""
+    from app.services.rng import RandomStreams
+    try:
+        key = run_key(SEED_KEY, run_id)
+        entropy = redis_client.get(key)
+        if entropy is None:
+            redis_client.set(key, RandomStreams(default).entropy, nx=True)
+            entropy = redis_client.get(key)
+        return int(entropy)
+    except Exception as e:
+        logger.error("Error reading the stream seed of run %s: %s", run_id, e)
+        raise RuntimeError(f"Error reading the stream seed: {str(e)}")
+
+
+def reserve_steps(count, run_id=None):
+    """Number of the first of `count` consecutive new steps of a namespace.
+
+    The counter is advanced atomically, so concurrent requests on one
+    namespace never draw the streams of the same step.
+    """
+    try:
+        return int(redis_client.incrby(run_key(STEP_KEY, run_id), count)) - count + 1
+    except Exception as e:
+        logger.error("Error reserving steps of run %s: %s", run_id, e)
+        raise RuntimeError(f"Error reserving steps: {str(e)}")
+
+
+def current_step(run_id=None):
+    """Last step reserved in a namespace, 0 before the first"""
+    return int(redis_client.get(run_key(STEP_KEY, run_id)) or 0)
+
+
+def expire_run_data(run_id, seconds):
+    """(Re)set the expiry of every key of a run's namespace"""
+    try:
+        partitions_key = run_key(STATE_PARTITIONS_KEY, run_id)
+        keys = [run_key(SIMULATION_DATA_KEY, run_id), run_key(LOOKUP_KEY, run_id), partitions_key]
+        keys.extend(_clock_keys(run_id))
+        for simulation_id in redis_client.smembers(partitions_key):
+            keys.extend(_partition_keys(int(simulation_id), run_id))
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.expire(key, seconds)
+        pipe.execute()
+    except Exception as e:
+        logger.error("Error refreshing the expiry of run %s: %s", run_id, e)
+        raise RuntimeError(f"Error refreshing cached run data: {str(e)}")
+
+
+def delete_run_data(run_id):
+    """Delete every key of a run's namespace; returns the number of keys removed"""
+    try:
+        partitions_key = run_key(STATE_PARTITIONS_KEY, run_id)
+        keys = [run_key(SIMULATION_DATA_KEY, run_id), run_key(LOOKUP_KEY, run_id), partitions_key]
+        keys.extend(_clock_keys(run_id))
+        for simulation_id in redis_client.smembers(partitions_key):
+            keys.extend(_partition_keys(int(simulation_id), run_id))
+        deleted = redis_client.delete(*keys)
+        logger.info("Deleted %d cached keys of run %s.", deleted, run_id)
+        return deleted
+    except Exception as e:
+        logger.error("Error deleting cached data of run %s: %s", run_id, e)
+        raise RuntimeError(f"Error deleting cached run data: {str(e)}")
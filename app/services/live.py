@@ -0,0 +1,130 @@
+"""Live Socket.IO stream of step results.
+
+Every simulation of a run has a room. The run loop only overwrites the latest frame of
+each simulation; an emitter green thread sends those frames at a fixed frame
+rate, so intermediate steps are coalesced away. Frames go to each client of a
+room separately with an acknowledgement callback: a client holding
+``max_in_flight`` unacknowledged frames is skipped until it catches up, so a
+slow browser only ever misses frames and never builds a queue on the server.
+"""
+
+from collections import defaultdict
+from functools import partial
+
+import eventlet
+
+from app.services.tracing import TRACER
+from log.logger import logger
+
+NAMESPACE = '/'
+
+
+def room_name(simulation_id, run_id=None):
+    if run_id is None:
+        return f"simulation:{simulation_id}"
+    return f"run:{run_id}:simulation:{simulation_id}"
+
+
+class LiveBroadcaster:
+    """Coalesces step records per simulation of one run and fans them out to room members"""
+
+    def __init__(self, socketio, namespace=NAMESPACE, run_id=None):
+        self.socketio = socketio
+        self.namespace = namespace
+        self.run_id = run_id
+        # simulation id -> (sequence number, frame); the only per-run buffer
+        self.frames = {}
+        self.sequence = 0
+        # step of the latest published record, so traced flushes follow the step sampling
+        self.step = None
+        self.in_flight = defaultdict(int)
+        self.last_sent = {}
+        self.dropped = 0
+        self.running = False
+        self.stop_requested = False
+
+    def publish(self, record):
+        """Replace the pending frame of every simulation in a run_simulation_steps record"""
+        self.step = record["step"]
+        for summary in record["simulations"]:
+            self.sequence += 1
+            self.frames[summary["simulation_id"]] = (self.sequence, dict(summary, step=record["step"]))
+
+    def participants(self, simulation_id):
+        return [sid for sid, _ in self.socketio.server.manager.get_participants(
+            self.namespace, room_name(simulation_id, self.run_id))]
+
+    def flush(self, max_in_flight):
+        """Send every frame a client has not seen yet, unless its window is full"""
+        with TRACER.span("flush", "live", step=self.step, frames=len(self.frames)):
+            for simulation_id, (sequence, frame) in list(self.frames.items()):
+                for sid in self.participants(simulation_id):
+                    if self.last_sent.get((sid, simulation_id)) == sequence:
+                        continue
+                    if self.in_flight[sid] >= max_in_flight:
+                        self.dropped += 1
+                        continue
+                    self.in_flight[sid] += 1
+                    self.last_sent[(sid, simulation_id)] = sequence
+                    self.socketio.emit('sim_update', frame, to=sid, namespace=self.namespace,
+                                       callback=partial(self.acknowledge, sid))
+
+    def acknowledge(self, sid, *args):
+        if self.in_flight.get(sid):
+            self.in_flight[sid] -= 1
+
+    def forget(self, sid):
+        """Drop the bookkeeping of a disconnected client"""
+        self.in_flight.pop(sid, None)
+        for key in [key for key in self.last_sent if key[0] == sid]:
+            del self.last_sent[key]
+
+    def stop(self):
+        self.stop_requested = True
+
+    def _emit_frames(self, fps, max_in_flight):
+        while self.running:
+            eventlet.sleep(1.0 / fps)
+            self.flush(max_in_flight)
+
+    def start(self, app, num_steps, fps, max_in_flight):
+        """Start a streamed run in the background; False when one is already running"""
+        if num_steps < 1 or not fps > 0 or max_in_flight < 1:
+            raise ValueError("num_steps, fps and max_in_flight must be positive")
+        if self.running:
+            return False
+        self.running, self.stop_requested, self.dropped = True, False, 0
+        self.step = None
+        self.frames.clear()
+        self.socketio.start_background_task(self.run, app, num_steps, fps, max_in_flight)
+        return True
+
+    def run(self, app, num_steps, fps, max_in_flight):
+        """Run num_steps steps and stream them; started by `start`"""
+        from app.services import run_simulation_steps
+
+        emitter = eventlet.spawn(self._emit_frames, fps, max_in_flight)
+        steps = 0
+        try:
+            with app.app_context(), TRACER.span("live_run", "live", steps=num_steps):
+                records = run_simulation_steps(num_steps, run_id=self.run_id)
+                try:
+                    for record in records:
+                        self.publish(record)
+                        steps = record["step"]
+                        if self.stop_requested:
+                            break
+                finally:
+                    records.close()
+        except Exception as e:
+            logger.exception("Error streaming simulation steps.")
+            self.socketio.emit('sim_error', {'message': str(e)}, namespace=self.namespace)
+        finally:
+            self.running = False
+            emitter.wait()
+            # the last frame goes to everyone regardless of their window
+            self.flush(max_in_flight=float('inf'))
+            for simulation_id in list(self.frames):
+                self.socketio.emit('sim_complete', {'sim_id': simulation_id, 'steps': steps},
+                                   to=room_name(simulation_id, self.run_id), namespace=self.namespace)
+            logger.info("Live run finished after %d steps; %d frames dropped for slow clients.", steps, self.dropped)
@@ -1,10 +1,13 @@
 """Queries and loads data from the database"""
 
-from sqlalchemy.orm import joinedload
-from collections import defaultdict
+from sqlalchemy import func, select
+from itertools import chain
+import numpy as np
+from app.services.metrics import STAGE_SECONDS, timed
 from log.logger import logger  # Make sure logger is properly set up and imported
 
 
+@timed(STAGE_SECONDS, "load_initial_data")
 def load_initial_data():
     try:
         from app.models import InstitutionalFactors, Student, Simulation, InternalFactors, ExternalFactors
@@ -15,7 +18,7 @@ def load_initial_data():
         loaded_data = []
 
         for simulation in simulations:
-            logger.info(f"Loading data for simulation ID: {simulation.id}")
+            logger.info("Loading data for simulation ID: %s", simulation.id)
 
             loaded_internal_factors = (
                 db.session.query(InternalFactors)
@@ -24,7 +27,7 @@ def load_initial_data():
                 .filter(Simulation.id == simulation.id)
                 .all()
             )
-            logger.debug(f"Loaded {len(loaded_internal_factors)} internal factors for simulation {simulation.id}")
+            logger.debug("Loaded %d internal factors for simulation %s", len(loaded_internal_factors), simulation.id)
 
             loaded_external_factors = (
                 db.session.query(ExternalFactors)
@@ -33,7 +36,7 @@ def load_initial_data():
                 .filter(Simulation.id == simulation.id)
                 .all()
             )
-            logger.debug(f"Loaded {len(loaded_external_factors)} external factors for simulation {simulation.id}")
+            logger.debug("Loaded %d external factors for simulation %s", len(loaded_external_factors), simulation.id)
 
             loaded_institutional_factors = (
                 db.session.query(InstitutionalFactors)
@@ -41,7 +44,8 @@ def load_initial_data():
                 .filter(Simulation.id == simulation.id)
                 .all()
             )
-            logger.debug(f"Loaded {len(loaded_institutional_factors)} institutional factors for simulation {simulation.id}")
+            logger.debug("Loaded %d institutional factors for simulation %s",
+                         len(loaded_institutional_factors), simulation.id)
 
             
             dict_list = {
@@ -52,10 +56,100 @@ def load_initial_data():
             }
             loaded_data.append(dict_list)
             
-        logger.info(f"Finished loading data for {len(simulations)} simulations.")
+        logger.info("Finished loading data for %d simulations.", len(simulations))
 
         return loaded_data
 
     except Exception as e:
         logger.exception("Error loading data from the database.")
         raise RuntimeError(f"Error loading data from the database: {str(e)}")
+
+
+def _stream(connection, statement, chunk_size):
+    """Yield each chunk of rows of a Core select as a 2-D float64 array"""
+    result = connection.execution_options(yield_per=chunk_size).execute(statement)
+    width = len(result.keys())
+    for partition in result.partitions():
+        # None (NULL) values come through as NaN
+        values = np.fromiter(chain.from_iterable(partition), dtype=np.float64, count=len(partition) * width)
+        yield values.reshape(len(partition), width)
+
+
+@timed(STAGE_SECONDS, "load_initial_state")
+def load_initial_state(dtype=np.float64, chunk_size=50_000):
+    """Stream each table once with Core selects straight into a SimulationState.
+
+    Rows bypass the ORM identity map; only one chunk of raw rows is held at a
+    time besides the preallocated state arrays. Like create_memory_state, a
+    student missing one factor family keeps NaN in it, and students with no
+    factor rows at all are left out.
+    """
+    try:
+        from app.models import InstitutionalFactors, Student, InternalFactors, ExternalFactors
+        from app.services.model_representation import (
+            SimulationState, INTERNAL_FACTOR_COLUMNS, EXTERNAL_FACTOR_COLUMNS, INSTITUTIONAL_FACTOR_COLUMNS
+        )
+        from app.utils.build_flat_lookup import RowIndex
+        from app import db
+
+        students = Student.__table__
+        internal = InternalFactors.__table__
+        external = ExternalFactors.__table__
+        institutional = InstitutionalFactors.__table__
+
+        with db.engine.connect() as connection:
+            num_students = connection.execute(select(func.count()).select_from(students)).scalar_one()
+            logger.info("Streaming %d students from the database...", num_students)
+
+            student_ids = np.empty(num_students, dtype=np.int64)
+            simulation_ids = np.empty(num_students, dtype=np.int64)
+            offset = 0
+            for chunk in _stream(connection, select(students.c.id, students.c.simulation_id)
+                                 .order_by(students.c.simulation_id, students.c.id), chunk_size):
+                student_ids[offset:offset + len(chunk)] = chunk[:, 0]
+                simulation_ids[offset:offset + len(chunk)] = chunk[:, 1]
+                offset += len(chunk)
+            index = RowIndex.build(simulation_ids, student_ids)
+            has_factors = np.zeros(num_students, dtype=bool)
+
+            def fill(table, columns):
+                values = np.full((num_students, len(columns)), np.nan, dtype=dtype)
+                statement = select(table.c.student_id, *(table.c[column] for column in columns))
+                for chunk in _stream(connection, statement, chunk_size):
+                    rows = index.student_rows(chunk[:, 0].astype(np.int64))
+                    known = rows >= 0
+                    values[rows[known]] = chunk[known, 1:]
+                    has_factors[rows[known]] = True
+                return values
+
+            internal_factors = fill(internal, INTERNAL_FACTOR_COLUMNS)
+            external_factors = fill(external, EXTERNAL_FACTOR_COLUMNS)
+
+            institutional_rows = np.concatenate(list(_stream(
+                connection,
+                select(institutional.c.simulation_id, *(institutional.c[c] for c in INSTITUTIONAL_FACTOR_COLUMNS))
+                .where(institutional.c.simulation_id.is_not(None))
+                .order_by(institutional.c.simulation_id, institutional.c.id),
+                chunk_size
+            )) or [np.empty((0, 1 + len(INSTITUTIONAL_FACTOR_COLUMNS)))])
+            # one institutional row per simulation
+            institutional_ids, first = np.unique(institutional_rows[:, 0].astype(np.int64), return_index=True)
+
+        if not has_factors.all():
+            logger.info("Leaving out %d students without factors.", num_students - int(has_factors.sum()))
+            student_ids, simulation_ids = student_ids[has_factors], simulation_ids[has_factors]
+            internal_factors, external_factors = internal_factors[has_factors], external_factors[has_factors]
+
+        logger.info("Finished streaming data for %d simulations.", len(institutional_ids))
+        return SimulationState(
+            student_ids=student_ids,
+            simulation_ids=simulation_ids,
+            internal_factors=internal_factors,
+            external_factors=external_factors,
+            institutional_simulation_ids=institutional_ids,
+            institutional_factors=institutional_rows[first, 1:].astype(dtype),
+        )
+
+    except Exception as e:
+        logger.exception("Error streaming data from the database.")
+        raise RuntimeError(f"Error streaming data from the database: {str(e)}")
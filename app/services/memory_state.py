@@ -1,10 +1,13 @@
 """Memory state of the in-memory models"""
 
+import numpy as np
+
 from app.services.loader import load_initial_data
-from app.services.model_representation import SimulationState
-from app.services.model_representation import MemInstitutionalFactor, MemInternalFactor, MemExternalFactor
-from typing import Dict
-from collections import defaultdict
+from app.services.metrics import STAGE_SECONDS, timed
+from app.services.model_representation import (
+    SimulationState, SUPPORTED_DTYPES, INTERNAL_FACTOR_COLUMNS,
+    EXTERNAL_FACTOR_COLUMNS, INSTITUTIONAL_FACTOR_COLUMNS
+)
 from log.logger import logger  # Assuming logger is already configured
 
 
@@ -13,72 +16,51 @@ def hold_current_state(state):
     return state
 
 
-def create_memory_state(mem_dict):
-    """Process db_objects and return a SimulationState instance."""
-    from app.models import InstitutionalFactors, InternalFactors, ExternalFactors, Simulation
+def _factor_rows(factors, columns, dtype):
+    """Copy the factor columns of ORM rows into a contiguous 2-D array"""
+    values = np.empty((len(factors), len(columns)), dtype=dtype)
+    for i, f in enumerate(factors):
+        values[i] = [getattr(f, column) for column in columns]
+    return values
+
 
+def create_memory_state(mem_dict, dtype=np.float64):
+    """Process db_objects of one simulation and return a SimulationState instance."""
     try:
         logger.debug("Creating memory state from simulation data...")
-        mem_institutional_factors = defaultdict(list)
-        mem_external_factors = defaultdict(list)
-        mem_internal_factors = defaultdict(list)
-
-        for f in mem_dict.get("institutional_factors", []):
-            student_ids = tuple(student.id for student in f.simulation.students)
-            mem_institutional_factors[(f.simulation.id, student_ids)].append(
-                MemInstitutionalFactor(
-                    id=f.id,
-                    class_size=f.class_size,
-                    facility_availability=f.facility_availability,
-                    peer_support=f.peer_support,
-                    academic_guidance=f.academic_guidance,
-                    financial_aid=f.financial_aid,
-                    extracurricular_opportunities=f.extracurricular_opportunities,
-                    cultural_norms=f.cultural_norms,
-                    peer_influence=f.peer_influence
-                )
-            )
-
-        for f in mem_dict.get("internal_factors", []):
-            student_ids = tuple(student.id for student in f.simulation.students)
-            mem_internal_factors[(f.simulation.id, student_ids)].append(
-                MemInternalFactor(
-                    id=f.id,
-                    goal_setting=f.goal_setting,
-                    personal_ambition=f.personal_ambition,
-                    interest_subject=f.interest_subject,
-                    scheduling=f.scheduling,
-                    prioritization=f.prioritization,
-                    consistency=f.consistency,
-                    study_techniques=f.study_techniques,
-                    focus_study=f.focus_study,
-                    self_assessment=f.self_assessment
-                )
-            )
-
-        for f in mem_dict.get("external_factors", []):
-            student_ids = tuple(student.id for student in f.simulation.students)
-            mem_external_factors[(f.simulation.id, student_ids)].append(
-                MemExternalFactor(
-                    id=f.id,
-                    financial_stability=f.financial_stability,
-                    family_expectations=f.family_expectations,
-                    access_to_resources=f.access_to_resources,
-                    family_support=f.family_support,
-                    textbooks_availability=f.textbooks_availability,
-                    internet_access=f.internet_access,
-                    lab_materials=f.lab_materials,
-                    curriculum_relevance=f.curriculum_relevance,
-                    teaching_quality=f.teaching_quality,
-                    feedback_assessment=f.feedback_assessment
-                )
-            )
-
-        logger.info("Memory state created successfully for wsimulation.")
+        if np.dtype(dtype).type not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported state dtype: {dtype}")
+
+        simulation_id = mem_dict["simulation_id"]
+        internal = mem_dict.get("internal_factors", [])
+        external = mem_dict.get("external_factors", [])
+        institutional = mem_dict.get("institutional_factors", [])
+
+        # students missing one of the factor families keep NaN in that family
+        student_ids = np.unique(np.array(
+            [f.student_id for f in internal] + [f.student_id for f in external], dtype=np.int64
+        ))
+        internal_factors = np.full((len(student_ids), len(INTERNAL_FACTOR_COLUMNS)), np.nan, dtype=dtype)
+        external_factors = np.full((len(student_ids), len(EXTERNAL_FACTOR_COLUMNS)), np.nan, dtype=dtype)
+
+        if internal:
+            rows = np.searchsorted(student_ids, [f.student_id for f in internal])
+            internal_factors[rows] = _factor_rows(internal, INTERNAL_FACTOR_COLUMNS, dtype)
+        if external:
+            rows = np.searchsorted(student_ids, [f.student_id for f in external])
+            external_factors[rows] = _factor_rows(external, EXTERNAL_FACTOR_COLUMNS, dtype)
+
+        # one institutional row per simulation
+        institutional = institutional[:1]
+
+        logger.info("Memory state created successfully for simulation %s.", simulation_id)
         return SimulationState(
-            mem_internal_factors=mem_internal_factors,
-            mem_external_factors=mem_external_factors,
-            mem_institutional_factors=mem_institutional_factors
+            student_ids=student_ids,
+            simulation_ids=np.full(len(student_ids), simulation_id, dtype=np.int64),
+            internal_factors=internal_factors,
+            external_factors=external_factors,
+            institutional_simulation_ids=np.full(len(institutional), simulation_id, dtype=np.int64),
+            institutional_factors=_factor_rows(institutional, INSTITUTIONAL_FACTOR_COLUMNS, dtype),
         )
 
     except Exception as e:
@@ -88,33 +70,21 @@ def create_memory_state(mem_dict):
 
 def merge_state(base: SimulationState, new: SimulationState):
     logger.debug("Merging new memory state into the base state...")
-    for k, v in new.mem_internal_factors.items():
-        base.mem_internal_factors[k].extend(v)
-
-    for k, v in new.mem_external_factors.items():
-        base.mem_external_factors[k].extend(v)
-
-    for k, v in new.mem_institutional_factors.items():
-        base.mem_institutional_factors[k].extend(v)
-
+    merged = SimulationState.concatenate([base, new])
     logger.info("Memory state merge completed.")
-    return base
+    return merged
 
 
-def state_wrapper(mem_list):
+@timed(STAGE_SECONDS, "state_wrapper")
+def state_wrapper(mem_list, dtype=np.float64):
     try:
+        dtype = np.dtype(dtype).type
         logger.info("Wrapping simulation data into memory state...")
-        accumated_state = SimulationState(
-            mem_internal_factors=defaultdict(list),
-            mem_external_factors=defaultdict(list),
-            mem_institutional_factors=defaultdict(list)
-        )
-
-        for mem_dict in mem_list:
-            mermory_state = create_memory_state(mem_dict)
-            accumated_state = merge_state(accumated_state, mermory_state)
+        states = [create_memory_state(mem_dict, dtype=dtype) for mem_dict in mem_list]
+        accumated_state = SimulationState.concatenate(states, dtype=dtype)
 
-        logger.info("All memory states wrapped successfully.")
+        logger.info("All memory states wrapped successfully: %d students, %d bytes.",
+                    len(accumated_state), accumated_state.nbytes)
         return accumated_state
 
     except Exception as e:
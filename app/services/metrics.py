@@ -0,0 +1,219 @@
+"""In-process timing histograms and counters of the simulation hot paths.
+
+Measurements are kept in plain Python lists per label set and rendered in the
+Prometheus text exposition format by the /metrics route. An observation is a
+bisect over the bucket bounds and a few additions under a lock, so timing a
+whole stage or engine phase costs microseconds against the milliseconds the
+phase itself takes.
+
+The lock is a native one: observations come from green threads as well as
+from the native threads offload() runs steps in. Metrics live in the process
+that records them; the shard workers of the "process" execution mode keep
+their own, so there only the parent's "sharded_step" phase is exported.
+"""
+
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from eventlet import patcher
+
+_threading = patcher.original('threading')
+
+# seconds, from a lookup in a warm cache up to a full ORM load
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# bytes, from one partition index up to a full pickled state
+SIZE_BUCKETS = tuple(float(4 ** power) for power in range(5, 16))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class _HistogramChild:
+    def __init__(self, registry, bounds):
+        self.registry = registry
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        if not self.registry.enabled:
+            return
+        slot = bisect_left(self.bounds, value)
+        with self.registry.lock:
+            self.buckets[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager observing the seconds its block took"""
+        return _Timer(self)
+
+
+class _CounterChild:
+    def __init__(self, registry):
+        self.registry = registry
+        self.value = 0
+
+    def inc(self, amount=1):
+        if not self.registry.enabled:
+            return
+        with self.registry.lock:
+            self.value += amount
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **labels):
+        """The series of one label set, created on first use"""
+        key = tuple(str(value) for value in (values or [labels[name] for name in self.labelnames]))
+        child = self.children.get(key)
+        if child is None:
+            with self.registry.lock:
+                child = self.children.setdefault(key, self._child())
+        return child
+
+    def samples(self, key, child):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, child in sorted(self.children.items()):
+            lines.extend(self.samples(key, child))
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramChild(self.registry, self.bounds)
+
+    def time(self, *values, **labels):
+        return self.labels(*values, **labels).time()
+
+    def samples(self, key, child):
+        with self.registry.lock:
+            buckets, total, count = list(child.buckets), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, observed in zip(self.bounds + (float('inf'),), buckets):
+            cumulative += observed
+            labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _child(self):
+        return _CounterChild(self.registry)
+
+    def samples(self, key, child):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}']
+
+
+class Registry:
+    """The metrics of this process; disabled registries drop observations"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = _threading.Lock()
+        self.metrics = []
+
+    def histogram(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        metric = Histogram(self, name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(self, name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'simulation_stage_seconds', 'Wall time of the loading and stepping stages.', ('stage',))
+CACHE_SECONDS = REGISTRY.histogram(
+    'simulation_cache_seconds', 'Wall time of the Redis cache reads and writes.', ('operation',))
+CACHE_PAYLOAD_BYTES = REGISTRY.histogram(
+    'simulation_cache_payload_bytes', 'Serialized bytes moved by one cache read or write.', ('operation',),
+    buckets=SIZE_BUCKETS)
+CACHE_BYTES = REGISTRY.counter(
+    'simulation_cache_bytes_total', 'Serialized bytes moved by the cache.', ('operation',))
+ENGINE_PHASE_SECONDS = REGISTRY.histogram(
+    'simulation_engine_phase_seconds', 'Wall time of the phases of a vectorized step.', ('phase',))
+ROWS_STEPPED = REGISTRY.counter(
+    'simulation_rows_stepped_total', 'Student rows advanced by vectorized steps.')
+
+
+def timed(histogram, *values):
+    """Decorator observing the wall time of every call into histogram[values]"""
+    def decorator(fn):
+        child = histogram.labels(*values)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with child.time():
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache_bytes(operation, nbytes):
+    """Count the serialized payload of one cache operation"""
+    CACHE_PAYLOAD_BYTES.labels(operation).observe(nbytes)
+    CACHE_BYTES.labels(operation).inc(nbytes)
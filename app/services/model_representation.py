@@ -1,9 +1,8 @@
 """model represention for in-memory simulation"""
 
-from typing import Dict , List, Tuple
+from dataclasses import dataclass, field, fields
 
-from dataclasses import dataclass
-from collections import defaultdict
+import numpy as np
 
 @dataclass
 class MemInternalFactor:
@@ -43,11 +42,180 @@ class MemInstitutionalFactor:
     financial_aid : float
     extracurricular_opportunities : float
     cultural_norms : float
-    peer_influence : float         
+    peer_influence : float
 
-@dataclass 
+
+def factor_columns(record_type):
+    """Return the factor column names of a Mem* record, in declaration order"""
+    return tuple(f.name for f in fields(record_type) if f.name != 'id')
+
+
+INTERNAL_FACTOR_COLUMNS = factor_columns(MemInternalFactor)
+EXTERNAL_FACTOR_COLUMNS = factor_columns(MemExternalFactor)
+INSTITUTIONAL_FACTOR_COLUMNS = factor_columns(MemInstitutionalFactor)
+
+SUPPORTED_DTYPES = (np.float64, np.float32)
+
+
+@dataclass
 class SimulationState:
-    # simulation id of which these tables are associated to 
-    mem_internal_factors: Dict[Tuple[int, int], List[MemInternalFactor]]
-    mem_external_factors: Dict[Tuple[int,int], List[MemExternalFactor]]
-    mem_institutional_factors: Dict[Tuple[int,int], List[MemInstitutionalFactor]]
+    """Columnar memory state of every simulated student.
+
+    Each factor family is one contiguous (rows x factor columns) array. Student
+    rows are ordered by (simulation id, student id) so every simulation owns a
+    contiguous slice. Institutional factors are stored once per simulation and
+    mapped to students through ``institutional_rows``.
+    """
+    student_ids: np.ndarray
+    simulation_ids: np.ndarray
+    internal_factors: np.ndarray
+    external_factors: np.ndarray
+    institutional_simulation_ids: np.ndarray
+    institutional_factors: np.ndarray
+    institutional_rows: np.ndarray = field(init=False, repr=False)
+    # rows changed since the state was last persisted
+    dirty_rows: np.ndarray = field(init=False, repr=False)
+    dirty_institutional_rows: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.institutional_rows = self._map_institutional_rows()
+        self.clear_dirty()
+
+    @classmethod
+    def from_arrays(cls, institutional_rows=None, **arrays):
+        """State over existing arrays; a saved institutional_rows skips the remapping pass"""
+        if institutional_rows is None:
+            return cls(**arrays)
+        state = cls.__new__(cls)
+        for name, values in arrays.items():
+            setattr(state, name, values)
+        state.institutional_rows = institutional_rows
+        state.clear_dirty()
+        return state
+
+    def _map_institutional_rows(self):
+        """Row of institutional_factors for each student row, -1 when missing"""
+        if len(self.institutional_simulation_ids) == 0:
+            return np.full(len(self.student_ids), -1, dtype=np.int64)
+        rows = np.searchsorted(self.institutional_simulation_ids, self.simulation_ids)
+        rows = np.minimum(rows, len(self.institutional_simulation_ids) - 1)
+        found = self.institutional_simulation_ids[rows] == self.simulation_ids
+        return np.where(found, rows, -1).astype(np.int64)
+
+    @classmethod
+    def empty(cls, dtype=np.float64):
+        return cls(
+            student_ids=np.empty(0, dtype=np.int64),
+            simulation_ids=np.empty(0, dtype=np.int64),
+            internal_factors=np.empty((0, len(INTERNAL_FACTOR_COLUMNS)), dtype=dtype),
+            external_factors=np.empty((0, len(EXTERNAL_FACTOR_COLUMNS)), dtype=dtype),
+            institutional_simulation_ids=np.empty(0, dtype=np.int64),
+            institutional_factors=np.empty((0, len(INSTITUTIONAL_FACTOR_COLUMNS)), dtype=dtype),
+        )
+
+    @classmethod
+    def concatenate(cls, states, dtype=None):
+        """Merge several states into one, keeping rows ordered by simulation and student"""
+        states = list(states)
+        if dtype is None:
+            dtype = states[0].dtype if states else np.float64
+        if not states:
+            return cls.empty(dtype)
+
+        student_ids = np.concatenate([s.student_ids for s in states])
+        simulation_ids = np.concatenate([s.simulation_ids for s in states])
+        order = np.lexsort((student_ids, simulation_ids))
+
+        institutional_ids = np.concatenate([s.institutional_simulation_ids for s in states])
+        institutional_order = np.argsort(institutional_ids, kind='stable')
+
+        return cls(
+            student_ids=student_ids[order],
+            simulation_ids=simulation_ids[order],
+            internal_factors=np.concatenate([s.internal_factors for s in states]).astype(dtype, copy=False)[order],
+            external_factors=np.concatenate([s.external_factors for s in states]).astype(dtype, copy=False)[order],
+            institutional_simulation_ids=institutional_ids[institutional_order],
+            institutional_factors=np.concatenate(
+                [s.institutional_factors for s in states]
+            ).astype(dtype, copy=False)[institutional_order],
+        )
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    @property
+    def dtype(self):
+        return self.internal_factors.dtype
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for arr in (
+            self.student_ids, self.simulation_ids, self.internal_factors,
+            self.external_factors, self.institutional_simulation_ids,
+            self.institutional_factors, self.institutional_rows
+        ))
+
+    def astype(self, dtype):
+        """Return a copy of the state with factor arrays cast to dtype"""
+        return SimulationState(
+            student_ids=self.student_ids.copy(),
+            simulation_ids=self.simulation_ids.copy(),
+            internal_factors=self.internal_factors.astype(dtype),
+            external_factors=self.external_factors.astype(dtype),
+            institutional_simulation_ids=self.institutional_simulation_ids.copy(),
+            institutional_factors=self.institutional_factors.astype(dtype),
+        )
+
+    def mark_dirty(self, rows):
+        """Flag student rows (slice, mask or index array) as changed"""
+        self.dirty_rows[rows] = True
+
+    def mark_institutional_dirty(self, rows):
+        self.dirty_institutional_rows[rows] = True
+
+    def clear_dirty(self):
+        self.dirty_rows = np.zeros(len(self.student_ids), dtype=bool)
+        self.dirty_institutional_rows = np.zeros(len(self.institutional_simulation_ids), dtype=bool)
+
+    @staticmethod
+    def _blocks(flags, block_size):
+        return np.unique(np.flatnonzero(flags) // block_size)
+
+    def dirty_blocks(self, block_size):
+        """Indices of the block_size-row blocks holding changed student rows"""
+        return self._blocks(self.dirty_rows, block_size)
+
+    def dirty_institutional_blocks(self, block_size):
+        return self._blocks(self.dirty_institutional_rows, block_size)
+
+    def simulation_slice(self, simulation_id):
+        """Slice of student rows belonging to simulation_id"""
+        start = int(np.searchsorted(self.simulation_ids, simulation_id, side='left'))
+        stop = int(np.searchsorted(self.simulation_ids, simulation_id, side='right'))
+        return slice(start, stop)
+
+    def institutional_slice(self, simulation_id):
+        """Slice of institutional rows belonging to simulation_id"""
+        start = int(np.searchsorted(self.institutional_simulation_ids, simulation_id, side='left'))
+        stop = int(np.searchsorted(self.institutional_simulation_ids, simulation_id, side='right'))
+        return slice(start, stop)
+
+    def unique_simulation_ids(self):
+        return np.unique(self.simulation_ids)
+
+    def partition_ids(self):
+        """Every simulation id with student or institutional rows"""
+        return np.union1d(self.simulation_ids, self.institutional_simulation_ids)
+
+    def partition(self, simulation_id):
+        """State restricted to one simulation; factor arrays are views into this state"""
+        rows = self.simulation_slice(simulation_id)
+        institutional = self.institutional_slice(simulation_id)
+        return SimulationState(
+            student_ids=self.student_ids[rows],
+            simulation_ids=self.simulation_ids[rows],
+            internal_factors=self.internal_factors[rows],
+            external_factors=self.external_factors[rows],
+            institutional_simulation_ids=self.institutional_simulation_ids[institutional],
+            institutional_factors=self.institutional_factors[institutional],
+        )
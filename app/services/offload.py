@@ -0,0 +1,31 @@
+"""Run CPU-bound simulation work off the eventlet hub"""
+
+from eventlet import patcher, tpool
+
+from app.services.tracing import NO_SPAN, TRACER
+from log.logger import logger
+
+
+def hub_is_green():
+    """True when the standard library is patched, i.e. blocking calls would stall the hub"""
+    return patcher.is_monkey_patched('thread')
+
+
+def offload(fn, *args, **kwargs):
+    """Call fn in an eventlet native thread and wait for it cooperatively.
+
+    Only the calling green thread waits; the hub keeps serving heartbeats and
+    other requests, and numpy releases the GIL for the bulk of a step. fn must
+    not use green primitives (Redis, database sessions, socket emits).
+    Without monkey patching fn simply runs in the caller. While tracing, the
+    wait of the green thread and the call in the native thread are separate
+    spans.
+    """
+    if not hub_is_green():
+        return fn(*args, **kwargs)
+    name = getattr(fn, '__name__', repr(fn))
+    logger.debug("Offloading %s to a native thread.", name)
+    with TRACER.span(f"wait {name}", "offload") as span:
+        if span is not NO_SPAN:
+            fn = TRACER.traced(fn, name, "native", step=span.args.get("step"))
+        return tpool.execute(fn, *args, **kwargs)
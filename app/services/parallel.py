@@ -0,0 +1,208 @@
+"""Sharded execution of simulation steps on a process pool over shared memory.
+
+The state is copied once into a ``multiprocessing.shared_memory`` block in the
+binary state format, next to the per-row result arrays. Every step the parent
+walks the institutional factors (one row per simulation), then each worker
+steps a contiguous block of student rows in place. Tasks only carry the block
+name and row bounds, so nothing is pickled per step besides a few integers;
+waiting on every shard's future is the barrier before results are read.
+Draws come from the run's counter-based streams (see rng.py), so a sharded
+run matches an inline SimulationEngine with the same seed bit for bit,
+whatever the number of shards.
+"""
+
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from app.services import state_format
+from app.services.metrics import ENGINE_PHASE_SECONDS
+from app.services.model_representation import SimulationState
+from app.services.tracing import TRACER
+from app.services.simulation_engine import SimulationEngine, StepResult
+from log.logger import logger
+
+RESULT_ARRAYS = ('scores', 'internal_impact', 'external_impact', 'institutional_impact')
+# below this many rows per shard the dispatch overhead outweighs the work
+MIN_SHARD_ROWS = 16384
+
+_pool = None
+_pool_workers = None
+
+
+def get_process_pool(workers=None):
+    """Process pool shared by every sharded run; workers are spawned, not forked"""
+    global _pool, _pool_workers
+    workers = workers or os.cpu_count()
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+        _pool_workers = workers
+        # spawn every worker now: a lazy spawn mid-run would write to the resource tracker pipe
+        # concurrently with shared memory (un)registration, which green os.write refuses
+        wait([_pool.submit(os.getpid) for _ in range(workers)])
+        logger.info("Started simulation process pool with %d workers.", workers)
+    return _pool
+
+
+def shutdown_process_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+    _pool, _pool_workers = None, None
+
+
+def shard_bounds(num_rows, num_shards, min_rows=MIN_SHARD_ROWS):
+    """Split [0, num_rows) into at most num_shards contiguous (start, stop) blocks"""
+    num_shards = max(1, min(num_shards, num_rows // max(min_rows, 1)))
+    edges = np.linspace(0, num_rows, num_shards + 1).astype(np.int64)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:]) if stop > start]
+
+
+def _shared_arrays(state):
+    arrays = {name: getattr(state, name) for name in state_format.STATE_ARRAYS}
+    arrays["institutional_before"] = np.empty(len(state.institutional_factors), dtype=np.float64)
+    for name in RESULT_ARRAYS:
+        arrays[name] = np.empty(len(state), dtype=np.float64)
+    return arrays
+
+
+class _Attachment:
+    """Worker-side view of a shared block: the state plus the result arrays"""
+
+    def __init__(self, name):
+        self.name = name
+        self.shm = shared_memory.SharedMemory(name=name)
+        arrays, meta = state_format.decode_arrays(self.shm.buf)
+        self.state = SimulationState(**{key: arrays[key] for key in state_format.STATE_ARRAYS})
+        self.institutional_before = arrays["institutional_before"]
+        self.results = {key: arrays[key] for key in RESULT_ARRAYS}
+        self.entropy = meta["entropy"]
+        self.step_size = meta["step_size"]
+
+    def close(self):
+        # drop the numpy views before releasing the mapping
+        self.state = self.institutional_before = self.results = None
+        self.shm.close()
+
+
+_attachment = None
+_engine = None
+
+
+def _detach():
+    global _attachment
+    if _attachment is not None:
+        _attachment.close()
+        _attachment = None
+
+
+def _attach(name):
+    global _attachment, _engine
+    if _attachment is None or _attachment.name != name:
+        _detach()
+        _attachment = _Attachment(name)
+    if _engine is None:
+        atexit.register(_detach)
+    if _engine is None or _engine.streams.entropy != _attachment.entropy:
+        _engine = SimulationEngine(_attachment.entropy)
+    return _attachment
+
+
+def _run_shard(name, start, stop, step):
+    """Worker task: step rows [start, stop) in place and write their results"""
+    attachment = _attach(name)
+    rows = slice(start, stop)
+    result = _engine._step_rows(
+        attachment.state, rows, step, attachment.step_size,
+        institutional_before=attachment.institutional_before
+    )
+    for key in RESULT_ARRAYS:
+        attachment.results[key][rows] = getattr(result, key)
+    return stop - start
+
+
+class ShardedRunner:
+    """Steps a SimulationState on the process pool.
+
+    Use as a context manager; on exit the evolved factors are copied back
+    into the original state, its rows are marked dirty and the shared block
+    is released.
+    """
+
+    def __init__(self, state, workers=None, seed=None, step_size=None, min_shard_rows=MIN_SHARD_ROWS, first_step=1):
+        self.engine = SimulationEngine(seed)
+        self.original = state
+        workers = workers or os.cpu_count()
+        self.pool = get_process_pool(workers)
+        self.shards = shard_bounds(len(state), workers, min_shard_rows)
+        # as inline steps do, only the institutional rows of simulations with students move
+        self.simulation_ids = state.unique_simulation_ids()
+        self.step_size = self.engine.STEP_SIZE if step_size is None else step_size
+        # number of the last step run; the first call of step() runs first_step
+        self.first_step = first_step
+        self.steps = first_step - 1
+
+        meta = {"entropy": self.engine.streams.entropy, "step_size": self.step_size}
+        arrays = _shared_arrays(state)
+        self.shm = shared_memory.SharedMemory(create=True, size=state_format.encoded_size(arrays, meta))
+        state_format.encode_into(self.shm.buf, arrays, meta)
+
+        shared, _ = state_format.decode_arrays(self.shm.buf)
+        self.state = SimulationState(**{key: shared[key] for key in state_format.STATE_ARRAYS})
+        self.institutional_before = shared["institutional_before"]
+        self.results = {key: shared[key] for key in RESULT_ARRAYS}
+        logger.info("Sharded runner: %d students in %d shards over %d bytes of shared memory.",
+                    len(state), len(self.shards), self.shm.size)
+
+    def replay_info(self):
+        """Everything needed to redo the next step inline (see timeline.replay_step)"""
+        return {"entropy": self.engine.streams.entropy, "step": self.steps + 1,
+                "step_size": self.step_size, "simulation_ids": None}
+
+    def step(self):
+        """Advance every student by one step and return the StepResult"""
+        self.steps += 1
+        with ENGINE_PHASE_SECONDS.time("sharded_step"), \
+                TRACER.span("sharded_step", "engine", step=self.steps, shards=len(self.shards)):
+            self.institutional_before[:] = self.engine.walk_institutional(
+                self.state, self.steps, self.step_size, self.simulation_ids)
+            futures = [
+                self.pool.submit(_run_shard, self.shm.name, start, stop, self.steps)
+                for start, stop in self.shards
+            ]
+            wait(futures)
+            for future in futures:
+                future.result()
+        return StepResult(
+            student_ids=self.state.student_ids.copy(),
+            simulation_ids=self.state.simulation_ids.copy(),
+            **{key: self.results[key].copy() for key in RESULT_ARRAYS}
+        )
+
+    def sync_back(self):
+        """Copy the evolved factors into the original state and mark its rows dirty"""
+        if self.steps >= self.first_step:
+            for name in ('internal_factors', 'external_factors', 'institutional_factors'):
+                np.copyto(getattr(self.original, name), getattr(self.state, name))
+            self.original.mark_dirty(slice(None))
+            self.original.mark_institutional_dirty(slice(None))
+
+    def close(self):
+        if self.shm is None:
+            return
+        self.sync_back()
+        self.state = self.institutional_before = self.results = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,146 @@
+"""App-scoped registry of simulation metadata.
+
+Request handlers need the simulations (ids, university names, how many
+students) but not their students. The registry reads that once with a single
+aggregate query and keeps it on the app; the load pipeline refreshes it and
+reseeding the database invalidates it.
+
+Every worker process has its own registry, so each one also compares the
+database generation shared in Redis (see runs.database_generation) on access
+and reloads when another process has reseeded.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from log.logger import log_throttled, logger
+
+EXTENSION_KEY = 'simulation_registry'
+
+
+@dataclass(frozen=True)
+class SimulationMeta:
+    """Lightweight metadata of one simulation; student ids are the first and last, not a contiguous range"""
+    id: int
+    university_id: int
+    university: str
+    status: str
+    student_count: int
+    first_student_id: Optional[int]
+    last_student_id: Optional[int]
+
+    def to_dict(self):
+        return {
+            "simulation_id": self.id,
+            "university_id": self.university_id,
+            "university": self.university,
+            "status": self.status,
+            "student_count": self.student_count,
+            "student_ids": [self.first_student_id, self.last_student_id],
+        }
+
+
+def load_simulation_metadata():
+    """One grouped query over simulations, universities and students"""
+    from sqlalchemy import func
+    from app import db
+    from app.models import Simulation, Student, University
+
+    rows = (
+        db.session.query(
+            Simulation.id, Simulation.university_id, University.name, Simulation.status,
+            func.count(Student.id), func.min(Student.id), func.max(Student.id)
+        )
+        .join(University, University.id == Simulation.university_id)
+        .outerjoin(Student, Student.simulation_id == Simulation.id)
+        .group_by(Simulation.id, Simulation.university_id, University.name, Simulation.status)
+        .order_by(Simulation.id)
+        .all()
+    )
+    return [SimulationMeta(*row) for row in rows]
+
+
+class SimulationRegistry:
+    """Simulation metadata of one app, loaded on first use and kept until invalidated"""
+
+    def __init__(self):
+        self._simulations = None
+        self._by_id = {}
+        self._generation = None
+
+    @property
+    def loaded(self):
+        return self._simulations is not None
+
+    def refresh(self):
+        """Reload the metadata from the database"""
+        try:
+            # read first: a reseed finishing during the query is caught by the next access
+            generation = self._shared_generation()
+            simulations = load_simulation_metadata()
+            self._generation = generation
+            self._simulations = simulations
+            self._by_id = {simulation.id: simulation for simulation in simulations}
+            logger.info("Simulation registry loaded: %d simulations, %d students.",
+                        len(simulations), sum(simulation.student_count for simulation in simulations))
+            return simulations
+        except Exception as e:
+            logger.error("Error loading simulation registry: %s", e)
+            raise RuntimeError(f"Error loading simulation registry: {str(e)}")
+
+    def invalidate(self):
+        self._simulations = None
+        self._by_id = {}
+        self._generation = None
+        logger.info("Simulation registry invalidated.")
+
+    @staticmethod
+    def _shared_generation():
+        """Database generation shared by every process; None when Redis cannot be reached"""
+        from app.services.runs import database_generation
+        try:
+            return database_generation()
+        except Exception as e:
+            log_throttled(logging.WARNING, "registry_generation",
+                          "Could not read the database generation: %s", str(e))
+            return None
+
+    def simulations(self):
+        """Every simulation, ordered by id; reloaded when another process reseeded the database"""
+        if self._simulations is None:
+            self.refresh()
+        else:
+            generation = self._shared_generation()
+            if generation is not None and generation != self._generation:
+                logger.info("Database generation changed to %d; reloading the simulation registry.", generation)
+                self.refresh()
+        return self._simulations
+
+    def ids(self):
+        return [simulation.id for simulation in self.simulations()]
+
+    def get(self, simulation_id, default=None):
+        self.simulations()
+        return self._by_id.get(simulation_id, default)
+
+    def __iter__(self):
+        return iter(self.simulations())
+
+    def __len__(self):
+        return len(self.simulations())
+
+
+def get_registry(app=None):
+    """The registry of app (default: the current app)"""
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions.setdefault(EXTENSION_KEY, SimulationRegistry())
+
+
+def invalidate_registry():
+    """Drop the current app's metadata; a no-op outside an app context"""
+    from flask import has_app_context
+    if has_app_context():
+        get_registry().invalidate()
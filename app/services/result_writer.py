@@ -0,0 +1,182 @@
+"""Write-behind persistence of step results.
+
+Step code hands aggregates and score arrays to ResultWriter.submit, which
+never touches the database: batches go on a queue bounded by a row budget and
+are dropped (and counted) when the database falls that far behind. A writer
+thread turns them into SimulationResult / TestResult rows and inserts them in
+large executemany batches once `batch_rows` rows are pending or
+`flush_interval` seconds have passed. close() drains the queue; it also runs
+at interpreter exit.
+
+The threading and queue modules are the eventlet-patched ones when the hub is
+green, so the writer is a green thread there. The inserts use the app's
+engine, whose pool and connections are green as well, so they run on the
+writer thread itself (never through offload()) in chunks of `insert_rows`
+rows, each committed on its own, with a yield to the hub after each one.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from app.services.offload import offload
+from log.logger import log_throttled, logger
+
+_STOP = object()
+
+SCORE_METRICS = ("mean", "variance", "min", "max")
+FACTOR_METRICS = ("avg_internal_factor", "avg_external_factor", "avg_institutional_factor")
+# rows per executemany; the writer yields to the hub between chunks
+INSERT_CHUNK_ROWS = 5000
+
+
+def simulation_result_rows(step_number, summaries):
+    """SimulationResult rows of the per-simulation aggregates of one step"""
+    rows = []
+    for summary in summaries:
+        simulation_id = summary["simulation_id"]
+        scores = summary["scores"]
+        metrics = [("Student Performance", f"score_{name}", scores[name]) for name in SCORE_METRICS]
+        metrics += [("Student Performance", f"score_q{quantile}", value)
+                    for quantile, value in scores["quantiles"].items()]
+        metrics += [("Factor Influence", name, summary[name]) for name in FACTOR_METRICS]
+        rows.extend(
+            {"simulation_id": simulation_id, "step": step_number, "graph_type": graph_type,
+             "metric_name": metric_name, "value": value}
+            for graph_type, metric_name, value in metrics
+        )
+    return rows
+
+
+def test_result_rows(step_number, student_ids, scores, timestamp):
+    test_type = f"simulation step {step_number}"
+    return [
+        {"student_id": student_id, "score": score, "timestamp": timestamp, "test_type": test_type}
+        for student_id, score in zip(student_ids.tolist(), scores.tolist())
+    ]
+
+
+def test_result_batch_rows(payloads):
+    return [row for payload in payloads for row in test_result_rows(*payload)]
+
+
+class ResultWriter:
+    """Bounded write-behind queue with a background batch writer"""
+
+    def __init__(self, app, batch_rows=50000, flush_interval=2.0, max_pending_rows=2000000,
+                 insert_rows=INSERT_CHUNK_ROWS):
+        self.app = app
+        self.batch_rows = batch_rows
+        self.insert_rows = insert_rows
+        self.flush_interval = flush_interval
+        self.max_pending_rows = max_pending_rows
+        self.queue = queue.Queue()
+        self.pending_rows = 0
+        self.dropped_rows = 0
+        self.written_rows = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _reserve(self, rows):
+        with self.lock:
+            if self.pending_rows + rows > self.max_pending_rows:
+                self.dropped_rows += rows
+                return False
+            self.pending_rows += rows
+            return True
+
+    def submit(self, step_number, summaries, step=None):
+        """Queue the aggregates of a step and, when `step` is given, its per-student scores"""
+        items = [("simulation_result", simulation_result_rows(step_number, summaries))]
+        if step is not None and len(step):
+            # arrays are copied so later in-place steps cannot change them; rows are built by the writer
+            items.append(("test_result", (step_number, step.student_ids.copy(), step.scores.copy(),
+                                          datetime.utcnow())))
+        for kind, payload in items:
+            rows = len(payload) if kind == "simulation_result" else len(payload[1])
+            if self._reserve(rows):
+                self.queue.put((kind, rows, payload))
+            else:
+                log_throttled(logging.WARNING, ("result_writer", kind),
+                              "Result queue full; dropped %d %s rows of step %d.", rows, kind, step_number)
+
+    def _run(self):
+        batches = {"simulation_result": [], "test_result": []}
+        batched = 0
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if item is _STOP:
+                    stopping = True
+                else:
+                    kind, rows, payload = item
+                    batches[kind].append(payload)
+                    batched += rows
+            except queue.Empty:
+                pass
+            if batched and (stopping or batched >= self.batch_rows or time.monotonic() >= deadline):
+                self._flush(batches, batched)
+                batches = {"simulation_result": [], "test_result": []}
+                batched = 0
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batches, batched):
+        try:
+            self._insert(batches)
+            self.written_rows += batched
+            logger.debug("Result writer flushed %d rows.", batched)
+        except Exception:
+            logger.exception("Result writer failed to write %d rows.", batched)
+        finally:
+            with self.lock:
+                self.pending_rows -= batched
+
+    def _insert(self, batches):
+        from app import db
+        from app.models import SimulationResult, TestResult
+
+        simulation_rows = [row for rows in batches["simulation_result"] for row in rows]
+        # building the row dicts touches no green primitive, so it may leave the hub
+        test_rows = offload(test_result_batch_rows, batches["test_result"])
+        with self.app.app_context():
+            for table, rows in ((SimulationResult.__table__, simulation_rows), (TestResult.__table__, test_rows)):
+                for start in range(0, len(rows), self.insert_rows):
+                    # every chunk commits before the yield: a lock held across it would block other
+                    # writers, and SQLite's busy wait would block the whole hub
+                    with db.engine.begin() as connection:
+                        connection.execute(table.insert(), rows[start:start + self.insert_rows])
+                    time.sleep(0)
+
+    def close(self, timeout=None):
+        """Flush everything queued and stop the writer"""
+        if not self.thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+        logger.info("Result writer stopped: %d rows written, %d dropped.", self.written_rows, self.dropped_rows)
+
+
+def get_result_writer(app=None):
+    """The app's ResultWriter, created on first use; None when disabled in the config"""
+    from flask import current_app
+
+    app = app or current_app._get_current_object()
+    if not app.config.get("SIMULATION_RESULTS_ENABLED", True):
+        return None
+    writer = app.extensions.get("result_writer")
+    if writer is None:
+        writer = app.extensions["result_writer"] = ResultWriter(
+            app,
+            batch_rows=app.config.get("SIMULATION_RESULTS_BATCH_ROWS", 50000),
+            flush_interval=app.config.get("SIMULATION_RESULTS_FLUSH_INTERVAL", 2.0),
+            max_pending_rows=app.config.get("SIMULATION_RESULTS_MAX_PENDING_ROWS", 2000000),
+        )
+    return writer
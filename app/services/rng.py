@@ -0,0 +1,80 @@
+"""Counter-based random streams of the simulation.
+
+Every draw of a step comes from a Philox generator keyed by the run seed whose
+counter starts at (step, simulation, block). The student rows of a simulation
+are cut into BLOCK_ROWS-row blocks counted from the simulation's first row,
+and the institutional walk of a simulation has a block of its own. A stream
+depends only on those coordinates, never on which rows were drawn before, so
+a shard can draw its rows in any order on any worker and get the numbers a
+serial run over the whole state draws.
+
+Draws advance the lowest counter word only; a block uses a few thousand
+counter values, far from carrying into the coordinates.
+"""
+
+import numpy as np
+
+BLOCK_ROWS = 4096
+INSTITUTIONAL_BLOCK = np.iinfo(np.uint64).max
+
+
+class RandomStreams:
+    """Independent Philox streams per (step, simulation, block) of one run seed"""
+
+    def __init__(self, seed=None):
+        # an int seed is its own entropy, so RandomStreams(streams.entropy) reproduces the streams
+        self.entropy = int(np.random.SeedSequence(seed).entropy)
+        self.key = np.random.SeedSequence(self.entropy).generate_state(2, dtype=np.uint64)
+
+    @property
+    def state(self):
+        return {"entropy": self.entropy}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["entropy"])
+
+    def generator(self, step, simulation_id, block):
+        counter = np.array([0, block, simulation_id, step], dtype=np.uint64)
+        return np.random.Generator(np.random.Philox(key=self.key, counter=counter))
+
+    def institutional_walk(self, step, simulation_id, shape, step_size):
+        """Walk of one simulation's institutional rows"""
+        return self.generator(step, simulation_id, INSTITUTIONAL_BLOCK).uniform(-step_size, step_size, size=shape)
+
+    def student_draws(self, state, rows, step, step_size, variation):
+        """(internal walk, external walk, score noise) of the student rows in a slice of state.
+
+        Full blocks are drawn straight into the result; blocks cut by the
+        slice are drawn whole and trimmed, so the result does not depend on
+        where shards start and stop.
+        """
+        start, stop = rows.start or 0, len(state) if rows.stop is None else rows.stop
+        internal = np.empty((stop - start, state.internal_factors.shape[1]))
+        external = np.empty((stop - start, state.external_factors.shape[1]))
+        noise = np.empty(stop - start)
+        if stop <= start:
+            return internal, external, noise
+
+        simulation_ids = state.simulation_ids
+        changes = np.flatnonzero(simulation_ids[start + 1:stop] != simulation_ids[start:stop - 1]) + start + 1
+        for simulation_id in simulation_ids[np.concatenate(([start], changes))].tolist():
+            owned = state.simulation_slice(simulation_id)
+            first = (max(owned.start, start) - owned.start) // BLOCK_ROWS
+            last = (min(owned.stop, stop) - 1 - owned.start) // BLOCK_ROWS
+            for block in range(first, last + 1):
+                block_start = owned.start + block * BLOCK_ROWS
+                block_stop = min(block_start + BLOCK_ROWS, owned.stop)
+                generator = self.generator(step, simulation_id, block)
+                lo, hi = max(block_start, start), min(block_stop, stop)
+                for out in (internal, external, noise):
+                    if lo == block_start and hi == block_stop:
+                        generator.random(out=out[lo - start:hi - start])
+                    else:
+                        values = generator.random((block_stop - block_start,) + out.shape[1:])
+                        out[lo - start:hi - start] = values[lo - block_start:hi - block_start]
+        # unit draws become uniform(-step_size, step_size) and uniform(-variation, variation)
+        for out, half_width in ((internal, step_size), (external, step_size), (noise, variation)):
+            out *= 2 * half_width
+            out -= half_width
+        return internal, external, noise
@@ -0,0 +1,236 @@
+"""Namespaced simulation runs.
+
+A run is an independent copy of the simulation state: its row index, row
+blocks and snapshot live under the run's own keys (``run:<id>:...``, see
+cache.run_key), so concurrent users stepping different runs never overwrite
+each other. Requests name their run with ``?run=<id>``; without one they use
+the shared default namespace the single-user pipeline has always used.
+
+Run metadata is kept in Redis hashes so every worker process sees the same
+runs. The registry caps the number of runs, the state bytes of one run and
+the state bytes of all runs together; making room evicts the least recently
+used idle runs, and runs idle for longer than the TTL are evicted on the next
+create or access. Runs that are stepping are never evicted for room.
+
+Run keys also expire in Redis, KEY_TTL_FACTOR times the TTL after the run was
+last touched, and writes check that the run is still registered; blocks
+written by a request racing with an eviction cannot linger forever.
+
+Runs share the database. seed_data bumps a database generation counter, and
+a run created before a reseed refuses to write its factors back.
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+from app.services import cache
+from log.logger import logger
+
+EXTENSION_KEY = 'simulation_runs'
+RUNS_KEY = 'simulation_runs'
+RUNS_USED_KEY = 'simulation_runs:used'
+RUNS_ACTIVE_KEY = 'simulation_runs:active'
+GENERATION_KEY = 'simulation_database_generation'
+# seconds between two last-used updates of one run from this process
+TOUCH_INTERVAL = 1.0
+# run keys expire this many TTLs after the last touch, so they always outlive a registered run
+KEY_TTL_FACTOR = 2
+
+
+class RunNotFound(LookupError):
+    pass
+
+
+class RunQuotaExceeded(RuntimeError):
+    pass
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def database_generation():
+    return int(cache.redis_client.get(GENERATION_KEY) or 0)
+
+
+def bump_database_generation():
+    """Mark every existing run as created from an older database"""
+    return cache.redis_client.incr(GENERATION_KEY)
+
+
+class RunRegistry:
+    """Creates, tracks and evicts namespaced runs"""
+
+    def __init__(self, max_runs=32, run_max_bytes=512 * 2**20, total_max_bytes=4 * 2**30, ttl=3600,
+                 snapshot_root='snapshots/runs', timeline_root='timelines', seed=None):
+        self.max_runs = max_runs
+        self.run_max_bytes = run_max_bytes
+        self.total_max_bytes = total_max_bytes
+        self.ttl = ttl
+        self.snapshot_root = snapshot_root
+        self.timeline_root = timeline_root
+        # seed of the random streams of new runs; None gives every run a fresh one
+        self.seed = seed
+        self._touched = {}
+
+    @property
+    def key_ttl(self):
+        return int(self.ttl * KEY_TTL_FACTOR) + 1
+
+    def snapshot_dir(self, run_id):
+        return os.path.join(self.snapshot_root, run_id)
+
+    def _load(self):
+        """run id -> metadata with last_used and active_since filled in"""
+        client = cache.redis_client
+        used = {_decode(key): float(value) for key, value in client.hgetall(RUNS_USED_KEY).items()}
+        active = {_decode(key): float(value) for key, value in client.hgetall(RUNS_ACTIVE_KEY).items()}
+        runs = {}
+        for key, value in client.hgetall(RUNS_KEY).items():
+            run_id = _decode(key)
+            meta = json.loads(value)
+            meta["last_used"] = used.get(run_id, meta["created"])
+            meta["active_since"] = active.get(run_id)
+            runs[run_id] = meta
+        return runs
+
+    def runs(self):
+        """Every run, most recently used first"""
+        return sorted(self._load().values(), key=lambda meta: meta["last_used"], reverse=True)
+
+    def get(self, run_id):
+        return self._load().get(run_id)
+
+    def require(self, run_id):
+        """Metadata of a registered run; one idle for longer than the TTL is evicted here"""
+        meta = self.get(run_id)
+        if meta is not None and time.time() - meta["last_used"] > self.ttl:
+            self.evict(run_id, reason="expired")
+            meta = None
+        if meta is None:
+            raise RunNotFound(f"Unknown run {run_id}")
+        return meta
+
+    def touch(self, run_id, force=False):
+        now = time.time()
+        if force or now - self._touched.get(run_id, 0) >= TOUCH_INTERVAL:
+            self._touched[run_id] = now
+            cache.redis_client.hset(RUNS_USED_KEY, mapping={run_id: now})
+            cache.expire_run_data(run_id, self.key_ttl)
+
+    def persist(self, state, run_id):
+        """persist_dirty_state of a run that must still be registered"""
+        self.require(run_id)
+        written = cache.persist_dirty_state(state, run_id=run_id, expire=self.key_ttl)
+        self.touch(run_id)
+        return written
+
+    def pin(self, run_id):
+        """Protect a run from eviction for room while it steps"""
+        cache.redis_client.hset(RUNS_ACTIVE_KEY, mapping={run_id: time.time()})
+
+    def unpin(self, run_id):
+        cache.redis_client.hdel(RUNS_ACTIVE_KEY, run_id)
+        self.touch(run_id, force=True)
+
+    @contextmanager
+    def active(self, run_id):
+        self.pin(run_id)
+        try:
+            yield
+        finally:
+            self.unpin(run_id)
+
+    def create(self, state, index=None, label=None):
+        """Publish state as a new run; returns its metadata"""
+        from app.utils.build_flat_lookup import build_lookup
+
+        nbytes = int(state.nbytes)
+        if nbytes > self.run_max_bytes:
+            raise RunQuotaExceeded(
+                f"Run state of {nbytes} bytes exceeds the per-run quota of {self.run_max_bytes} bytes")
+        self.sweep()
+        self._make_room(nbytes)
+
+        run_id = uuid.uuid4().hex[:12]
+        try:
+            cache.cache_lookup_data(index if index is not None else build_lookup(state), cache.LOOKUP_KEY,
+                                    run_id=run_id, expire=self.key_ttl)
+            cache.cache_state_snapshot(state, run_id=run_id, expire=self.key_ttl)
+            cache.reset_stream_clock(self.seed, run_id=run_id, expire=self.key_ttl)
+        except Exception:
+            cache.delete_run_data(run_id)
+            raise
+        meta = {
+            "run_id": run_id,
+            "label": label,
+            "created": time.time(),
+            "students": len(state),
+            "nbytes": nbytes,
+            "generation": database_generation(),
+        }
+        cache.redis_client.hset(RUNS_KEY, mapping={run_id: json.dumps(meta)})
+        self.touch(run_id, force=True)
+        logger.info("Created run %s: %d students, %d bytes.", run_id, len(state), nbytes)
+        return dict(meta, last_used=meta["created"], active_since=None)
+
+    def evict(self, run_id, reason="deleted"):
+        """Drop a run's cache keys, snapshot, timelines and metadata"""
+        from app.services.timeline import delete_timelines
+
+        cache.delete_run_data(run_id)
+        client = cache.redis_client
+        client.hdel(RUNS_KEY, run_id)
+        client.hdel(RUNS_USED_KEY, run_id)
+        client.hdel(RUNS_ACTIVE_KEY, run_id)
+        self._touched.pop(run_id, None)
+        shutil.rmtree(self.snapshot_dir(run_id), ignore_errors=True)
+        delete_timelines(self.timeline_root, run=run_id)
+        logger.info("Run %s evicted (%s).", run_id, reason)
+
+    def sweep(self, now=None):
+        """Evict runs idle for longer than the TTL; active runs count as idle once their last step is that old"""
+        now = time.time() if now is None else now
+        expired = [run_id for run_id, meta in self._load().items() if now - meta["last_used"] > self.ttl]
+        for run_id in expired:
+            self.evict(run_id, reason="expired")
+        return expired
+
+    def _make_room(self, nbytes):
+        """Evict least recently used idle runs until one more run of nbytes fits"""
+        runs = sorted(self._load().values(), key=lambda meta: meta["last_used"])
+        total = sum(meta["nbytes"] for meta in runs)
+        while len(runs) + 1 > self.max_runs or total + nbytes > self.total_max_bytes:
+            idle = [meta for meta in runs if meta["active_since"] is None]
+            if not idle:
+                raise RunQuotaExceeded(
+                    f"No room for another run: {len(runs)} runs hold {total} bytes and all of them are stepping")
+            victim = idle[0]
+            self.evict(victim["run_id"], reason="least recently used")
+            runs.remove(victim)
+            total -= victim["nbytes"]
+
+
+def get_runs(app=None):
+    """The run registry of app (default: the current app)"""
+    if app is None:
+        from flask import current_app
+        app = current_app
+    registry = app.extensions.get(EXTENSION_KEY)
+    if registry is None:
+        config = app.config
+        snapshots = os.path.dirname(config.get("SIMULATION_SNAPSHOT_DIR", "snapshots/state"))
+        registry = app.extensions[EXTENSION_KEY] = RunRegistry(
+            max_runs=config.get("SIMULATION_MAX_RUNS", 32),
+            run_max_bytes=config.get("SIMULATION_RUN_MAX_BYTES", 512 * 2**20),
+            total_max_bytes=config.get("SIMULATION_RUNS_MAX_BYTES", 4 * 2**30),
+            ttl=config.get("SIMULATION_RUN_TTL", 3600),
+            snapshot_root=os.path.join(snapshots, "runs"),
+            timeline_root=config.get("SIMULATION_TIMELINE_DIR", "timelines"),
+            seed=config.get("SIMULATION_SEED"),
+        )
+    return registry
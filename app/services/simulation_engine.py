@@ -1,15 +1,48 @@
-import random
-from sqlalchemy.orm.collections import InstrumentedList
-from dataclasses import asdict
+from dataclasses import dataclass
+import numpy as np
+from app.services.metrics import ENGINE_PHASE_SECONDS, ROWS_STEPPED
+from app.services.rng import RandomStreams
+from app.services.tracing import TRACER
 from log.logger import logger
 
 # from app.services.memory_state import create_memory_state
 
 
+@dataclass
+class StepResult:
+    """Scores and pre-walk factor impacts of every student processed in one step"""
+    student_ids: np.ndarray
+    simulation_ids: np.ndarray
+    scores: np.ndarray
+    internal_impact: np.ndarray
+    external_impact: np.ndarray
+    institutional_impact: np.ndarray
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    @classmethod
+    def concatenate(cls, parts):
+        parts = list(parts)
+        if len(parts) == 1:
+            return parts[0]
+        names = ('student_ids', 'simulation_ids', 'scores', 'internal_impact',
+                 'external_impact', 'institutional_impact')
+        if not parts:
+            return cls(*(np.empty(0, dtype=np.int64 if n.endswith('ids') else np.float64) for n in names))
+        return cls(*(np.concatenate([getattr(p, n) for p in parts]) for n in names))
+
+
 class SimulationEngine:
-    def __init__(self):
+    def __init__(self, seed=None):
         self.BASE_SCORE = 70
         self.RANDOM_VARIATION = 5
+        self.STEP_SIZE = 0.1
+        # vectorized steps draw from per-(step, simulation, block) streams; steps counts them
+        self.streams = RandomStreams(seed)
+        self.steps = 0
+        # the per-object path below steps one object at a time, so a sequential generator suffices
+        self.rng = np.random.default_rng(self.streams.entropy)
         self.FACTOR_WEIGHTS = {
             'external': 0.30,
             'internal': 0.40,
@@ -25,7 +58,7 @@ class SimulationEngine:
         for attr, value in data_obj.items():
             if attr not in self.EXCLUDED_ATTRIBUTES:
                 if isinstance(value, float):
-                    delta = random.uniform(-step_size, step_size)
+                    delta = float(self.rng.uniform(-step_size, step_size))
                     new_value = value + delta
                     setattr(obj, attr, new_value)
                     # logger.debug("Updated attribute '%s' from %f to %f", attr, value, new_value)
@@ -35,7 +68,7 @@ class SimulationEngine:
     def update_single_factor(self, factor_values_list_all):
         """Update each attribute of the factor in the memory"""
         try:
-            self.random_walk(factor_values_list_all, step_size=0.1)
+            self.random_walk(factor_values_list_all, step_size=self.STEP_SIZE)
             # logger.info("Updated single factor using random walk")
         except Exception as e:
             logger.error("Error updating factors: %s", str(e))
@@ -81,7 +114,7 @@ class SimulationEngine:
                 institutional_impact * self.FACTOR_WEIGHTS['institutional']
             )
 
-            random_variation = random.uniform(-self.RANDOM_VARIATION, self.RANDOM_VARIATION)
+            random_variation = float(self.rng.uniform(-self.RANDOM_VARIATION, self.RANDOM_VARIATION))
             final_score = self.BASE_SCORE * weighted_impact + random_variation
             clamped_score = max(0, min(100, final_score))
 
@@ -94,3 +127,134 @@ class SimulationEngine:
         except Exception as e:
             logger.error("Error calculating performance: %s", str(e))
             raise RuntimeError(f"error calculating performance: {str(e)}")
+
+    # vectorized path over the columnar SimulationState
+
+    @staticmethod
+    def family_impact(values):
+        """Row-wise mean of a factor family, ignoring missing values; 1.0 for rows without any"""
+        impact = values.sum(axis=1, dtype=np.float64)
+        missing = np.isnan(impact)
+        if not values.shape[1]:
+            return np.ones(len(values), dtype=np.float64)
+        impact /= values.shape[1]
+        if missing.any():
+            partial = values[missing]
+            present = ~np.isnan(partial)
+            counts = present.sum(axis=1)
+            totals = np.where(present, partial, 0).sum(axis=1)
+            filled = np.ones(len(partial), dtype=np.float64)
+            np.divide(totals, counts, out=filled, where=counts > 0)
+            impact[missing] = filled
+        return impact
+
+    @staticmethod
+    def walk_batch(values, walk):
+        """Apply drawn random walk steps to every factor value of a 2-D block in place"""
+        values += walk.astype(values.dtype, copy=False)
+
+    def performance_batch(self, internal_impact, external_impact, institutional_impact, noise):
+        """Vectorized calculate_performance over arrays of family impacts"""
+        weighted_impact = (
+            external_impact * self.FACTOR_WEIGHTS['external'] +
+            internal_impact * self.FACTOR_WEIGHTS['internal'] +
+            institutional_impact * self.FACTOR_WEIGHTS['institutional']
+        )
+        scores = self.BASE_SCORE * weighted_impact
+        scores += noise
+        return np.clip(scores, 0, 100, out=scores)
+
+    def _step_rows(self, state, rows, step, step_size, institutional_before=None):
+        """Step a slice of student rows with the draws of step `step`.
+
+        With ``institutional_before`` (per-simulation impacts before the walk)
+        the institutional factors are assumed to be walked already by the
+        caller, as the sharded runner does once per step for all shards.
+        """
+        internal = state.internal_factors[rows]
+        external = state.external_factors[rows]
+        institutional_rows = state.institutional_rows[rows]
+        has_institutional = institutional_rows >= 0
+
+        def institutional_impact(per_simulation):
+            if not len(per_simulation):
+                return np.ones(len(institutional_rows))
+            return np.where(has_institutional, per_simulation[np.maximum(institutional_rows, 0)], 1.0)
+
+        with ENGINE_PHASE_SECONDS.time("impacts"), TRACER.span("impacts", "engine", step=step, rows=len(internal)):
+            if institutional_before is None:
+                institutional_before = self.family_impact(state.institutional_factors)
+                walk_institutional = True
+            else:
+                walk_institutional = False
+            before = (self.family_impact(internal), self.family_impact(external),
+                      institutional_impact(institutional_before))
+
+        with ENGINE_PHASE_SECONDS.time("draws"), TRACER.span("draws", "engine", step=step):
+            internal_walk, external_walk, noise = self.streams.student_draws(
+                state, rows, step, step_size, self.RANDOM_VARIATION)
+        with ENGINE_PHASE_SECONDS.time("walk"), TRACER.span("walk", "engine", step=step):
+            self.walk_batch(internal, internal_walk)
+            self.walk_batch(external, external_walk)
+            if walk_institutional:
+                # institutional factors are shared by the simulation, so they move once per step
+                self.walk_institutional(state, step, step_size, np.unique(state.simulation_ids[rows]))
+            state.mark_dirty(rows)
+
+        with ENGINE_PHASE_SECONDS.time("scores"), TRACER.span("scores", "engine", step=step):
+            scores = self.performance_batch(
+                self.family_impact(internal), self.family_impact(external),
+                institutional_impact(self.family_impact(state.institutional_factors)), noise
+            )
+        ROWS_STEPPED.labels().inc(len(scores))
+        return StepResult(
+            student_ids=state.student_ids[rows],
+            simulation_ids=state.simulation_ids[rows],
+            scores=scores,
+            internal_impact=before[0],
+            external_impact=before[1],
+            institutional_impact=before[2],
+        )
+
+    def walk_institutional(self, state, step, step_size, simulation_ids=None):
+        """Random walk of the institutional rows of the given simulations (all when None).
+
+        Returns the per-row impacts from before the walk.
+        """
+        before = self.family_impact(state.institutional_factors)
+        if simulation_ids is None:
+            simulation_ids = np.unique(state.institutional_simulation_ids)
+        for simulation_id in np.asarray(simulation_ids).tolist():
+            rows = state.institutional_slice(simulation_id)
+            if rows.stop > rows.start:
+                block = state.institutional_factors[rows]
+                self.walk_batch(block, self.streams.institutional_walk(step, simulation_id, block.shape, step_size))
+                state.mark_institutional_dirty(rows)
+        return before
+
+    def step_batch(self, state, simulation_ids=None, step_size=None, step=None):
+        """Advance every student of the given simulations (all when None) by one step.
+
+        Factor arrays of ``state`` are updated in place. Scores follow the scalar
+        path: impacts are taken after the random walk, combined with
+        FACTOR_WEIGHTS, offset by uniform noise and clamped to [0, 100].
+        `step` picks the random streams and defaults to the step after the
+        last one run; the same seed and step give the same draws however the
+        rows are split.
+        """
+        try:
+            step = self.steps + 1 if step is None else step
+            self.steps = step
+            step_size = self.STEP_SIZE if step_size is None else step_size
+
+            if simulation_ids is None:
+                row_slices = [slice(0, len(state))]
+            else:
+                row_slices = [state.simulation_slice(simulation_id) for simulation_id in simulation_ids]
+
+            return StepResult.concatenate(
+                self._step_rows(state, rows, step, step_size) for rows in row_slices
+            )
+        except Exception as e:
+            logger.error("Error running batched step: %s", str(e))
+            raise RuntimeError(f"error running batched step: {str(e)}")
@@ -1,35 +1,40 @@
 """ Renders simulation charts to the frontend, process and run simulation """
 import eventlet
 eventlet.monkey_patch()
-from sqlalchemy.orm.collections import InstrumentedList
 from .simulation_engine import SimulationEngine
-from app.services.cache import get_cached_lookup_data, cache_lookup_data
+from app.services.cache import get_cached_partition, persist_dirty_state, reserve_steps, stream_seed
+from app.services.offload import offload
+from app.services.runs import get_runs
+from app.services.aggregates import step_summaries
+from app.services.metrics import STAGE_SECONDS, timed
+from app.services.tracing import TRACER
 from log.logger import logger
-from sqlalchemy.orm import joinedload
-
-import time
-from flask_socketio import emit, SocketIO
 
 class SimulationService:
     """Running simulation and its services"""
-   
-    def __init__(self):
-        from app.models import Simulation, Student
-        from app import db
-        self.sim_eng = SimulationEngine()
-        self.sim_model = (db.session.query(Simulation).options(joinedload(Simulation.students)).join(Simulation.students).order_by(Simulation.id)).all()
-        self.student_model = Student.query.all()
-        logger.info("SimulationService initialized with simulation and student models.")
+
+    @timed(STAGE_SECONDS, "simulation_service_init")
+    def __init__(self, run_id=None, seed=None):
+        from flask import current_app
+        from app.services.registry import get_registry
+        # namespaced run whose cached state is stepped; None is the shared state
+        self.run_id = run_id
+        # the streams of the namespace (fixed from SIMULATION_SEED when it is loaded), shared with run_steps
+        self.sim_eng = SimulationEngine(stream_seed(current_app.config.get("SIMULATION_SEED"), run_id)
+                                        if seed is None else seed)
+        # metadata only; the students live in the cached state
+        self.simulations = get_registry().simulations()
+        logger.debug("SimulationService initialized with %d simulations.", len(self.simulations))
  
     def chart_instance(self):
-        available_simulations = self.sim_model
+        available_simulations = self.simulations
         try:
             chart_arr = []
             if available_simulations:
                 for simulation_data in available_simulations:
                     dictionary = {
                         "simulation_id": simulation_data.id, 
-                        "university": simulation_data.university.name,
+                        "university": simulation_data.university,
                         "factors": {
                             "Internal_Factor": [], 
                             "External_Factor": [], 
@@ -59,102 +64,41 @@ class SimulationService:
             logger.error(f"Error processing factors for {identifier}: {str(e)}")
             raise RuntimeError(f"Error processing factors {str(e)}")
 
-    # run simulation
-    def process_simulation(self, simulation):
-        """ Process students in each simulation """
-        try:
-            internal_factor_data_lookup = get_cached_lookup_data(mem_factor_identifier="mem_internal_factor")
-            external_factor_data_lookup = get_cached_lookup_data(mem_factor_identifier="mem_external_factor")
-            institutional_factor_data_lookup = get_cached_lookup_data(mem_factor_identifier="mem_institutional_factor")
-
-            result = []
-            # simulations = self.sim_model
-            factors = {
-                    "simulation_id": None, 
-                    "Internal_Factor": [], 
-                    "External_Factor": [], 
-                    "Institutional_Factor": []
-            }
-            avg_factors= []
-            # for simulation in simulations:
-
-            for student in simulation.students:
-                # logger.info(f"Processing student {student.id} in simulation {simulation.id}")
-                factors["simulation_id"] = simulation.id
-
-                key = (simulation.id, student.id)
-                  #   logger.debug(f"Processing simulation {simulation.id} for student {student.id}")
-
-                # internal factors 
-                internal_factor_looked_up_data = internal_factor_data_lookup.get(key)
-                if internal_factor_looked_up_data:
-                    # logger.info(f"Processing internal factors for simulation {simulation.id}")
-                    factors['Internal_Factor'].append(self.sim_eng.calculate_factor_impact(internal_factor_looked_up_data))
-                    # logger.info(f"not modified: {internal_factor_looked_up_data}")
-                    self.process_factors(internal_factor_looked_up_data, "internal factors", f"internal factor {simulation.id}")
-                    # logger.info(f"Modified: {internal_factor_looked_up_data}")
+    def next_step(self):
+        """Number of the next step of the namespace; every simulation of one step must be processed with it"""
+        return reserve_steps(1, self.run_id)
 
-                else:
-                    logger.warning(f"No internal factors found for simulation {simulation.id}")
-
-                # external factors
-                external_factor_looked_up_data = external_factor_data_lookup.get(key)
-                if external_factor_looked_up_data:
-                    factors['External_Factor'].append(self.sim_eng.calculate_factor_impact(external_factor_looked_up_data))
-
-                    # logger.info(f"Processing external factors for simulation {simulation.id}")
-                    self.process_factors(external_factor_looked_up_data, "external factors", f"external factor {simulation.id}")
-                else:
-                    logger.warning(f"No external factors found for simulation {simulation.id}")
-                
-                # institutional factors 
-                institutional_factor_looked_up_data = institutional_factor_data_lookup.get(key)
-                if institutional_factor_looked_up_data:
-                    factors["Institutional_Factor"].append(self.sim_eng.calculate_factor_impact(institutional_factor_looked_up_data))
-
-                    # logger.info(f"Processing institutional factors for simulation {simulation.id}")
-                    self.process_factors(institutional_factor_looked_up_data, "institutional factors", f"institutional factor {simulation.id}")
-                else:
-                    logger.warning(f"No institutional factors found for simulation {simulation.id}")
-
-                # calculate score
-                score = self.sim_eng.calculate_performance(
-                    mem_internal_factors=internal_factor_looked_up_data,
-                    mem_external_factors=external_factor_looked_up_data,
-                    mem_institutional_factors=institutional_factor_looked_up_data
-                )
-                logger.debug(f"Calculated score for simulation {simulation.id}, student {student.id}: {score}")
+    # run simulation
+    @timed(STAGE_SECONDS, "process_simulation")
+    def process_simulation(self, simulation, detail=False, step=None):
+        """ Process students in each simulation; aggregates only unless detail is set.
 
-                result.append({ 
-                    'simulation_id': simulation.id, 
-                    'Student_id': student.id,
-                    'score': score
-                })
-            avg_factors.append({
-                "simulation_id" : factors["simulation_id"],
-                "avg_internal_factor" : sum(factors["Internal_Factor"])/len(factors["Internal_Factor"]), 
-                "avg_external_factor" : sum(factors["External_Factor"])/len(factors["External_Factor"]), 
-                "avg_institutional_factor" : sum(factors["Institutional_Factor"])/len(factors["Institutional_Factor"])  
-            })
-            # update cached lookup data
-            cache_lookup_data(internal_factor_data_lookup, mem_factor_identifier="mem_internal_factor")
-            cache_lookup_data(external_factor_data_lookup, mem_factor_identifier="mem_external_factor")
-            cache_lookup_data(institutional_factor_data_lookup, mem_factor_identifier="mem_institutional_factor")   
-            # logger.info(factors)
-            result.append(avg_factors)
-            logger.info(f"Completed processing simulations id {simulation.id} for {len(result)} students.") 
+        `step` picks the random streams (see SimulationEngine.step_batch); pass the same
+        number for every simulation of a step, or simulation k would draw as step k.
+        """
+        try:
+            with TRACER.span("process_simulation", simulation_id=simulation.id):
+                # only this simulation's partition is fetched and written back
+                with TRACER.span("get_cached_partition", "cache", simulation_id=simulation.id):
+                    simulation_state = get_cached_partition(simulation.id, run_id=self.run_id)
+                if simulation_state is None:
+                    raise RuntimeError("No simulation data found in cache. Please load memory first.")
+
+                step = offload(self.sim_eng.step_batch, simulation_state, step=step)
+                # write back only the blocks this step changed
+                with TRACER.span("persist_dirty_state", "cache", simulation_id=simulation.id):
+                    if self.run_id is None:
+                        persist_dirty_state(simulation_state)
+                    else:
+                        get_runs().persist(simulation_state, self.run_id)
+
+                if not len(step):
+                    logger.warning("No students found for simulation %s", simulation.id)
+
+                result = offload(step_summaries, step, detail=detail)
+            logger.debug("Completed processing simulations id %s for %d students.", simulation.id, len(step))
             return result
 
-
-            
-
         except Exception as e:
-            logger.error(f"Error processing simulation {simulation.id} for student {student.id}: {str(e)}")
-            result.append({# type: ignore
-                'simulation_id': simulation.id,  # type: ignore
-                'Student_id': student.id,
-                'error': str(e)
-            })
-            raise RuntimeError(f"Error processing simulation {str(e)}")  # type: ignore
-    
-   
\ No newline at end of file
+            logger.error("Error processing simulation %s: %s", simulation.id, e)
+            raise RuntimeError(f"Error processing simulation {str(e)}")
@@ -0,0 +1,148 @@
+"""On-disk snapshots of the simulation state.
+
+A snapshot is a directory holding one ``.npy`` file per array (the state
+columns, the student row index) and a ``manifest.json`` with the format
+version, step counter, random stream seed and the dtype and shape of every
+file.
+Snapshots are written to a sibling temporary directory and swapped in with a
+rename, so a crash mid-write leaves the previous snapshot intact.
+
+Restoring memory-maps the files copy-on-write: nothing is read until a page is
+touched, and steps evolving the restored state never write back to the files.
+"""
+
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from app.services.model_representation import SimulationState
+from app.services.rng import RandomStreams
+from app.services.state_format import STATE_ARRAYS
+from app.utils.build_flat_lookup import RowIndex
+from log.logger import logger
+
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+class Snapshot:
+    """A restored snapshot: state, row index, RandomStreams (or None), step counter and free-form meta"""
+
+    def __init__(self, state, index, rng, step, meta):
+        self.state = state
+        self.index = index
+        self.rng = rng
+        self.step = step
+        self.meta = meta
+
+
+def _file_name(group, name):
+    return f"{group}.{name}.npy"
+
+
+def _save_arrays(directory, group, arrays):
+    entries = {}
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        np.save(os.path.join(directory, _file_name(group, name)), values, allow_pickle=False)
+        entries[name] = {"dtype": values.dtype.str, "shape": list(values.shape)}
+    return entries
+
+
+def _load_arrays(directory, group, entries, mmap_mode):
+    arrays = {}
+    for name, entry in entries.items():
+        values = np.load(os.path.join(directory, _file_name(group, name)), mmap_mode=mmap_mode, allow_pickle=False)
+        if values.dtype.str != entry["dtype"] or list(values.shape) != entry["shape"]:
+            raise ValueError(f"Snapshot file {_file_name(group, name)} does not match the manifest")
+        arrays[name] = values
+    return arrays
+
+
+def _swap_in(staging, directory):
+    """Replace directory with staging; the old snapshot is removed only after the rename"""
+    retired = None
+    if os.path.exists(directory):
+        retired = f"{directory}.old-{os.getpid()}"
+        os.rename(directory, retired)
+    os.rename(staging, directory)
+    if retired:
+        shutil.rmtree(retired, ignore_errors=True)
+
+
+def write_snapshot(directory, state, index=None, rng=None, step=0, meta=None):
+    """Write state (plus row index and RandomStreams seed) as a snapshot directory; returns its manifest"""
+    try:
+        started = time.perf_counter()
+        directory = os.path.abspath(directory)
+        os.makedirs(os.path.dirname(directory), exist_ok=True)
+        staging = f"{directory}.tmp-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        index = index if index is not None else RowIndex.build(state.simulation_ids, state.student_ids)
+        index_meta, index_arrays = index.export()
+        state_arrays = {name: getattr(state, name) for name in STATE_ARRAYS}
+        state_arrays["institutional_rows"] = state.institutional_rows
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "created": time.time(),
+            "step": int(step),
+            "students": len(state),
+            "rng": rng.state if rng is not None else None,
+            "state": _save_arrays(staging, "state", state_arrays),
+            "index": dict(index_meta, arrays=_save_arrays(staging, "index", index_arrays)),
+            "meta": meta or {},
+        }
+        with open(os.path.join(staging, MANIFEST), 'w') as file:
+            json.dump(manifest, file)
+        _swap_in(staging, directory)
+
+        logger.info("Snapshot of %d students at step %d written to %s in %.2fs.",
+                    len(state), step, directory, time.perf_counter() - started)
+        return manifest
+    except Exception as e:
+        logger.error("Error writing simulation snapshot: %s", e)
+        raise RuntimeError(f"Error writing simulation snapshot: {str(e)}")
+
+
+def read_manifest(directory):
+    """Manifest of the snapshot in directory, or None when there is none"""
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        manifest = json.load(file)
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {manifest.get('version')}")
+    return manifest
+
+
+def read_snapshot(directory, mmap_mode='c'):
+    """Map a snapshot back in; returns a Snapshot, or None when directory holds none.
+
+    The default copy-on-write mapping gives writable arrays whose changes stay
+    in memory; 'r' maps them read-only.
+    """
+    try:
+        started = time.perf_counter()
+        manifest = read_manifest(directory)
+        if manifest is None:
+            logger.warning("No simulation snapshot found in %s.", directory)
+            return None
+
+        arrays = _load_arrays(directory, "state", manifest["state"], mmap_mode)
+        state = SimulationState.from_arrays(**arrays)
+        index_meta = manifest["index"]
+        index = RowIndex.from_export(index_meta, _load_arrays(directory, "index", index_meta["arrays"], mmap_mode))
+        rng = RandomStreams.from_state(manifest["rng"]) if manifest["rng"] else None
+
+        logger.info("Snapshot of %d students at step %d mapped from %s in %.3fs.",
+                    len(state), manifest["step"], directory, time.perf_counter() - started)
+        return Snapshot(state, index, rng, manifest["step"], manifest["meta"])
+    except Exception as e:
+        logger.error("Error reading simulation snapshot: %s", e)
+        raise RuntimeError(f"Error reading simulation snapshot: {str(e)}")
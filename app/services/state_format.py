@@ -0,0 +1,168 @@
+"""Binary layout of the columnar simulation state.
+
+A payload is a fixed prefix (magic, format version, header length), a JSON
+header describing every array (name, little-endian dtype, shape, offset) plus
+free-form metadata, followed by the raw contiguous array buffers, each aligned
+to ALIGNMENT bytes. The same bytes can be stored in Redis, written to disk or
+copied into shared memory, and decoded with ``numpy.frombuffer`` without
+copying. Payloads without the magic are legacy pickles and are still readable.
+"""
+
+import json
+import mmap
+import pickle
+import struct
+
+import numpy as np
+
+from app.services.model_representation import SimulationState
+from app.utils.build_flat_lookup import RowIndex
+
+MAGIC = b'SIMS'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct('<4sHI')
+
+STATE_ARRAYS = (
+    'student_ids', 'simulation_ids', 'internal_factors', 'external_factors',
+    'institutional_simulation_ids', 'institutional_factors'
+)
+
+
+def _aligned(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _little_endian(arr):
+    arr = np.asarray(arr)
+    return np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder('<'))
+
+
+def _layout(arrays, meta):
+    """Return (header bytes, [(offset, array)], total size) for a set of named arrays"""
+    arrays = {name: _little_endian(arr) for name, arr in arrays.items()}
+    entries = []
+    offset = 0
+    for name, arr in arrays.items():
+        entries.append({"name": name, "dtype": arr.dtype.str, "shape": list(arr.shape),
+                        "offset": offset, "nbytes": arr.nbytes})
+        offset = _aligned(offset + arr.nbytes)
+    header = json.dumps({"arrays": entries, "meta": meta or {}}).encode('utf-8')
+    data_start = _aligned(_PREFIX.size + len(header))
+    placed = [(data_start + entry["offset"], arrays[entry["name"]]) for entry in entries]
+    return header, placed, data_start + offset
+
+
+def encoded_size(arrays, meta=None):
+    """Number of bytes encode_arrays would produce"""
+    return _layout(arrays, meta)[2]
+
+
+def encode_into(buffer, arrays, meta=None):
+    """Encode named arrays into a writable buffer (e.g. shared memory); returns bytes used"""
+    header, placed, size = _layout(arrays, meta)
+    view = memoryview(buffer).cast('B')
+    if len(view) < size:
+        raise ValueError(f"Buffer of {len(view)} bytes is too small for {size} byte payload")
+    view[:_PREFIX.size] = _PREFIX.pack(MAGIC, FORMAT_VERSION, len(header))
+    view[_PREFIX.size:_PREFIX.size + len(header)] = header
+    for offset, arr in placed:
+        view[offset:offset + arr.nbytes] = memoryview(arr).cast('B')
+    return size
+
+
+def encode_arrays(arrays, meta=None):
+    """Encode named arrays (and JSON-serializable meta) into one binary payload"""
+    buffer = bytearray(encoded_size(arrays, meta))
+    encode_into(buffer, arrays, meta)
+    return bytes(buffer)
+
+
+def is_binary(payload):
+    return bytes(payload[:len(MAGIC)]) == MAGIC
+
+
+def decode_arrays(buffer):
+    """Return ({name: array}, meta) viewing the payload buffer without copying.
+
+    Arrays are read-only when the buffer is (e.g. bytes from Redis).
+    """
+    magic, version, header_len = _PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Payload is not in the binary state format")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported state format version: {version}")
+    header = json.loads(bytes(memoryview(buffer)[_PREFIX.size:_PREFIX.size + header_len]))
+    data_start = _aligned(_PREFIX.size + header_len)
+
+    arrays = {}
+    for entry in header["arrays"]:
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        arrays[entry["name"]] = np.frombuffer(
+            buffer, dtype=dtype, count=count, offset=data_start + entry["offset"]
+        ).reshape(entry["shape"])
+    return arrays, header["meta"]
+
+
+def dumps(obj):
+    """Serialize a cache value: arrays, states and row indexes in the binary format, anything else pickled"""
+    if isinstance(obj, SimulationState):
+        return encode_state(obj)
+    if isinstance(obj, RowIndex):
+        return encode_row_index(obj)
+    if isinstance(obj, np.ndarray):
+        return encode_arrays({"values": obj})
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(payload):
+    """Inverse of dumps; legacy pickle payloads are recognised by the missing magic"""
+    if not is_binary(payload):
+        return pickle.loads(payload)
+    arrays, meta = decode_arrays(payload)
+    if meta.get("kind") == "simulation_state":
+        return _state_from_arrays(arrays)
+    if meta.get("kind") == "row_index":
+        return RowIndex.from_arrays(arrays, meta)
+    if list(arrays) == ["values"]:
+        return arrays["values"]
+    return arrays, meta
+
+
+def encode_state(state, meta=None):
+    """Encode a SimulationState; extra meta is stored alongside the arrays"""
+    return encode_arrays(
+        {name: getattr(state, name) for name in STATE_ARRAYS},
+        dict(meta or {}, kind="simulation_state")
+    )
+
+
+def encode_row_index(index):
+    """Encode a RowIndex; decoded by loads with RowIndex.from_arrays"""
+    meta, arrays = index.export()
+    return encode_arrays(arrays, dict(meta, kind="row_index"))
+
+
+def _state_from_arrays(arrays):
+    return SimulationState(**{name: arrays[name] for name in STATE_ARRAYS})
+
+
+def decode_state(buffer):
+    """Return (SimulationState, meta) viewing the payload buffer without copying"""
+    arrays, meta = decode_arrays(buffer)
+    if meta.get("kind") != "simulation_state":
+        raise ValueError("Payload does not hold a simulation state")
+    return _state_from_arrays(arrays), meta
+
+
+def write_state_file(path, state, meta=None):
+    with open(path, 'wb') as file:
+        file.write(encode_state(state, meta))
+
+
+def read_state_file(path):
+    """Memory-map a state file and decode it without reading the arrays into memory"""
+    with open(path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return decode_state(mapped)
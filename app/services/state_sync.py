@@ -0,0 +1,130 @@
+"""Set-based write-back of the evolved simulation state to the database.
+
+Each factor family is staged into a temporary table with chunked executemany
+inserts and applied with a single ``UPDATE ... FROM`` join, so no ORM object
+is loaded or flushed. Rows with missing (NaN) values are left alone.
+On SQLite the sync runs under the same relaxed pragmas as bulk seeding.
+
+The sync uses the app's engine, whose connections and pool are green once
+eventlet has patched the process, so it runs on the calling green thread and
+never through offload(); it yields to the hub between staging chunks.
+"""
+
+import time
+
+import numpy as np
+from sqlalchemy import Column, Float, Integer, MetaData, Table, update
+
+from app.services.model_representation import (
+    EXTERNAL_FACTOR_COLUMNS, INSTITUTIONAL_FACTOR_COLUMNS, INTERNAL_FACTOR_COLUMNS
+)
+from app.utils.build_flat_lookup import RowIndex
+from app.utils.sqlite_pragmas import load_pragmas
+from log.logger import logger
+
+DEFAULT_SYNC_CHUNK_SIZE = 50000
+
+# lower score bound of each grade and its points on a 5.0 scale
+GRADE_BOUNDS = np.array([0, 40, 45, 50, 60, 70], dtype=np.float64)
+GRADE_POINTS = np.array([0, 1, 2, 3, 4, 5], dtype=np.float64)
+
+
+def grade_points(scores):
+    return GRADE_POINTS[np.searchsorted(GRADE_BOUNDS, scores, side='right') - 1]
+
+
+class GradeBook:
+    """Running grade point average of every student row of a state; `index` is its row index when known"""
+
+    def __init__(self, state, index=None):
+        self.index = index if index is not None else RowIndex.build(state.simulation_ids, state.student_ids)
+        self.student_ids = state.student_ids.copy()
+        self.points = np.zeros(len(state), dtype=np.float64)
+        self.counts = np.zeros(len(state), dtype=np.int64)
+
+    def add(self, step):
+        rows = self.index.rows(step.simulation_ids, step.student_ids)
+        found = rows >= 0
+        # a step scores each student once, so the rows are unique
+        self.points[rows[found]] += grade_points(step.scores[found])
+        self.counts[rows[found]] += 1
+
+    def gpa(self):
+        """(student ids, GPA) of the students graded at least once"""
+        graded = self.counts > 0
+        return self.student_ids[graded], self.points[graded] / self.counts[graded]
+
+
+def _staging_table(name, key, columns):
+    return Table(
+        f"sync_{name}", MetaData(),
+        Column(key, Integer, primary_key=True),
+        *(Column(column, Float) for column in columns),
+        prefixes=['TEMPORARY'],
+    )
+
+
+def _sync_table(connection, target, key, keys, values, columns, chunk_size):
+    """Stage (keys, values) rows and update target.<columns> where target.<key> matches"""
+    complete = ~np.isnan(values).any(axis=1) if values.ndim == 2 else ~np.isnan(values)
+    keys, values = keys[complete], values[complete]
+    if not len(keys):
+        return 0
+
+    staging = _staging_table(target.name, key, columns)
+    staging.create(connection)
+    statement = (
+        update(target)
+        .values({column: staging.c[column] for column in columns})
+        .where(target.c[key] == staging.c[key])
+    )
+    names = (key, *columns)
+    values = values.reshape(len(keys), len(columns))
+    try:
+        for start in range(0, len(keys), chunk_size):
+            stop = start + chunk_size
+            rows = [dict(zip(names, row)) for row in zip(keys[start:stop].tolist(), *values[start:stop].T.tolist())]
+            connection.execute(staging.insert(), rows)
+            # let the hub serve other green threads between chunks
+            time.sleep(0)
+        # one join over the whole staging table; per-chunk updates would rescan the target each time
+        connection.execute(statement)
+    finally:
+        staging.drop(connection)
+    return len(keys)
+
+
+def sync_state(state, gpa=None, chunk_size=DEFAULT_SYNC_CHUNK_SIZE):
+    """Write factor arrays (and optionally (student ids, GPA)) back in one transaction"""
+    from app import db
+    from app.models import ExternalFactors, InstitutionalFactors, InternalFactors, Student
+
+    try:
+        with db.engine.connect() as connection, load_pragmas(connection), connection.begin():
+            synced = {
+                "internal_factors": _sync_table(
+                    connection, InternalFactors.__table__, "student_id", state.student_ids,
+                    state.internal_factors, INTERNAL_FACTOR_COLUMNS, chunk_size),
+                "external_factors": _sync_table(
+                    connection, ExternalFactors.__table__, "student_id", state.student_ids,
+                    state.external_factors, EXTERNAL_FACTOR_COLUMNS, chunk_size),
+                "institutional_factors": _sync_table(
+                    connection, InstitutionalFactors.__table__, "simulation_id",
+                    state.institutional_simulation_ids, state.institutional_factors,
+                    INSTITUTIONAL_FACTOR_COLUMNS, chunk_size),
+            }
+            if gpa is not None:
+                student_ids, values = gpa
+                synced["gpa"] = _sync_table(
+                    connection, Student.__table__, "id", student_ids, values, ("gpa",), chunk_size)
+        logger.info("Simulation state synced to the database: %s", synced)
+        return synced
+    except Exception as e:
+        logger.error("Error syncing simulation state to the database: %s", e)
+        raise RuntimeError(f"Error syncing simulation state: {str(e)}")
+
+
+def sync_in_app_context(app, state, gpa=None, chunk_size=DEFAULT_SYNC_CHUNK_SIZE):
+    """sync_state for callers outside the app context, e.g. a background green thread"""
+    with app.app_context():
+        return sync_state(state, gpa, chunk_size)
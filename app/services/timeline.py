@@ -0,0 +1,281 @@
+"""Seekable on-disk timeline of a simulation run.
+
+A run directory holds a manifest, a full keyframe of the state (in the binary
+state format) every ``keyframe_every`` steps, and an append-only log of one
+compact delta per step in between. Deltas are one of:
+
+* ``rng``: the run seed and step number that pick the step's random streams.
+  Replaying the step with the engine reproduces the factors exactly, for
+  inline and sharded runs alike; a delta is a few hundred bytes regardless
+  of the population size.
+* ``quantized``: the factor changes as int16 with one scale per factor
+  family. The recorder quantizes against its own reconstruction, so errors
+  do not accumulate between keyframes and replay is a single add per family.
+
+``rng`` is the default; ``quantized`` is lossy and stores about a quarter of
+the state per step, so it is opt-in for runs that cannot be replayed.
+
+``seek(step)`` maps the nearest keyframe at or before step and replays the
+deltas after it; a forward seek continues from the previously sought state.
+Only the newest ``retention`` timelines are kept, and the timelines recorded
+for a namespaced run are deleted with it.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+import uuid
+
+import numpy as np
+
+from app.services import state_format
+from app.services.simulation_engine import SimulationEngine
+from log.logger import logger
+
+MANIFEST = "manifest.json"
+DELTA_LOG = "deltas.log"
+DELTA_MODES = ("rng", "quantized")
+FACTOR_FAMILIES = ("internal_factors", "external_factors", "institutional_factors")
+QUANTIZED_MAX = np.iinfo(np.int16).max
+_LENGTH = struct.Struct('<Q')
+
+
+def inline_replay(engine, step, simulation_ids=None):
+    """Replay info of the step_batch of an engine drawing step `step`"""
+    return {"entropy": engine.streams.entropy, "step": step, "step_size": engine.STEP_SIZE,
+            "simulation_ids": None if simulation_ids is None else [int(i) for i in simulation_ids]}
+
+
+def replay_step(engine, state, replay):
+    """Redo one recorded step on state in place; engine is replaced when the seed differs"""
+    if engine is None or engine.streams.entropy != replay["entropy"]:
+        engine = SimulationEngine(replay["entropy"])
+    engine.step_batch(state, simulation_ids=replay["simulation_ids"], step_size=replay["step_size"],
+                      step=replay["step"])
+    return engine
+
+
+def _apply_quantized(values, quantized, scale):
+    # the recorder and replay share this so both reconstruct bit-identical values
+    values += quantized * values.dtype.type(scale)
+
+
+def _keyframe_name(step):
+    return f"keyframe-{step:08d}.sims"
+
+
+def _writable_copy(state):
+    return state.astype(state.dtype)
+
+
+def _map_log(directory):
+    """Read-only mapping of a run's delta log, None while it is empty"""
+    path = os.path.join(directory, DELTA_LOG)
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return None
+    with open(path, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def timeline_dir(root, run_id):
+    return os.path.join(root, run_id)
+
+
+def list_timelines(root):
+    """Manifests of every recorded run under root, newest first"""
+    runs = []
+    if os.path.isdir(root):
+        for run_id in os.listdir(root):
+            path = os.path.join(root, run_id, MANIFEST)
+            if os.path.exists(path):
+                with open(path) as file:
+                    runs.append(json.load(file))
+    return sorted(runs, key=lambda run: run["created"], reverse=True)
+
+
+def delete_timelines(root, run=None, keep=None):
+    """Delete the timelines recorded for namespaced run `run`, or all but the newest `keep`; returns their ids"""
+    timelines = list_timelines(root)
+    if run is not None:
+        doomed = [timeline for timeline in timelines if timeline["meta"].get("run") == run]
+    else:
+        doomed = timelines[keep:] if keep else []
+    for timeline in doomed:
+        shutil.rmtree(timeline_dir(root, timeline["run_id"]), ignore_errors=True)
+    if doomed:
+        logger.info("Deleted %d run timelines.", len(doomed))
+    return [timeline["run_id"] for timeline in doomed]
+
+
+class RunTimeline:
+    """Keyframes and per-step deltas of one run; record while running, seek afterwards"""
+
+    def __init__(self, directory, manifest):
+        self.directory = directory
+        self.manifest = manifest
+        self.keyframe_every = manifest["keyframe_every"]
+        self.deltas = manifest["deltas"]
+        self.keyframes = sorted(
+            int(name[len("keyframe-"):-len(".sims")])
+            for name in os.listdir(directory) if name.startswith("keyframe-")
+        )
+        self.offsets = {}
+        self.engine = None
+        self._log = None
+        self._reconstructed = None
+        self._cursor = None
+        self._index_log()
+
+    @classmethod
+    def create(cls, root, state, keyframe_every=50, deltas="rng", meta=None, retention=None):
+        """Start the timeline of a new run with a keyframe of its initial state.
+
+        With `retention`, older timelines are deleted so that it and the newest
+        retention - 1 others remain.
+        """
+        if deltas not in DELTA_MODES:
+            raise ValueError(f"Unknown timeline delta mode: {deltas}")
+        if retention:
+            delete_timelines(root, keep=retention - 1)
+        run_id = uuid.uuid4().hex[:12]
+        directory = timeline_dir(root, run_id)
+        os.makedirs(directory)
+        manifest = {"run_id": run_id, "created": time.time(), "keyframe_every": keyframe_every,
+                    "deltas": deltas, "students": len(state), "steps": 0, "meta": meta or {}}
+        timeline = cls(directory, manifest)
+        timeline._write_manifest()
+        timeline._keyframe(0, state)
+        logger.info("Recording run timeline %s (%s deltas, keyframe every %d steps).", run_id, deltas, keyframe_every)
+        return timeline
+
+    @classmethod
+    def open(cls, root, run_id):
+        directory = timeline_dir(root, run_id)
+        path = os.path.join(directory, MANIFEST)
+        if not os.path.exists(path):
+            raise KeyError(run_id)
+        with open(path) as file:
+            return cls(directory, json.load(file))
+
+    @property
+    def run_id(self):
+        return self.manifest["run_id"]
+
+    @property
+    def steps(self):
+        return self.manifest["steps"]
+
+    def _write_manifest(self):
+        path = os.path.join(self.directory, MANIFEST)
+        with open(f"{path}.tmp", 'w') as file:
+            json.dump(self.manifest, file)
+        os.replace(f"{path}.tmp", path)
+
+    def _index_log(self):
+        """Offsets of every delta record; headers are decoded from a read-only mapping"""
+        data = _map_log(self.directory)
+        if data is None:
+            return
+        offset = 0
+        while offset + _LENGTH.size <= len(data):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            start = offset + _LENGTH.size
+            if start + length > len(data):
+                # a record cut short by a crash; everything before it is still usable
+                break
+            _, meta = state_format.decode_arrays(memoryview(data)[start:start + length])
+            self.offsets[meta["step"]] = (start, length)
+            offset = start + length
+
+    def _keyframe(self, step, state):
+        state_format.write_state_file(os.path.join(self.directory, _keyframe_name(step)), state, {"step": step})
+        self.keyframes.append(step)
+        if self.deltas == "quantized":
+            self._reconstructed = {family: getattr(state, family).copy() for family in FACTOR_FAMILIES}
+
+    def _append(self, step, arrays, meta):
+        if self._log is None:
+            self._log = open(os.path.join(self.directory, DELTA_LOG), 'ab')
+        payload = state_format.encode_arrays(arrays, dict(meta, step=step))
+        self._log.write(_LENGTH.pack(len(payload)))
+        self.offsets[step] = (self._log.tell(), len(payload))
+        self._log.write(payload)
+
+    def _quantize(self, state):
+        arrays, scales = {}, {}
+        for family in FACTOR_FAMILIES:
+            reconstructed = self._reconstructed[family]
+            change = getattr(state, family) - reconstructed
+            largest = float(np.abs(change).max()) if change.size else 0.0
+            scale = largest / QUANTIZED_MAX if largest else 1.0
+            quantized = np.rint(change / scale).astype(np.int16)
+            _apply_quantized(reconstructed, quantized, scale)
+            arrays[family], scales[family] = quantized, scale
+        return arrays, {"kind": "quantized", "scales": scales}
+
+    def record(self, step, state, replay=None):
+        """Record the state after `step`; `replay` (rng mode) describes how the step was drawn"""
+        if step % self.keyframe_every == 0:
+            self._keyframe(step, state)
+        elif self.deltas == "rng":
+            if replay is None:
+                raise ValueError("rng timelines need the replay info of every step")
+            self._append(step, {}, {"kind": "rng", "replay": replay})
+        else:
+            arrays, meta = self._quantize(state)
+            self._append(step, arrays, meta)
+        self.manifest["steps"] = step
+
+    def close(self):
+        """Flush the log and publish the recorded step count"""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        self._reconstructed = None
+        self._write_manifest()
+
+    def _delta(self, data, step):
+        if step not in self.offsets:
+            raise ValueError(f"Timeline {self.run_id} has no delta for step {step}")
+        start, length = self.offsets[step]
+        return state_format.decode_arrays(memoryview(data)[start:start + length])
+
+    def _replay(self, state, data, step):
+        arrays, meta = self._delta(data, step)
+        if meta["kind"] == "rng":
+            self.engine = replay_step(self.engine, state, meta["replay"])
+        else:
+            for family in FACTOR_FAMILIES:
+                _apply_quantized(getattr(state, family), arrays[family], meta["scales"][family])
+
+    def seek(self, step):
+        """State of the run after `step`; a private copy the caller may modify"""
+        try:
+            if not 0 <= step <= self.steps:
+                raise ValueError(f"Step {step} is outside the recorded 0..{self.steps}")
+            started = time.perf_counter()
+            keyframe = max(k for k in self.keyframes if k <= step)
+            if self._cursor is not None and keyframe <= self._cursor[0] <= step:
+                current, state = self._cursor
+            else:
+                current = keyframe
+                state, _ = state_format.read_state_file(os.path.join(self.directory, _keyframe_name(keyframe)))
+                state = _writable_copy(state)
+
+            if current < step:
+                if self._log is not None:
+                    self._log.flush()
+                # only the pages of the replayed deltas are read
+                data = _map_log(self.directory)
+                for delta_step in range(current + 1, step + 1):
+                    self._replay(state, data, delta_step)
+            self._cursor = (step, state)
+            logger.debug("Timeline %s sought to step %d from step %d in %.3fs.",
+                         self.run_id, step, current, time.perf_counter() - started)
+            return _writable_copy(state)
+        except Exception as e:
+            logger.error("Error seeking run timeline: %s", e)
+            raise RuntimeError(f"Error seeking run timeline: {str(e)}")
@@ -0,0 +1,185 @@
+"""Opt-in span tracer exported in the Chrome trace-event format.
+
+Spans are complete events ("ph": "X") of one green thread: the run loop, the
+live emitter, a request handler or the native thread an offloaded call runs
+in. They are kept in a ring buffer, so a long run keeps only its most recent
+spans. Load the JSON of ``Tracer.export`` in chrome://tracing or
+https://ui.perfetto.dev to see how the green threads interleave and where
+they block on offloaded work.
+
+Steps are sampled: only every ``sample_every``-th step of a run (and the
+first) records spans, and a span opened inside an unsampled step returns a
+shared no-op context. Disabled, a span costs one attribute check.
+"""
+
+import json
+import os
+import time
+from collections import deque
+
+import greenlet
+from eventlet import patcher
+
+_threading = patcher.original('threading')
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.category, self.started, time.perf_counter(), self.args)
+        return False
+
+
+class _StepSpan(_Span):
+    """Span of one run step; spans opened by the same green thread inside it inherit the step.
+
+    Unsampled steps record nothing but still set the step, so their inner
+    spans are skipped as well.
+    """
+
+    def __init__(self, tracer, name, category, args, sampled):
+        super().__init__(tracer, name, category, args)
+        self.sampled = sampled
+
+    def __enter__(self):
+        key = id(greenlet.getcurrent())
+        self.previous = self.tracer.current_steps.get(key)
+        self.tracer.current_steps[key] = self.args["step"]
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        key = id(greenlet.getcurrent())
+        if self.previous is None:
+            self.tracer.current_steps.pop(key, None)
+        else:
+            self.tracer.current_steps[key] = self.previous
+        if self.sampled:
+            return super().__exit__(*exc)
+        return False
+
+
+class Tracer:
+    """Ring buffer of sampled spans; export() renders them as trace-event JSON"""
+
+    def __init__(self, capacity=100_000, sample_every=10, enabled=False):
+        self.enabled = enabled
+        self.sample_every = max(1, sample_every)
+        self.events = deque(maxlen=capacity)
+        self.epoch = time.perf_counter()
+        self.lock = _threading.Lock()
+        # greenlet id -> (tid, name) and greenlet id -> step the greenlet is tracing
+        self.threads = {}
+        self.current_steps = {}
+        self.dropped = 0
+
+    def configure(self, enabled=None, capacity=None, sample_every=None):
+        if capacity is not None and capacity != self.events.maxlen:
+            self.events = deque(self.events, maxlen=capacity)
+        if sample_every is not None:
+            self.sample_every = max(1, sample_every)
+        if enabled is not None:
+            self.enabled = enabled
+
+    def clear(self):
+        self.events.clear()
+        self.dropped = 0
+
+    def sampled(self, step):
+        return step is None or step == 1 or step % self.sample_every == 0
+
+    def _thread(self):
+        current = greenlet.getcurrent()
+        key = id(current)
+        thread = self.threads.get(key)
+        if thread is None:
+            native = _threading.current_thread().name
+            with self.lock:
+                thread = self.threads.setdefault(key, (len(self.threads) + 1, f"{native} / greenlet {key:#x}"))
+        return thread[0]
+
+    def span(self, name, category="simulation", step=None, **args):
+        """Context manager recording one span; step defaults to the enclosing step span of this green thread"""
+        if not self.enabled:
+            return NO_SPAN
+        if step is None:
+            step = self.current_steps.get(id(greenlet.getcurrent()))
+        if not self.sampled(step):
+            return NO_SPAN
+        if step is not None:
+            args["step"] = step
+        return _Span(self, name, category, args)
+
+    def traced(self, fn, name, category="simulation", step=None):
+        """fn wrapped in a span of the given step; for calls handed to another thread"""
+        def wrapper(*args, **kwargs):
+            with self.span(name, category, step=step):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def step(self, step, **args):
+        """Span of one run step, sampled every sample_every steps"""
+        if not self.enabled:
+            return NO_SPAN
+        args["step"] = step
+        return _StepSpan(self, "step", "run", args, self.sampled(step))
+
+    def context(self, step):
+        """Attribute the spans of this green thread to step without recording a span of its own"""
+        if not self.enabled:
+            return NO_SPAN
+        return _StepSpan(self, "step", "run", {"step": step}, sampled=False)
+
+    def record(self, name, category, started, finished, args):
+        if len(self.events) == self.events.maxlen:
+            self.dropped += 1
+        self.events.append((name, category, started, finished, os.getpid(), self._thread(), args))
+
+    def export(self):
+        """Buffered spans as a Chrome trace-event document"""
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "simulation"}}]
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in list(self.threads.values())
+        )
+        for name, category, started, finished, event_pid, tid, args in list(self.events):
+            events.append({
+                "name": name, "cat": category, "ph": "X", "pid": event_pid, "tid": tid,
+                "ts": round((started - self.epoch) * 1e6, 3), "dur": round((finished - started) * 1e6, 3),
+                "args": args,
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"sample_every": self.sample_every, "capacity": self.events.maxlen,
+                          "dropped": self.dropped},
+        }
+
+    def dump(self, path):
+        """Write export() to path"""
+        with open(path, 'w') as file:
+            json.dump(self.export(), file)
+        return path
+
+
+TRACER = Tracer()
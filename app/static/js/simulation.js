@@ -3,6 +3,9 @@
 class StudentSimulation {
     constructor() {
         this.simulationInterval = null;
+        this.socket = null;
+        // simulations of the streamed run that have not sent sim_complete yet
+        this.runningSimulations = new Set();
         this.performanceChart = null;
         this.factorsChart = null;
         this.chartConfig = {
@@ -130,8 +133,8 @@ class StudentSimulation {
             clearInterval(this.simulationInterval);
         }
         
-        // Run first step immediately
-        this.runSimulationStepSpawning();
+        // Run the steps server side and render frames pushed over Socket.IO
+        this.runSimulationStepSpawning(500);
         
         // Then set up interval
         // this.simulationInterval = setInterval(() => this.runSimulationStep(), 2000);
@@ -150,6 +153,10 @@ class StudentSimulation {
             clearInterval(this.simulationInterval);
             this.simulationInterval = null;
         }
+
+        if (this.socket && this.socket.connected) {
+            this.socket.emit('stop_simulation');
+        }
     }
 
     resetSimulation() {
@@ -208,73 +215,109 @@ class StudentSimulation {
             if (status) status.textContent = `Status: Error - ${error.message}`;
         }
     }
-    runSimulationStepSpawning() {
-        // Connect to Socket.IO
-        const socket = io("http://127.0.0.1:5000"); 
+    handleStepRecord(record) {
+        if (record.status === 'error') {
+            throw new Error(record.message);
+        }
+        if (!record.simulations) return;
+
+        // one line per simulation: its mean score, or per-student lines when detail was requested
+        const results = [];
+        record.simulations.forEach(simulation => {
+            if (simulation.student_ids) {
+                simulation.student_ids.forEach((studentId, i) => {
+                    results.push({ label: `Student ${studentId}`, key: studentId, score: simulation.student_scores[i] });
+                });
+            } else {
+                results.push({
+                    label: `Simulation ${simulation.simulation_id} mean`,
+                    key: simulation.simulation_id,
+                    score: simulation.scores.mean
+                });
+            }
+        });
+        this.updateCharts(results, record.step);
+    }
 
-        // Emit an event to start the simulation
-        
-        socket.emit('start_simulation_spawning');
-        
+    runSimulationStepSpawning(steps) {
+        // Connect to Socket.IO once and reuse the connection for later runs
+        if (!this.socket) {
+            this.socket = io("http://127.0.0.1:5000");
+
+            this.socket.on('sim_started', data => {
+                console.log(`Simulation ${data.sim_id} started`);
+                this.runningSimulations.add(data.sim_id);
+            });
 
-        // // Listen for confirmation that the simulation started
-        // socket.on('sim_started', data => {
-        //     console.log(`Simulation ${data.sim_id} started`);
-        //     displayMessage(`Simulation ${data.sim_id} started`);
-        // });
-
-        // // Listen for live updates
-        // socket.on('sim_update', data => {
-        //     console.log(`Progress: ${data.progress}`);
-        //     displayMessage(data.progress);
-        // });
-
-        // // Listen for simulation completion
-        // socket.on('sim_complete', data => {
-        //     console.log(`Simulation ${data.sim_id} complete!`);
-        //     displayMessage(`Simulation ${data.sim_id} complete!`);
-        // });
-
-        // // Helper function to show updates on the page
-        // function displayMessage(msg) {
-        //     const log = document.getElementById("log");
-        //     log.innerHTML += `<p>${msg}</p>`;
+            // frames are coalesced server side; acknowledging one lets the next through
+            this.socket.on('sim_update', (frame, ack) => {
+                this.handleStepRecord({ step: frame.step, simulations: [frame] });
+                if (ack) ack();
+            });
+
+            this.socket.on('sim_complete', data => {
+                console.log(`Simulation ${data.sim_id} complete after ${data.steps} steps`);
+                this.runningSimulations.delete(data.sim_id);
+                // the run is over once its last simulation completes
+                if (!this.runningSimulations.size) this.pauseSimulation();
+            });
+
+            this.socket.on('sim_error', data => {
+                console.error('Simulation run error:', data.message);
+                this.runningSimulations.clear();
+                this.pauseSimulation();
+                const status = document.getElementById('status');
+                if (status) status.textContent = `Status: Error - ${data.message}`;
+            });
+        }
+
+        // Joins every simulation room and starts a run unless one is streaming
+        this.runningSimulations.clear();
+        this.socket.emit('start_simulation_spawning', { steps: steps });
     }
 // }
 
-    updateCharts(results) {
+    updateCharts(results, step) {
         if (!results || !results.length) {
             console.error('No results to update charts');
             return;
         }
 
-        const timestamp = new Date().toLocaleTimeString();
+        // frames of one step arrive per simulation; they share a single x-axis label
+        const label = step !== undefined ? `Step ${step}` : new Date().toLocaleTimeString();
         
         // Update performance chart
         if (this.performanceChart) {
-            if (this.performanceChart.data.labels.length > 20) {
-                this.performanceChart.data.labels.shift();
-                this.performanceChart.data.datasets.forEach(dataset => dataset.data.shift());
+            const labels = this.performanceChart.data.labels;
+            if (labels[labels.length - 1] !== label) {
+                if (labels.length > 20) {
+                    const dropped = labels.shift();
+                    this.performanceChart.data.datasets.forEach(dataset => {
+                        dataset.data = dataset.data.filter(point => point.x !== dropped);
+                    });
+                }
+                labels.push(label);
             }
             
-            this.performanceChart.data.labels.push(timestamp);
-            
             results.forEach(result => {
+                const name = result.label || `Student ${result.student_id}`;
+                const key = result.key !== undefined ? result.key : result.student_id;
                 let dataset = this.performanceChart.data.datasets.find(
-                    ds => ds.label === `Student ${result.student_id}`
+                    ds => ds.label === name
                 );
                 
                 if (!dataset) {
                     dataset = {
-                        label: `Student ${result.student_id}`,
+                        label: name,
                         data: [],
-                        borderColor: `hsl(${result.student_id * 137.508}deg, 70%, 50%)`,
+                        borderColor: `hsl(${key * 137.508}deg, 70%, 50%)`,
                         tension: 0.4
                     };
                     this.performanceChart.data.datasets.push(dataset);
                 }
                 
-                dataset.data.push(result.score);
+                // points carry their label, so coalesced (skipped) steps leave gaps instead of shifting lines
+                dataset.data.push({ x: label, y: result.score });
             });
             
             this.performanceChart.update();
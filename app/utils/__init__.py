@@ -11,7 +11,7 @@ def random_from_enum(
     weight: Optional[Dict[S, int]] = None
 ) -> S:
     available_choices = list(choices)
-    logger.debug(f"Random selection from enum called with choices: {available_choices} and weights: {weight}")
+    logger.debug("Random selection from enum called with choices: %s and weights: %s", available_choices, weight)
 
     if weight is None:
         selected = secrets.choice(available_choices)
@@ -22,12 +22,12 @@ def random_from_enum(
     weighted_choices = available_choices.copy()
     for item in weight:
         if item not in available_choices:
-            logger.warning(f"Weight provided for invalid enum item: {item}")
+            logger.warning("Weight provided for invalid enum item: %s", item)
             continue
         weighted_choices.extend([item] * weight[item])
 
     selected = secrets.choice(weighted_choices)
-    logger.info(f"Selected {selected} from enum with weights")
+    logger.debug("Selected %s from enum with weights", selected)
     return selected
 
 
@@ -38,7 +38,7 @@ def random_from_list(
     data: List[T],
     weight: Optional[Dict[T, int]] = None
 ) -> T:
-    logger.debug(f"Random selection from list called with data: {data} and weights: {weight}")
+    logger.debug("Random selection from list called with data: %s and weights: %s", data, weight)
 
     if weight is None:
         selected = secrets.choice(data)
@@ -49,10 +49,10 @@ def random_from_list(
     weighted_choices = data.copy()
     for item in weight:
         if item not in data:
-            logger.warning(f"Weight provided for item not in list: {item}")
+            logger.warning("Weight provided for item not in list: %s", item)
             continue
         weighted_choices.extend([item] * weight[item])
 
     selected = secrets.choice(weighted_choices)
-    logger.info(f"Selected {selected} from list with weights")
+    logger.debug("Selected %s from list with weights", selected)
     return selected
@@ -1,46 +1,146 @@
 # helper function
-from typing import Dict, Tuple, Any
+import numpy as np
 from log.logger import logger
 
-def build_lookup(mem_factor, mem_factor_identitier):
-    """Helper function to help lookup of simulation id and student id"""
-    try: 
+
+class RowIndex:
+    """Dense (simulation_id, student_id) -> row offset mapping.
+
+    Student ids are database primary keys, so they are stored in flat arrays
+    indexed by ``student_id - base``: one holds the row offset (-1 when
+    absent), the other the simulation that owns the student.
+    """
+
+    def __init__(self):
+        self.base = 0
+        self._rows = np.empty(0, dtype=np.int64)
+        self._simulations = np.empty(0, dtype=np.int64)
+        self._count = 0
+
+    @classmethod
+    def build(cls, simulation_ids, student_ids):
+        """Index rows in a single pass; row offsets follow the order of the given ids"""
+        index = cls()
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        if not len(student_ids):
+            return index
+
+        index.base = int(student_ids.min())
+        span = int(student_ids.max()) - index.base + 1
+        index._rows = np.full(span, -1, dtype=np.int64)
+        index._simulations = np.full(span, -1, dtype=np.int64)
+
+        slots = student_ids - index.base
+        index._rows[slots] = np.arange(len(student_ids), dtype=np.int64)
+        index._simulations[slots] = simulation_ids
+        index._count = int(np.count_nonzero(index._rows >= 0))
+        if index._count != len(student_ids):
+            raise ValueError("Duplicate student ids cannot be indexed")
+        return index
+
+    def export(self):
+        """(meta, arrays) describing the index, the inverse of from_export"""
+        return {"base": self.base, "count": self._count}, {"rows": self._rows, "simulations": self._simulations}
+
+    @classmethod
+    def from_export(cls, meta, arrays):
+        index = cls()
+        index.base = int(meta["base"])
+        index._count = int(meta["count"])
+        index._rows = arrays["rows"]
+        index._simulations = arrays["simulations"]
+        return index
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Index over exported arrays decoded from a read-only buffer; they are copied so it can grow"""
+        return cls.from_export(meta, {name: np.array(values) for name, values in arrays.items()})
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def _slot(self, student_id):
+        slot = student_id - self.base
+        return slot if 0 <= slot < len(self._rows) else -1
+
+    def get(self, simulation_id, student_id, default=None):
+        slot = self._slot(student_id)
+        if slot < 0 or self._rows[slot] < 0 or self._simulations[slot] != simulation_id:
+            return default
+        return int(self._rows[slot])
+
+    def rows(self, simulation_ids, student_ids):
+        """Vectorized lookup of row offsets, -1 where the pair is not indexed"""
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        slots = student_ids - self.base
+        in_range = (slots >= 0) & (slots < len(self._rows))
+        slots = np.where(in_range, slots, 0)
+        if not len(self._rows):
+            return np.full(len(student_ids), -1, dtype=np.int64)
+        found = in_range & (self._simulations[slots] == np.asarray(simulation_ids, dtype=np.int64))
+        return np.where(found, self._rows[slots], -1)
+
+    def student_rows(self, student_ids):
+        """Vectorized row offsets by student id alone, -1 where not indexed"""
+        student_ids = np.asarray(student_ids, dtype=np.int64)
+        if not len(self._rows):
+            return np.full(len(student_ids), -1, dtype=np.int64)
+        slots = student_ids - self.base
+        in_range = (slots >= 0) & (slots < len(self._rows))
+        return np.where(in_range, self._rows[np.where(in_range, slots, 0)], -1)
+
+    def _reserve(self, student_id):
+        if not len(self._rows):
+            self.base = student_id
+        if student_id < self.base:
+            grow = max(self.base - student_id, len(self._rows))
+            self._rows = np.concatenate([np.full(grow, -1, dtype=np.int64), self._rows])
+            self._simulations = np.concatenate([np.full(grow, -1, dtype=np.int64), self._simulations])
+            self.base -= grow
+        elif student_id - self.base >= len(self._rows):
+            grow = max(student_id - self.base + 1 - len(self._rows), len(self._rows))
+            self._rows = np.concatenate([self._rows, np.full(grow, -1, dtype=np.int64)])
+            self._simulations = np.concatenate([self._simulations, np.full(grow, -1, dtype=np.int64)])
+
+    def insert(self, simulation_id, student_id, row):
+        """Index a newly added student; capacity grows geometrically"""
+        self._reserve(student_id)
+        slot = student_id - self.base
+        if self._rows[slot] < 0:
+            self._count += 1
+        self._rows[slot] = row
+        self._simulations[slot] = simulation_id
+
+    def remove(self, simulation_id, student_id):
+        """Drop a student from the index and return its former row offset"""
+        row = self.get(simulation_id, student_id)
+        if row is None:
+            raise KeyError((simulation_id, student_id))
+        slot = student_id - self.base
+        self._rows[slot] = -1
+        self._simulations[slot] = -1
+        self._count -= 1
+        return row
+
+    def items(self):
+        slots = np.flatnonzero(self._rows >= 0)
+        for slot, simulation_id, row in zip(slots.tolist(), self._simulations[slots].tolist(), self._rows[slots].tolist()):
+            yield (simulation_id, slot + self.base), row
+
+
+def build_lookup(state):
+    """Build the (simulation id, student id) -> row offset index of a SimulationState"""
+    from app.services.metrics import STAGE_SECONDS
+    try:
         logger.info("Starting lookup...")
-        internal_flat_lookup: Dict[Tuple[int, int], Any] = {}
-        external_flat_lookup: Dict[Tuple[int, int], Any] = {}
-        institutional_flat_lookup: Dict[Tuple[int, int], Any] = {}
-
-        if mem_factor_identitier == "mem_internal_factor":
-            for (simulation_id, student_ids), values in mem_factor.items():
-                for value in values:
-                    for student_id in student_ids:
-                        if student_id == value.id:
-                            internal_flat_lookup[simulation_id, student_id] = value
-            
-            logger.info("Internal flat lookup fully loaded")
-            return internal_flat_lookup
-        
-        if mem_factor_identitier == "mem_external_factor":
-            for (simulation_id, student_ids), values in mem_factor.items():
-                for value in values:
-                    for student_id in student_ids:
-                        if student_id == value.id:
-                            external_flat_lookup[simulation_id, student_id] = value
-            
-            logger.info("External factors flat lookup fully loaded")
-            return external_flat_lookup
-
-        if mem_factor_identitier == "mem_institutional_factor":
-            for (simulation_id, student_ids), values in mem_factor.items():
-                for student_id in student_ids:
-                    for value in values:
-                        logger.debug(f"Checking institutional factor value: {value}")
-                        if simulation_id == value.id:
-                            institutional_flat_lookup[simulation_id, student_id] = value
-         
-            logger.info("Institutional flat lookup fully loaded")
-            return institutional_flat_lookup
+        with STAGE_SECONDS.time("build_lookup"):
+            lookup = RowIndex.build(state.simulation_ids, state.student_ids)
+        logger.info("Flat lookup fully loaded: %d students", len(lookup))
+        return lookup
 
     except Exception as e:
-         logger.error(f"Error during lookup of factors: {str(e)}")
-         raise RuntimeError(f"Error during lookup of factors: {str(e)}")
+        logger.error("Error during lookup of factors: %s", e)
+        raise RuntimeError(f"Error during lookup of factors: {str(e)}")
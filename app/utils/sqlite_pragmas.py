@@ -0,0 +1,31 @@
+"""Relaxed SQLite pragmas for bulk loads and write-backs"""
+
+from contextlib import contextmanager
+
+# relaxed durability while the load runs, restored afterwards
+SQLITE_LOAD_PRAGMAS = {
+    "synchronous": "OFF",
+    "journal_mode": "MEMORY",
+    "temp_store": "MEMORY",
+    "cache_size": "-200000",
+}
+
+
+@contextmanager
+def load_pragmas(connection):
+    """Apply SQLITE_LOAD_PRAGMAS for the duration of a load on SQLite connections"""
+    if connection.dialect.name != 'sqlite':
+        yield
+        return
+
+    previous = {name: connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in SQLITE_LOAD_PRAGMAS}
+    for name, value in SQLITE_LOAD_PRAGMAS.items():
+        connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+    connection.commit()
+    try:
+        yield
+    finally:
+        connection.rollback()
+        for name, value in previous.items():
+            connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+        connection.commit()
@@ -2,17 +2,19 @@ import eventlet
 eventlet.monkey_patch()
 from app import socketio
 
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room
 import json
 import traceback
 from sqlalchemy.orm import Session
 from datetime import datetime
 from app.services.cache import cache_simulation_data, get_cached_simulation_data
 
-from flask import (Blueprint, jsonify, redirect, render_template, request,
-                   url_for)
+from flask import (Blueprint, Response, current_app, jsonify, redirect,
+                   render_template, request, stream_with_context, url_for)
 
 from app.services.simulation_service import SimulationService
+from app.services.live import LiveBroadcaster, room_name
+from app.services.runs import RunNotFound, RunQuotaExceeded
 from app.services import loader
 from log.logger import logger
 
@@ -27,6 +29,21 @@ def landing_page():
     return render_template('index.html')
 
 
+@home_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Hot-path timings and counters in the Prometheus text exposition format."""
+    from app.services.metrics import REGISTRY
+
+    if not REGISTRY.enabled:
+        return jsonify({'status': 'error', 'message': 'Metrics are disabled'}), 404
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def requested_run():
+    """Run named by ?run=<id>; None is the shared state"""
+    return request.args.get('run') or None
+
+
 @home_bp.route('/simulation-setup', methods=['GET'])
 def simulation_setup():
     logger.debug("Rendering simulation setup form.")
@@ -146,7 +163,7 @@ def run_simulation_step():
         
         # logger.info()
         logger.debug("Running simulation step.")
-        result = run_simulation()
+        result = run_simulation(requested_run())
         # simulation_data = initialize_memory()
         # cache_simulation_data(simulation_data)
         # logger.info("cached simulation data successfully updated")
@@ -158,24 +175,306 @@ def run_simulation_step():
             'result': result
         }), 200
 
+    except RunNotFound as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
     except Exception as e:
         logger.exception("Error running simulation step.")
         return jsonify(f'error {str(e)}'), 500
     
 
-@socketio.on('start_simulation_spawning')
-def start_simulation_threading():
-    import app
-    from app.services.simulation_service import SimulationService
+@simulate_bp.route('/api/run_steps', methods=['POST'])
+def run_simulation_steps():
+    """Run n steps in this request and stream every `every`-th step as NDJSON.
+
+    Records carry per-simulation aggregates; ``detail=students`` adds the
+    per-student scores and ``run=<id>`` steps a namespaced run.
+    """
+    from app.services import run_simulation_steps as run_steps
+    from app.services.offload import offload
+    from app.services.runs import get_runs
+    from app.services.tracing import TRACER
+
+    num_steps = request.args.get('n', type=int)
+    every = request.args.get('every', 1, type=int)
+    # per-student scores only on request; aggregates are population-size independent
+    detail = request.args.get('detail') == 'students'
+    max_steps = current_app.config.get('SIMULATION_MAX_RUN_STEPS', 10000)
+    if not num_steps or not 1 <= num_steps <= max_steps:
+        return jsonify({'status': 'error', 'message': f'n must be an integer between 1 and {max_steps}'}), 400
+    if not every or every < 1:
+        return jsonify({'status': 'error', 'message': 'every must be a positive integer'}), 400
+    run_id = requested_run()
+    if run_id is not None and get_runs().get(run_id) is None:
+        return jsonify({'status': 'error', 'message': f'Unknown run {run_id}'}), 404
+
+    def stream():
+        try:
+            for record in run_steps(num_steps, every=every, detail=detail, run_id=run_id):
+                # per-student payloads are large; encode them off the hub as well
+                with TRACER.context(record['step']):
+                    line = offload(json.dumps, record)
+                yield line + '\n'
+            yield json.dumps({'status': 'success', 'steps': num_steps}) + '\n'
+        except Exception as e:
+            logger.exception("Error running simulation steps.")
+            yield json.dumps({'status': 'error', 'message': str(e)}) + '\n'
+
+    logger.debug("Streaming %d simulation steps, every %d.", num_steps, every)
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+
+@simulate_bp.route('/api/commit_state', methods=['POST'])
+def commit_simulation_state():
+    """Write the evolved factors of the cached state back to the database."""
+    try:
+        from app.services import commit_cached_state
+
+        synced = commit_cached_state(requested_run())
+        logger.info("Simulation state committed to the database.")
+        return jsonify({'status': 'success', 'synced': synced}), 200
+
+    except RunNotFound as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except Exception as e:
+        logger.exception("Error committing simulation state.")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@simulate_bp.route('/api/snapshot', methods=['POST'])
+def snapshot_simulation_state():
+    """Write the cached state to the on-disk snapshot."""
+    try:
+        from app.services import snapshot_memory
+
+        manifest = snapshot_memory(run_id=requested_run())
+        return jsonify({'status': 'success', 'step': manifest['step'], 'students': manifest['students']}), 200
+
+    except RunNotFound as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except Exception as e:
+        logger.exception("Error writing simulation snapshot.")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@simulate_bp.route('/api/restore', methods=['POST'])
+def restore_simulation_state():
+    """Restore the cached state from the on-disk snapshot instead of reloading it from SQL."""
+    try:
+        from app.services import restore_memory
+
+        snapshot = restore_memory(requested_run())
+        if snapshot is None:
+            return jsonify({'status': 'error', 'message': 'No snapshot has been written yet'}), 404
+        return jsonify({
+            'status': 'success',
+            'step': snapshot.step,
+            'students': len(snapshot.state),
+            'redirect_url': url_for('simulate.simulation_page', _external=True)
+        }), 200
+
+    except RunNotFound as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except Exception as e:
+        logger.exception("Error restoring simulation snapshot.")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@simulate_bp.route('/api/runs', methods=['POST'])
+def create_run():
+    """Load the seeded database into a new namespaced run: {"label"}."""
+    try:
+        from app.services import load_memory
+        from app.services.runs import get_runs
+
+        data = request.get_json(silent=True) or {}
+        run = get_runs().create(load_memory(), label=data.get('label'))
+        return jsonify({'status': 'success', 'run': run}), 201
+
+    except RunQuotaExceeded as e:
+        logger.warning("Run rejected: %s", e)
+        return jsonify({'status': 'error', 'message': str(e)}), 507
+    except Exception as e:
+        logger.exception("Error creating simulation run.")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@simulate_bp.route('/api/runs', methods=['GET'])
+def list_runs():
+    """Namespaced runs, most recently used first."""
+    from app.services.runs import get_runs
+
+    return jsonify({'status': 'success', 'runs': get_runs().runs()}), 200
+
+
+@simulate_bp.route('/api/runs/<run_id>', methods=['DELETE'])
+def delete_run(run_id):
+    """Drop a namespaced run and its cached state and snapshot."""
+    from app.services.runs import get_runs
+
+    runs = get_runs()
+    meta = runs.get(run_id)
+    if meta is None:
+        return jsonify({'status': 'error', 'message': f'Unknown run {run_id}'}), 404
+    if meta['active_since'] is not None:
+        return jsonify({'status': 'error', 'message': f'Run {run_id} is stepping'}), 409
+    runs.evict(run_id)
+    broadcaster = live_broadcasters.pop(run_id, None)
+    if broadcaster:
+        # ends its emitter green thread; a stopped run still flushes and completes
+        broadcaster.stop()
+    return jsonify({'status': 'success', 'run_id': run_id}), 200
+
+
+@simulate_bp.route('/api/timelines', methods=['GET'])
+def list_run_timelines():
+    """Recorded run timelines, newest first."""
+    from app.services.timeline import list_timelines
+
+    runs = list_timelines(current_app.config.get('SIMULATION_TIMELINE_DIR', 'timelines'))
+    return jsonify({'status': 'success', 'runs': runs}), 200
+
+
+@simulate_bp.route('/api/timelines/<run_id>', methods=['GET'])
+def seek_run_timeline(run_id):
+    """Per-simulation factor means of a recorded run at ?step=N."""
+    try:
+        from app.services import timeline_state
+
+        step = request.args.get('step', type=int)
+        if step is None:
+            return jsonify({'status': 'error', 'message': 'step must be an integer'}), 400
+        result = timeline_state(run_id, step)
+        if result is None:
+            return jsonify({'status': 'error', 'message': f'Unknown run {run_id}'}), 404
+        return jsonify(dict(result, status='success')), 200
+
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error seeking run timeline.")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@simulate_bp.route('/api/trace', methods=['GET'])
+def export_trace():
+    """Buffered spans as Chrome trace-event JSON; ?clear=1 empties the buffer afterwards."""
+    from app.services.tracing import TRACER
+
+    trace = TRACER.export()
+    if request.args.get('clear') == '1':
+        TRACER.clear()
+    response = jsonify(trace)
+    response.headers['Content-Disposition'] = 'attachment; filename=simulation-trace.json'
+    return response, 200
+
+
+@simulate_bp.route('/api/trace', methods=['POST'])
+def configure_trace():
+    """Turn tracing on or off and set its sampling: {"enabled", "sample_every", "capacity"}."""
+    from app.services.tracing import TRACER
+
+    data = request.get_json(silent=True) or {}
     try:
-        with app.app_context():
-            simulation_service = SimulationService()
+        sample_every = int(data['sample_every']) if 'sample_every' in data else None
+        capacity = int(data['capacity']) if 'capacity' in data else None
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'sample_every and capacity must be integers'}), 400
+    if (sample_every is not None and sample_every < 1) or (capacity is not None and capacity < 1):
+        return jsonify({'status': 'error', 'message': 'sample_every and capacity must be positive'}), 400
+
+    TRACER.configure(enabled=bool(data['enabled']) if 'enabled' in data else None,
+                     capacity=capacity, sample_every=sample_every)
+    logger.info("Tracing %s, every %d steps.", 'enabled' if TRACER.enabled else 'disabled', TRACER.sample_every)
+    return jsonify({'status': 'success', 'enabled': TRACER.enabled, 'sample_every': TRACER.sample_every,
+                    'capacity': TRACER.events.maxlen}), 200
+
 
-            simulations = simulation_service.sim_model 
+# one broadcaster per run; None streams the shared state
+live_broadcasters = {None: LiveBroadcaster(socketio)}
 
-            for simulation in simulations:
-                eventlet.spawn(simulation_service.process_simulation, simulation)
-                emit('sim_started', {'sim_id': simulation.id})
+
+def live_broadcaster(run_id=None):
+    broadcaster = live_broadcasters.get(run_id)
+    if broadcaster is None:
+        broadcaster = live_broadcasters[run_id] = LiveBroadcaster(socketio, run_id=run_id)
+    return broadcaster
+
+
+def watched_simulation_ids(data):
+    """Simulation ids requested by a client, or every simulation"""
+    from app.services.registry import get_registry
+
+    requested = (data or {}).get('simulation_ids')
+    if requested:
+        return [int(simulation_id) for simulation_id in requested]
+    return get_registry().ids()
+
+
+@socketio.on('watch_simulation')
+def watch_simulation(data=None):
+    """Join the rooms of the requested simulations of a run (data["run"], default the shared state)"""
+    run_id = (data or {}).get('run') or None
+    simulation_ids = watched_simulation_ids(data)
+    for simulation_id in simulation_ids:
+        join_room(room_name(simulation_id, run_id))
+    return {'simulation_ids': simulation_ids, 'run': run_id}
+
+
+def stream_settings(data, config):
+    """(steps, fps) of a streamed run requested by a client; ValueError when they are not positive numbers"""
+    data = data or {}
+    try:
+        steps, fps = data.get('steps'), data.get('fps')
+        num_steps = int(config.get('SIMULATION_STREAM_STEPS', 500) if steps is None else steps)
+        max_fps = float(config.get('SIMULATION_STREAM_FPS', 10))
+        fps = max_fps if fps is None else float(fps)
+    except (TypeError, ValueError):
+        raise ValueError("steps and fps must be numbers")
+    if num_steps < 1 or not fps > 0:
+        raise ValueError("steps and fps must be positive")
+    # clients may slow the stream down, not speed it up past the configured rate
+    return min(num_steps, config.get('SIMULATION_MAX_RUN_STEPS', 10000)), min(fps, max_fps)
+
+
+@socketio.on('start_simulation_spawning')
+def start_simulation_threading(data=None):
+    """Watch the simulations and start a streamed run unless one is already going"""
+    from app.services.runs import get_runs
+
+    app = current_app._get_current_object()
+    try:
+        run_id = (data or {}).get('run') or None
+        if run_id is not None and get_runs().get(run_id) is None:
+            emit('sim_error', {'message': f'Unknown run {run_id}'})
+            return
+        try:
+            num_steps, fps = stream_settings(data, app.config)
+        except ValueError as e:
+            emit('sim_error', {'message': str(e)})
+            return
+        simulation_ids = watch_simulation(data)['simulation_ids']
+        for simulation_id in simulation_ids:
+            emit('sim_started', {'sim_id': simulation_id})
+
+        started = live_broadcaster(run_id).start(
+            app, num_steps,
+            fps=fps,
+            max_in_flight=app.config.get('SIMULATION_STREAM_MAX_IN_FLIGHT', 2)
+        )
+        if not started:
+            logger.info("Simulation run already streaming; client joined it.")
     except:
         logger.error(f"Error spawning simulations: ", exc_info=True)
 
+
+@socketio.on('stop_simulation')
+def stop_simulation(data=None):
+    broadcaster = live_broadcasters.get((data or {}).get('run') or None)
+    if broadcaster:
+        broadcaster.stop()
+
+
+@socketio.on('disconnect')
+def forget_client():
+    for broadcaster in list(live_broadcasters.values()):
+        broadcaster.forget(request.sid)
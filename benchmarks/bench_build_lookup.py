@@ -0,0 +1,54 @@
+"""Scaling benchmark for the student row index builder.
+
+Run with ``python -m benchmarks.bench_build_lookup``. Per-row cost should stay
+flat as the population grows, i.e. build time scales linearly.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.utils.build_flat_lookup import RowIndex
+
+
+def synthetic_ids(num_students, num_simulations, seed=0):
+    rng = np.random.default_rng(seed)
+    simulation_ids = np.sort(rng.integers(1, num_simulations + 1, size=num_students))
+    student_ids = rng.permutation(num_students) + 1
+    return simulation_ids, student_ids
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes, num_simulations, repeat):
+    print(f"{'students':>10} {'build s':>10} {'ns/row':>8} {'lookup ns/row':>14} {'insert+remove us':>17}")
+    for size in sizes:
+        simulation_ids, student_ids = synthetic_ids(size, num_simulations)
+        build = best_of(repeat, lambda: RowIndex.build(simulation_ids, student_ids))
+        index = RowIndex.build(simulation_ids, student_ids)
+        lookup = best_of(repeat, lambda: index.rows(simulation_ids, student_ids))
+
+        def churn():
+            index.insert(1, size + 1, size)
+            index.remove(1, size + 1)
+        churn_time = best_of(repeat, churn)
+
+        print(f"{size:>10} {build:>10.4f} {build / size * 1e9:>8.1f} "
+              f"{lookup / size * 1e9:>14.1f} {churn_time * 1e6:>17.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 5_000_000])
+    parser.add_argument('--simulations', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.sizes, args.simulations, args.repeat)
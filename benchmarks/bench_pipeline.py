@@ -0,0 +1,215 @@
+"""End-to-end benchmark of the seed -> load -> lookup -> cache -> step pipeline.
+
+Run with ``python -m benchmarks.bench_pipeline`` from the repository root.
+Every size is seeded into a throwaway SQLite database (never the configured
+one) and cached in an in-process Redis stand-in. For each stage the report
+gives wall time, rows per second and the process peak RSS while it ran.
+
+``--output results.json`` saves the run; ``--baseline results.json`` compares
+against a saved run and exits with status 1 when a stage is slower (or uses
+more memory) than the baseline by more than the thresholds.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+# the ORM loader materialises one object per factor row; above this it only costs minutes
+DEFAULT_ORM_LIMIT = 100_000
+# stages faster than this are too noisy to flag
+NOISE_FLOOR_SECONDS = 0.05
+
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux); False where unsupported"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak resident set size in bytes since the last reset"""
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def measure(results, stage, rows, fn, *args, **kwargs):
+    """Run fn once and record its time, throughput and peak RSS under results[stage]"""
+    reset_peak_rss()
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    results[stage] = {
+        "seconds": seconds,
+        "rows": rows,
+        "rows_per_second": rows / seconds if seconds else None,
+        "peak_rss_bytes": peak_rss(),
+    }
+    print(f"  {stage:<24} {seconds:>9.3f}s {rows / seconds if seconds else 0:>14,.0f} rows/s "
+          f"{results[stage]['peak_rss_bytes'] / 2**20:>9.1f} MiB peak")
+    return value
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_size(app, size, universities, steps, orm_limit):
+    from app.services import cache
+    from app.services.loader import load_initial_data, load_initial_state
+    from app.services.memory_state import state_wrapper
+    from app.services.registry import get_registry
+    from app.services.simulation_service import SimulationService
+    from app.utils.build_flat_lookup import build_lookup
+    from database_population.seeds import seed_data
+    from benchmarks.in_process_redis import InProcessRedis
+
+    results = {}
+    print(f"{size:,} students")
+    with app.app_context():
+        # seed_data already talks to the cache (database generation)
+        cache.redis_client = InProcessRedis()
+        measure(results, "seed_data", size, seed_data, universities, size, progress=lambda *args: None, seed=0)
+
+        if size <= orm_limit:
+            loaded = measure(results, "load_initial_data", size, load_initial_data)
+            measure(results, "state_wrapper", size, state_wrapper, loaded)
+            del loaded
+        state = measure(results, "load_initial_state", size, load_initial_state)
+        index = measure(results, "build_lookup", size, build_lookup, state)
+
+        measure(results, "cache_lookup_data", size, cache.cache_lookup_data, index, cache.LOOKUP_KEY)
+        measure(results, "get_cached_lookup_data", size, cache.get_cached_lookup_data, cache.LOOKUP_KEY)
+        measure(results, "cache_state_snapshot", size, cache.cache_state_snapshot, state)
+        measure(results, "get_cached_state", size, cache.get_cached_state)
+
+        measure(results, "simulation_registry_refresh", size, get_registry().refresh)
+        service = measure(results, "simulation_service_init", size, SimulationService, seed=0)
+
+        def step():
+            number = service.next_step()
+            for simulation in service.simulations:
+                service.process_simulation(simulation, step=number)
+
+        for number in range(1, steps + 1):
+            measure(results, f"process_simulation_step_{number}", size, step)
+        step_times = [results[f"process_simulation_step_{number}"]["seconds"] for number in range(1, steps + 1)]
+        if step_times:
+            best = min(step_times)
+            results["process_simulation_step"] = {
+                "seconds": best, "rows": size, "rows_per_second": size / best if best else None,
+                "peak_rss_bytes": max(results[f"process_simulation_step_{number}"]["peak_rss_bytes"]
+                                      for number in range(1, steps + 1)),
+            }
+        results["cache_bytes"] = {"bytes": cache.redis_client.nbytes}
+    return results
+
+
+def compare(current, baseline, threshold, memory_threshold):
+    """Print stage-by-stage ratios; returns the list of regressions"""
+    regressions = []
+    print(f"{'students':>10} {'stage':<26} {'baseline s':>11} {'current s':>10} {'ratio':>7} {'peak ratio':>11}")
+    for size, stages in current["results"].items():
+        for stage, result in stages.items():
+            previous = baseline["results"].get(size, {}).get(stage)
+            if not previous or "seconds" not in result or stage.startswith("process_simulation_step_"):
+                continue
+            ratio = result["seconds"] / previous["seconds"] if previous["seconds"] else 1.0
+            memory_ratio = result["peak_rss_bytes"] / previous["peak_rss_bytes"] if previous["peak_rss_bytes"] else 1.0
+            flags = []
+            if ratio > 1 + threshold and result["seconds"] >= NOISE_FLOOR_SECONDS:
+                flags.append("SLOWER")
+            if memory_ratio > 1 + memory_threshold:
+                flags.append("MEMORY")
+            if flags:
+                regressions.append((size, stage, flags))
+            print(f"{size:>10} {stage:<26} {previous['seconds']:>11.3f} {result['seconds']:>10.3f} "
+                  f"{ratio:>7.2f} {memory_ratio:>11.2f} {' '.join(flags)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--universities', type=int, default=4, help="number of universities (simulations) to seed")
+    parser.add_argument('--steps', type=int, default=3, help="timed process_simulation steps per size")
+    parser.add_argument('--orm-limit', type=int, default=DEFAULT_ORM_LIMIT,
+                        help="largest size that also runs the ORM loader")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against a JSON file written by --output")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed fractional slowdown per stage")
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help="allowed fractional peak RSS growth")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-pipeline-')
+    database = os.path.join(workdir, 'bench.db')
+    # must be set before the app config is imported: seed_data drops every table
+    os.environ['DATABASE_URI'] = f'sqlite:///{database}'
+
+    import numpy as np
+    from app import create_app
+    from database_population.json_loader import load_university_data
+
+    app = create_app()
+    if app.config['SQLALCHEMY_DATABASE_URI'] != os.environ['DATABASE_URI']:
+        raise RuntimeError("Benchmark database is not in use; refusing to seed")
+    universities = [university['name'] for university in load_university_data()['universities']][:args.universities]
+
+    current = {
+        "meta": {
+            "created": time.time(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "universities": len(universities),
+            "steps": args.steps,
+        },
+        "results": {},
+    }
+    try:
+        for size in args.sizes:
+            current["results"][str(size)] = bench_size(app, size, universities, args.steps, args.orm_limit)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(current, baseline, args.threshold, args.memory_threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions against {args.baseline}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Per-student vs columnar synthetic population generation.
+
+Run with ``python -m benchmarks.bench_population``. The per-student column
+reproduces the draws the seeder used to make for every student; the columnar
+one is PopulationSampler.sample over the same plan.
+"""
+
+import argparse
+import time
+from random import choice, uniform
+from types import SimpleNamespace
+
+from app.constants import Sex
+from app.utils import random_from_enum, random_from_list
+from database_population.data_generation import (
+    EXTERNAL_FACTOR_RANGES, INTERNAL_FACTOR_RANGES,
+    generate_dob, generate_phone_number, random_factor_values
+)
+from database_population.json_loader import load_student_data
+from database_population.population import PopulationSampler, make_rng
+
+
+def synthetic_plan(num_universities=10, departments_per_university=12, courses_per_department=8):
+    plan = SimpleNamespace(university_ids=[], university_weights=[], simulation_ids={},
+                           department_ids={}, course_ids={})
+    rng = make_rng(0)
+    next_department, next_course = 1, 1
+    for uni_id in range(1, num_universities + 1):
+        plan.university_ids.append(uni_id)
+        plan.university_weights.append(float(rng.uniform(0.4, 0.9)))
+        plan.simulation_ids[uni_id] = uni_id
+        plan.department_ids[uni_id] = list(range(next_department, next_department + departments_per_university))
+        for dept_id in plan.department_ids[uni_id]:
+            plan.course_ids[dept_id] = list(range(next_course, next_course + courses_per_department))
+            next_course += courses_per_department
+        next_department += departments_per_university
+    return plan
+
+
+def per_student(plan, names, count):
+    universities = list(zip(plan.university_ids, plan.university_weights))
+    for _ in range(count):
+        university_id = max(universities, key=lambda uni: uni[1] * uniform(0.8, 1.2))[0]
+        choice(plan.department_ids[university_id])
+        sex = random_from_enum(Sex)
+        random_from_list(names["male_first_names"] if sex == Sex.M else names["female_first_names"])
+        random_from_list(names["last_names"])
+        generate_phone_number()
+        generate_dob()
+        random_factor_values(INTERNAL_FACTOR_RANGES)
+        random_factor_values(EXTERNAL_FACTOR_RANGES)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run(sizes, legacy_limit):
+    plan = synthetic_plan()
+    names = load_student_data()
+    print(f"{'students':>10} {'per-student s':>14} {'columnar s':>11} {'speedup':>8}")
+    for size in sizes:
+        sampler = PopulationSampler(plan, names, make_rng(0))
+        columnar = timed(lambda: sampler.sample(size))
+        # extrapolate the per-student loop past legacy_limit, its cost is linear
+        sample = min(size, legacy_limit)
+        legacy = timed(lambda: per_student(plan, names, sample)) * size / sample
+        print(f"{size:>10} {legacy:>14.3f} {columnar:>11.3f} {legacy / columnar:>7.0f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-limit', type=int, default=100_000,
+                        help='largest population timed with the per-student loop')
+    args = parser.parse_args()
+    run(args.sizes, args.legacy_limit)
@@ -0,0 +1,98 @@
+"""In-process stand-in for the Redis commands app/services/cache.py uses.
+
+Values are stored as bytes like a real server returns them, so cache
+round-trips still pay for serialization and pipelining structure, just not for
+the network. Keys do not expire. Only meant for benchmarks.
+"""
+
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class InProcessRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and _bytes(key) in self.data:
+            return None
+        self.data[_bytes(key)] = _bytes(value)
+        return True
+
+    def expire(self, key, seconds):
+        """Keys never expire in process; only reports whether the key exists"""
+        return _bytes(key) in self.data
+
+    def get(self, key):
+        return self.data.get(_bytes(key))
+
+    def delete(self, *keys):
+        return sum(self.data.pop(_bytes(key), None) is not None for key in keys)
+
+    def sadd(self, key, *members):
+        members = {_bytes(member) for member in members}
+        stored = self.data.setdefault(_bytes(key), set())
+        added = len(members - stored)
+        stored |= members
+        return added
+
+    def smembers(self, key):
+        return set(self.data.get(_bytes(key), set()))
+
+    def hset(self, key, mapping):
+        stored = self.data.setdefault(_bytes(key), {})
+        for field, value in mapping.items():
+            stored[_bytes(field)] = _bytes(value)
+        return len(mapping)
+
+    def hgetall(self, key):
+        return dict(self.data.get(_bytes(key), {}))
+
+    def hdel(self, key, *fields):
+        stored = self.data.get(_bytes(key), {})
+        return sum(stored.pop(_bytes(field), None) is not None for field in fields)
+
+    def incrby(self, key, amount):
+        return self.incr(key, amount)
+
+    def incr(self, key, amount=1):
+        value = int(self.data.get(_bytes(key), b'0')) + amount
+        self.data[_bytes(key)] = _bytes(value)
+        return value
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+    @property
+    def nbytes(self):
+        """Bytes of stored values, a proxy for the memory a server would use"""
+        total = 0
+        for value in self.data.values():
+            if isinstance(value, bytes):
+                total += len(value)
+            elif isinstance(value, dict):
+                total += sum(len(v) for v in value.values())
+        return total
+
+
+class _Pipeline:
+    """Queues commands and runs them in order on execute, like a MULTI/EXEC block"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
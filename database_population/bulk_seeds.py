@@ -0,0 +1,170 @@
+"""Bulk seeding of large student populations with chunked Core inserts"""
+
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app import db
+from app.utils.sqlite_pragmas import load_pragmas
+from database_population.json_loader import load_student_data
+from database_population.population import PopulationSampler, make_rng
+from log.logger import logger
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+# keeps each multi-row VALUES statement under common bind parameter limits
+MAX_BIND_PARAMS = 30_000
+
+
+class SeedingPlan:
+    """Plain ids and weights the row generator needs, detached from the ORM session"""
+
+    def __init__(self, universities, courses_map, departments_map):
+        from app.models import Simulation
+
+        self.university_ids = []
+        self.university_weights = []
+        self.simulation_ids = {}
+        self.department_ids = {}
+        self.course_ids = {}
+
+        for uni in universities:
+            departments = departments_map.get(uni.id, [])
+            if not departments:
+                logger.warning("No departments available for university %s (ID: %s)", uni.name, uni.id)
+                continue
+
+            simulation = db.session.query(Simulation).filter_by(university_id=uni.id).first()
+            factors = simulation.institutional_factors
+            weight = [
+                factors.facility_availability, factors.academic_guidance,
+                factors.class_size, factors.peer_support,
+                factors.financial_aid, factors.extracurricular_opportunities,
+                factors.cultural_norms, factors.peer_influence
+            ]
+            self.university_ids.append(uni.id)
+            self.university_weights.append(sum(weight) / len(weight))
+            self.simulation_ids[uni.id] = simulation.id
+            self.department_ids[uni.id] = [department.id for department in departments]
+            for department in departments:
+                self.course_ids[department.id] = [course.id for course in courses_map.get(department.id, [])]
+
+
+def _next_id(connection, table):
+    return connection.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar_one() + 1
+
+
+def insert_rows(connection, table, rows):
+    """Insert a chunk of row dicts using the fastest path of the dialect"""
+    if not rows:
+        return
+    if connection.dialect.name != 'sqlite' and connection.dialect.supports_multivalues_insert:
+        per_statement = max(1, MAX_BIND_PARAMS // len(rows[0]))
+        for start in range(0, len(rows), per_statement):
+            connection.execute(table.insert().values(rows[start:start + per_statement]))
+    else:
+        # SQLite reuses one prepared statement across executemany
+        connection.execute(table.insert(), rows)
+
+
+def generate_student_rows(sampler, count, next_ids):
+    """Build the rows of every seeded table for `count` students; advances next_ids"""
+    columns = sampler.sample(count)
+    now = datetime.utcnow()
+    student_ids = np.arange(next_ids["students"], next_ids["students"] + count)
+    next_ids["students"] += count
+
+    students = {
+        "id": student_ids.tolist(),
+        "simulation_id": columns["simulation_id"].tolist(),
+        "name": columns["name"].tolist(),
+        "phone_number": columns["phone_number"].tolist(),
+        "date_of_birth": columns["date_of_birth"].tolist(),
+        "gender": columns["gender"].tolist(),
+        "department_id": columns["department_id"].tolist(),
+        "university_id": columns["university_id"].tolist(),
+    }
+    rows = {"students": [dict(row, level=100, gpa=None) for row in transpose(students)]}
+
+    for table in ("internal_factors", "external_factors"):
+        factors = {
+            "id": list(range(next_ids[table], next_ids[table] + count)),
+            "student_id": students["id"],
+            "simulation_id": students["simulation_id"],
+            **{name: values.tolist() for name, values in columns[table].items()},
+        }
+        rows[table] = transpose(factors)
+        next_ids[table] += count
+
+    enrollments = columns["enrollments"]
+    num_enrollments = len(enrollments["student"])
+    rows["student_courses"] = [
+        {"id": enrollment_id, "student_id": student_id, "course_id": course_id,
+         "created_at": now, "updated_at": now}
+        for enrollment_id, student_id, course_id in zip(
+            range(next_ids["student_courses"], next_ids["student_courses"] + num_enrollments),
+            student_ids[enrollments["student"]].tolist(),
+            enrollments["course_id"].tolist(),
+        )
+    ]
+    next_ids["student_courses"] += num_enrollments
+    return rows
+
+
+def transpose(columns):
+    """Column lists to row dicts"""
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def log_progress(seeded, total):
+    logger.info("Seeded %d/%d students.", seeded, total)
+
+
+def bulk_seed_students(universities, courses_map, departments_map, num_of_students,
+                       chunk_size=DEFAULT_CHUNK_SIZE, progress=log_progress, seed=None):
+    """Seed students, their factors and enrollments in one transaction.
+
+    Ids are assigned up front so every table is written with chunked
+    executemany / multi-row VALUES inserts, without ORM flushes.
+    `progress(seeded, total)` is called after every chunk. Rows are drawn
+    column-wise by a PopulationSampler; a fixed `seed` reproduces the same
+    population for the same chunk size.
+    """
+    from app.models import Student, StudentCourse, InternalFactors, ExternalFactors
+
+    tables = {
+        "students": Student.__table__,
+        "internal_factors": InternalFactors.__table__,
+        "external_factors": ExternalFactors.__table__,
+        "student_courses": StudentCourse.__table__,
+    }
+    plan = SeedingPlan(universities, courses_map, departments_map)
+    if not plan.university_ids:
+        logger.warning("No universities or departments available, cannot seed students.")
+        return 0
+    sampler = PopulationSampler(plan, load_student_data(), make_rng(seed))
+    # release the session's locks before the bulk connection writes
+    db.session.commit()
+
+    try:
+        seeded = 0
+        with db.engine.connect() as connection, load_pragmas(connection):
+            with connection.begin():
+                next_ids = {name: _next_id(connection, table) for name, table in tables.items()}
+                while seeded < num_of_students:
+                    count = min(chunk_size, num_of_students - seeded)
+                    rows = generate_student_rows(sampler, count, next_ids)
+                    for name, table in tables.items():
+                        insert_rows(connection, table, rows[name])
+                    seeded += count
+                    if progress:
+                        progress(seeded, num_of_students)
+
+        logger.info("Seeded %d students.", seeded)
+        return seeded
+
+    except Exception as e:
+        logger.error("Error bulk seeding students: %s", e)
+        raise
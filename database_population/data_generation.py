@@ -6,7 +6,39 @@ from log.logger import logger
 from app.models import ExternalFactors, InternalFactors
 
 
+# (low, high) bounds of the uniform draw for each generated factor
+INTERNAL_FACTOR_RANGES = {
+    "goal_setting": (0.3, 0.95),
+    "personal_ambition": (0.5, 1.0),
+    "interest_subject": (0.5, 1.0),
+    "scheduling": (0.4, 0.9),
+    "prioritization": (0.4, 0.9),
+    "consistency": (0.4, 0.9),
+    "study_techniques": (0.4, 0.9),
+    "focus_study": (0.4, 0.9),
+    "self_assessment": (0.4, 0.9),
+}
+
+EXTERNAL_FACTOR_RANGES = {
+    "financial_stability": (0.4, 0.9),
+    "access_to_resources": (0.4, 0.9),
+    "family_support": (0.5, 1.0),
+    "textbooks_availability": (0.4, 0.9),
+    "internet_access": (0.4, 0.9),
+    "lab_materials": (0.4, 0.9),
+    "curriculum_relevance": (0.5, 0.9),
+    "teaching_quality": (0.5, 0.9),
+    "feedback_assessment": (0.4, 0.9),
+    "family_expectations": (0.5, 1.0),
+}
+
+
 # generator functions 
+def random_factor_values(factor_ranges):
+    """Draw one value for every factor in a {name: (low, high)} mapping"""
+    return {name: uniform(low, high) for name, (low, high) in factor_ranges.items()}
+
+
 def generate_phone_number():
     prefixes = ["080", "081", "090", "070"]
     prefix = random.choice(prefixes)
@@ -51,18 +83,11 @@ def generate_matriculation_number(university_name, department_name, year, count)
 
 def generate_internal_factors(student, simulation):
     """Generate realistic internal factors for a student"""
-    logger.debug(f"Generating internal factors for student id: {getattr(student, 'id', 'unknown')}, simulation id: {simulation.id}")
+    logger.debug("Generating internal factors for student id: %s, simulation id: %s",
+                 getattr(student, 'id', 'unknown'), simulation.id)
     student.internal_factors = InternalFactors(
         simulation_id=simulation.id,
-        goal_setting=uniform(0.3, 0.95),
-        personal_ambition=uniform(0.5, 1.0),
-        interest_subject=uniform(0.5, 1.0),
-        scheduling=uniform(0.4, 0.9),
-        prioritization=uniform(0.4, 0.9),
-        consistency=uniform(0.4, 0.9),
-        study_techniques=uniform(0.4, 0.9),
-        focus_study=uniform(0.4, 0.9),
-        self_assessment=uniform(0.4, 0.9)
+        **random_factor_values(INTERNAL_FACTOR_RANGES)
     )
     internal_factors = student.internal_factors
     # logger.info(f"Internal factors generated: {internal_factors}")
@@ -71,20 +96,12 @@ def generate_internal_factors(student, simulation):
 
 def generate_external_factors(student, simulation):
     """Generate realistic external factors for a student"""
-    logger.debug(f"Generating external factors for student id: {getattr(student, 'id', 'unknown')}, simulation id: {simulation.id}")
+    logger.debug("Generating external factors for student id: %s, simulation id: %s",
+                 getattr(student, 'id', 'unknown'), simulation.id)
     student.external_factors = ExternalFactors(
         simulation_id=simulation.id,
-        financial_stability=uniform(0.4, 0.9),
-        access_to_resources=uniform(0.4, 0.9),
-        family_support=uniform(0.5, 1.0),
-        textbooks_availability=uniform(0.4, 0.9),
-        internet_access=uniform(0.4, 0.9),
-        lab_materials=uniform(0.4, 0.9),
-        curriculum_relevance=uniform(0.5, 0.9),
-        teaching_quality=uniform(0.5, 0.9),
-        feedback_assessment=uniform(0.4, 0.9),
-        family_expectations=uniform(0.5, 1.0)
-)
+        **random_factor_values(EXTERNAL_FACTOR_RANGES)
+    )
     external_factors = student.external_factors
     # logger.info(f"External factors generated: {external_factors}")
     return external_factors
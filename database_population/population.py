@@ -0,0 +1,148 @@
+"""Columnar synthetic population generator driven by a seeded numpy Generator"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from database_population.data_generation import EXTERNAL_FACTOR_RANGES, INTERNAL_FACTOR_RANGES
+
+PHONE_PREFIXES = ["080", "081", "090", "070"]
+PHONE_DIGITS = 8
+
+# index order of the sex column
+SEXES = ["Male", "Female"]
+
+
+def make_rng(seed=None):
+    """numpy Generator used for a whole seeding run; the same seed gives the same population"""
+    return np.random.default_rng(seed)
+
+
+def as_name_array(names):
+    return np.asarray(names, dtype=str)
+
+
+def ragged(groups):
+    """Flatten a list of lists into (values, offsets, counts) arrays"""
+    counts = np.fromiter((len(group) for group in groups), dtype=np.int64, count=len(groups))
+    offsets = np.zeros(len(groups), dtype=np.int64)
+    np.cumsum(counts[:-1], out=offsets[1:])
+    values = np.fromiter((value for group in groups for value in group), dtype=np.int64, count=int(counts.sum()))
+    return values, offsets, counts
+
+
+def pick_universities(rng, weights, count):
+    """Index of the university with the largest weight * uniform(0.8, 1.2) jitter, per student"""
+    weights = np.asarray(weights, dtype=np.float64)
+    jitter = rng.uniform(0.8, 1.2, size=(count, len(weights)))
+    return np.argmax(jitter * weights, axis=1)
+
+
+def pick_in_groups(rng, offsets, counts, group):
+    """One uniform pick among the members of each row's group, as flat positions"""
+    return offsets[group] + (rng.random(len(group)) * counts[group]).astype(np.int64)
+
+
+def full_name_table(first_names, last_names):
+    """Every "first last" combination, indexed by first * len(last_names) + last"""
+    return np.strings.add(np.strings.add(first_names[:, None], " "), last_names[None, :]).ravel()
+
+
+def generate_names(rng, sex, last_names, male_first_names, female_first_names):
+    """Index into precomputed full-name tables instead of joining strings per student"""
+    count = len(sex)
+    table = np.concatenate([full_name_table(male_first_names, last_names),
+                            full_name_table(female_first_names, last_names)])
+    first = np.where(
+        sex == 0,
+        rng.integers(len(male_first_names), size=count),
+        len(male_first_names) + rng.integers(len(female_first_names), size=count),
+    )
+    return table[first * len(last_names) + rng.integers(len(last_names), size=count)]
+
+
+def generate_phone_numbers(rng, count):
+    """Prefix plus PHONE_DIGITS random digits, built as one UTF-32 code point matrix"""
+    prefixes = np.array([[ord(char) for char in prefix] for prefix in PHONE_PREFIXES], dtype="<u4")
+    prefix_len = prefixes.shape[1]
+    chars = np.empty((count, prefix_len + PHONE_DIGITS), dtype="<u4")
+    chars[:, :prefix_len] = prefixes[rng.integers(len(PHONE_PREFIXES), size=count)]
+    chars[:, prefix_len:] = rng.integers(0, 10, size=(count, PHONE_DIGITS), dtype="<u4") + ord("0")
+    return chars.view(f"<U{chars.shape[1]}").ravel()
+
+
+def _years_before(day, years):
+    """The same day `years` earlier; Feb 29 becomes Feb 28 in a common year"""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def generate_dobs(rng, count, min_age=17, max_age=25, today=None):
+    """Dates of birth as datetime64[D], matching generate_dob's age windows"""
+    today = today or datetime.today()
+    ages = np.arange(min_age, max_age + 1)
+    starts = np.array([_years_before(today, age + 1) + timedelta(days=1) for age in ages],
+                      dtype="datetime64[D]")
+    ends = np.array([_years_before(today, age) for age in ages], dtype="datetime64[D]")
+    spans = (ends - starts).astype(np.int64)
+
+    age = rng.integers(len(ages), size=count)
+    offset = (rng.random(count) * spans[age]).astype(np.int64)
+    return starts[age] + offset
+
+
+def generate_factors(rng, factor_ranges, count):
+    return {name: rng.uniform(low, high, size=count) for name, (low, high) in factor_ranges.items()}
+
+
+class PopulationSampler:
+    """Draws whole columns of students for a SeedingPlan.
+
+    The plan's ragged department/course lists are flattened once; every call
+    to `sample` consumes the shared Generator, so a run is reproducible for a
+    given seed and chunk size.
+    """
+
+    def __init__(self, plan, names, rng):
+        self.rng = rng
+        self.university_ids = np.asarray(plan.university_ids, dtype=np.int64)
+        self.university_weights = np.asarray(plan.university_weights, dtype=np.float64)
+        self.simulation_ids = np.array([plan.simulation_ids[uni_id] for uni_id in plan.university_ids], dtype=np.int64)
+
+        self.department_ids, self.department_offsets, self.department_counts = ragged(
+            [plan.department_ids[uni_id] for uni_id in plan.university_ids])
+        self.course_ids, self.course_offsets, self.course_counts = ragged(
+            [plan.course_ids.get(dept_id, []) for dept_id in self.department_ids.tolist()])
+
+        self.last_names = as_name_array(names["last_names"])
+        self.male_first_names = as_name_array(names["male_first_names"])
+        self.female_first_names = as_name_array(names["female_first_names"])
+
+    def sample(self, count):
+        """Columns for `count` students; enrollments are keyed by position in the batch"""
+        rng = self.rng
+        university = pick_universities(rng, self.university_weights, count)
+        department = pick_in_groups(rng, self.department_offsets, self.department_counts, university)
+        sex = rng.integers(len(SEXES), size=count)
+
+        columns = {
+            "university_id": self.university_ids[university],
+            "simulation_id": self.simulation_ids[university],
+            "department_id": self.department_ids[department],
+            "gender": np.asarray(SEXES)[sex],
+            "name": generate_names(rng, sex, self.last_names, self.male_first_names, self.female_first_names),
+            "phone_number": generate_phone_numbers(rng, count),
+            "date_of_birth": generate_dobs(rng, count),
+            "internal_factors": generate_factors(rng, INTERNAL_FACTOR_RANGES, count),
+            "external_factors": generate_factors(rng, EXTERNAL_FACTOR_RANGES, count),
+        }
+
+        # every student takes all courses of their department
+        per_student = self.course_counts[department]
+        student = np.repeat(np.arange(count), per_student)
+        starts = np.repeat(self.course_offsets[department], per_student)
+        within = np.arange(len(student)) - np.repeat(np.cumsum(per_student) - per_student, per_student)
+        columns["enrollments"] = {"student": student, "course_id": self.course_ids[starts + within]}
+        return columns
@@ -1,18 +1,13 @@
 from datetime import datetime
-from random import choice, uniform
 import random
 from sqlite3 import IntegrityError
 from app import db
-from app.constants import Sex
-from app.utils import random_from_enum, random_from_list
-from database_population.data_generation import (
-    generate_dob, generate_external_factors,
-    generate_internal_factors, generate_phone_number
-)
 from database_population.json_loader import (
-    load_department_course_data,
-    load_student_data, load_university_data
+    load_department_course_data, load_university_data
 )
+from database_population.bulk_seeds import bulk_seed_students, log_progress
+from app.services.registry import invalidate_registry
+from app.services.runs import bump_database_generation
 from log.logger import logger
 
 
@@ -142,7 +137,8 @@ def seed_courses(departments_map):
                 courses_map[department.id] = dept_courses
 
         if all_courses:
-            db.session.bulk_save_objects(all_courses)
+            # course ids are needed for the enrollment plan, so have them fetched back
+            db.session.bulk_save_objects(all_courses, return_defaults=True)
             db.session.commit()
 
             # logger.info(f"Successfully seeded {len(all_courses)} courses across {len(courses_map)} departments")
@@ -157,123 +153,30 @@ def seed_courses(departments_map):
         raise
 
 
-def seed_student(universities, courses_map, departments_map, num_of_students):
-    from app.models import Student, StudentCourse, Simulation
+def _bump_database_generation():
     try:
-        student_count_map = {}
-        logger.info("Starting student seeding...")
-        logger.debug(f"Number of universities: {len(universities)}")
-        logger.debug(f"Number of departments mapped: {len(departments_map)}")
-        logger.debug(f"Number of courses mapped: {len(courses_map)}")
-
-        if not universities or not departments_map:
-            logger.warning("No universities or departments available, cannot seed students.")
-            return []
-
-        university_weights = {}
-        for uni in universities:
-            with db.session.no_autoflush:
-                sim = db.session.query(Simulation).filter_by(university_id=uni.id).first()
-                factors = sim.institutional_factors
-
-            weight = [
-                factors.facility_availability, factors.academic_guidance,
-                factors.class_size, factors.peer_support,
-                factors.financial_aid, factors.extracurricular_opportunities,
-                factors.cultural_norms, factors.peer_influence
-            ]
-            university_weights[uni.id] = sum(weight) / len(weight)
-
-        students_names = load_student_data()
-        last_names = students_names["last_names"]
-        male_first_names = students_names["male_first_names"]
-        female_first_names = students_names["female_first_names"]
-
-        with db.session.no_autoflush:
-            simulations = {
-                uni.id: Simulation.query.filter_by(university_id=uni.id).first()
-                for uni in universities
-            }
-
-        student_arr = []
-        internal_factor_arr = []
-        external_factor_arr = []
-        courses_enrolled_arr = []
-
-        for _ in range(num_of_students):
-            selected_uni = max(universities, key=lambda u: university_weights.get(u.id, 0) * uniform(0.8, 1.2))
-            sex = random_from_enum(Sex)
-            last_name = random_from_list(last_names)
-            first_name = random_from_list(male_first_names if sex == Sex.M else female_first_names)
-            name = f'{first_name} {last_name}'
-            dob = generate_dob()
-            phone_number = generate_phone_number()
-
-            available_departments = departments_map.get(selected_uni.id, [])
-            if not available_departments:
-                logger.warning(f"No departments available for university {selected_uni.name} (ID: {selected_uni.id})")
-                continue
-
-            department = choice(available_departments)
-            dept_key = (selected_uni.id, department.id)
-            student_count_map[dept_key] = student_count_map.get(dept_key, 0) + 1
-
-            simulation = simulations[selected_uni.id]
-            student = Student(
-                name=name,
-                simulation_id=simulation.id,
-                phone_number=phone_number,
-                date_of_birth=dob,
-                gender=sex.value,
-                university_id=selected_uni.id,
-                department_id=department.id,
-                level=100,
-                gpa=None
-            )
-            student_arr.append(student)
-
-            external_factors = generate_external_factors(student, simulation)
-            external_factor_arr.append(external_factors)
-
-            internal_factors = generate_internal_factors(student, simulation)
-            internal_factor_arr.append(internal_factors)
-
-            available_courses = courses_map.get(department.id, [])
-            if not available_courses:
-                logger.warning(f"No courses available for department {department.name} (ID: {department.id})")
-                continue
-
-            for course in available_courses:
-                enrollment = StudentCourse(
-                    student_id=student.id,
-                    course_id=course.id
-                )
-                courses_enrolled_arr.append(enrollment)
-
-        db.session.add_all(student_arr)
-        db.session.add_all(internal_factor_arr)
-        db.session.add_all(external_factor_arr)
-        db.session.commit()
-
-        logger.info(f"Seeded {len(student_arr)} students.")
-        return student_arr
-
+        bump_database_generation()
     except Exception as e:
-        db.session.rollback()
-        logger.error(f"Error processing students: {str(e)}")
-        raise
+        logger.warning("Could not bump the database generation; older runs and registries go unnoticed: %s", e)
 
 
-def seed_data(selected_universities, num_students):
+def seed_data(selected_universities, num_students, progress=log_progress, seed=None):
     try:
         db.drop_all()
         db.create_all()
+        # simulation ids and student counts are about to change
+        invalidate_registry()
+        # runs loaded from the old students must not be committed into the new ones
+        _bump_database_generation()
         logger.info("Database reset successful.")
 
         universities, departments_map = seed_universities_and_factors(selected_universities)
         seed_simulation(universities)
         courses_map = seed_courses(departments_map)
-        seed_student(universities, courses_map, departments_map, num_students)
+        bulk_seed_students(universities, courses_map, departments_map, num_students,
+                           progress=progress, seed=seed)
+        # again once the data is complete: other processes may have loaded their registry mid-seed
+        _bump_database_generation()
 
         logger.info("Data seeding complete.")
     except Exception as e:
@@ -1,5 +1,19 @@
+import atexit
 import logging
 import os
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from eventlet import patcher
+
+# the listener must be a native thread with a native queue even when the app is monkey patched:
+# file writes would otherwise still block the hub, and native threads (tpool, writers) log too
+_threading = patcher.original('threading')
+_queue = patcher.original('queue')
+
+# seconds between two emitted messages of one throttled key
+LOG_THROTTLE_INTERVAL = 10.0
+
 
 def configure_logger_file():
     log_dir = 'log'
@@ -9,6 +23,35 @@ def configure_logger_file():
     log_file = os.path.join(log_dir, 'logs.log')
     return log_file
 
+
+class DeferredQueueHandler(QueueHandler):
+    """Queues records unformatted; the listener thread merges the message arguments.
+
+    Arguments are formatted when the record is written, so an argument
+    mutated in the meantime is logged with its later value. Records with
+    exception info are formatted right away, while the traceback is current.
+    """
+
+    def prepare(self, record):
+        if record.exc_info or record.stack_info:
+            return super().prepare(record)
+        return record
+
+
+class NativeQueueListener(QueueListener):
+    """QueueListener whose worker is an OS thread"""
+
+    def start(self):
+        self._thread = _threading.Thread(target=self._monitor, name='log-writer', daemon=True)
+        self._thread.start()
+
+
+# the format below has no thread or process fields; looking them up costs most of a record
+# under eventlet, whose patched current_thread() walks every thread
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
+
 log_file = configure_logger_file()
 logger = logging.getLogger('Simulation_app_logger')
 logger.setLevel(logging.INFO)
@@ -18,4 +61,36 @@ formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s -[in %(
 handler.setFormatter(formatter)
 
 if not logger.handlers:
-    logger.addHandler(handler)
+    log_queue = _queue.SimpleQueue()
+    listener = NativeQueueListener(log_queue, handler, respect_handler_level=True)
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    listener.start()
+    # drain the queue into the file before the interpreter exits
+    atexit.register(listener.stop)
+
+
+_throttled = {}
+_throttle_lock = _threading.Lock()
+
+
+def log_throttled(level, key, msg, *args, interval=LOG_THROTTLE_INTERVAL):
+    """Log at most one message per `interval` seconds for `key`.
+
+    For per-student or per-step messages: the first one is logged, later ones
+    within the interval are counted and the count is reported with the next
+    message that gets through.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    now = time.monotonic()
+    with _throttle_lock:
+        last, suppressed = _throttled.get(key, (None, 0))
+        if last is not None and now - last < interval:
+            _throttled[key] = (last, suppressed + 1)
+            return
+        _throttled[key] = (now, 0)
+    if suppressed:
+        msg += " (%d similar messages suppressed)"
+        args += (suppressed,)
+    # stacklevel points %(pathname)s:%(lineno)d at the caller
+    logger.log(level, msg, *args, stacklevel=2)
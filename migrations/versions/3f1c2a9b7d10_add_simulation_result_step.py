@@ -0,0 +1,37 @@
+"""add simulation_result.step
+
+Databases created with db.create_all() before step results were written
+lack the column; databases created since already have it, so the column is
+only added when missing.
+
+Revision ID: 3f1c2a9b7d10
+Revises: 
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9b7d10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_step_column():
+    columns = sa.inspect(op.get_bind()).get_columns('simulation_result')
+    return any(column['name'] == 'step' for column in columns)
+
+
+def upgrade():
+    if not _has_step_column():
+        with op.batch_alter_table('simulation_result') as batch_op:
+            batch_op.add_column(sa.Column('step', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    if _has_step_column():
+        with op.batch_alter_table('simulation_result') as batch_op:
+            batch_op.drop_column('step')
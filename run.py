@@ -1,3 +1,6 @@
+import argparse
+import atexit
+
 from app import create_app, socketio
 from flask_socketio import SocketIO
 
@@ -6,5 +9,15 @@ app = create_app()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--trace', metavar='PATH',
+                        help="trace sampled steps and write Chrome trace-event JSON to PATH on exit")
+    args = parser.parse_args()
+    if args.trace:
+        from app.services.tracing import TRACER
+
+        TRACER.configure(enabled=True)
+        atexit.register(TRACER.dump, args.trace)
+
     print(app.config['SQLALCHEMY_DATABASE_URI'])
     socketio.run(app=app, host="127.0.0.1", port=5000, debug=True)
@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+# the app reads its configuration on import: never let the tests touch the configured database
+_TEST_ROOT = tempfile.mkdtemp(prefix="simulation-tests-")
+os.environ.update(
+    DATABASE_URI="sqlite:///" + os.path.join(_TEST_ROOT, "test.db"),
+    SIMULATION_RESULTS_ENABLED="0",
+    SIMULATION_COMMIT_ON_RUN_END="0",
+    SIMULATION_SEED="7",
+)
+
+import numpy as np
+import pytest
+
+from app.services.model_representation import (
+    SimulationState, INTERNAL_FACTOR_COLUMNS, EXTERNAL_FACTOR_COLUMNS, INSTITUTIONAL_FACTOR_COLUMNS
+)
+
+UNIVERSITIES = 3
+STUDENTS = 300
+
+
+@pytest.fixture
+def make_state():
+    """Build a state of `sizes[i]` students in simulation i + 1 with factors drawn from `seed`"""
+    def make(sizes=(300, 200), seed=1, high=1.0, institutional_ids=None):
+        rng = np.random.default_rng(seed)
+        count = sum(sizes)
+        institutional_ids = np.arange(1, len(sizes) + 1) if institutional_ids is None else institutional_ids
+        return SimulationState(
+            student_ids=np.arange(1, count + 1, dtype=np.int64),
+            simulation_ids=np.repeat(np.arange(1, len(sizes) + 1, dtype=np.int64), sizes),
+            internal_factors=rng.uniform(0, high, (count, len(INTERNAL_FACTOR_COLUMNS))),
+            external_factors=rng.uniform(0, high, (count, len(EXTERNAL_FACTOR_COLUMNS))),
+            institutional_simulation_ids=np.asarray(institutional_ids, dtype=np.int64),
+            institutional_factors=rng.uniform(0, high, (len(institutional_ids), len(INSTITUTIONAL_FACTOR_COLUMNS))),
+        )
+    return make
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """The cache on an in-process stand-in for Redis"""
+    from app.services import cache
+    from benchmarks.in_process_redis import InProcessRedis
+
+    client = InProcessRedis()
+    monkeypatch.setattr(cache, "redis_client", client)
+    return client
+
+
+@pytest.fixture
+def app(redis, tmp_path):
+    from app import create_app
+
+    app = create_app()
+    app.config.update(
+        TESTING=True,
+        SIMULATION_SNAPSHOT_DIR=str(tmp_path / "snapshots" / "state"),
+        SIMULATION_TIMELINE_DIR=str(tmp_path / "timelines"),
+    )
+    runs = app.extensions["simulation_runs"]
+    runs.snapshot_root = str(tmp_path / "snapshots" / "runs")
+    runs.timeline_root = str(tmp_path / "timelines")
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def seeded_app(app):
+    """App over a freshly seeded database"""
+    from database_population.json_loader import load_university_data
+    from database_population.seeds import seed_data
+
+    universities = [u["name"] for u in load_university_data()["universities"]][:UNIVERSITIES]
+    seed_data(universities, STUDENTS, progress=None, seed=1)
+    return app
+
+
+@pytest.fixture
+def loaded_app(seeded_app):
+    """Seeded app whose state is loaded into the shared cache"""
+    from app.services import cache, load_memory, mem_factors_flat_lookup
+
+    cache.cache_simulation_data(load_memory())
+    mem_factors_flat_lookup()
+    return seeded_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,9 @@
+import numpy as np
+
+STATE_ARRAYS = ('student_ids', 'simulation_ids', 'internal_factors', 'external_factors',
+                'institutional_simulation_ids', 'institutional_factors')
+
+
+def assert_states_equal(got, want):
+    for name in STATE_ARRAYS:
+        np.testing.assert_array_equal(getattr(got, name), getattr(want, name))
@@ -0,0 +1,80 @@
+import numpy as np
+
+from app.services.aggregates import (
+    SCORE_BINS, RunningStats, score_histograms, segment_means, segments, step_summaries
+)
+from app.services.simulation_engine import StepResult
+
+
+def _step(simulation_ids, scores):
+    simulation_ids = np.asarray(simulation_ids, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    return StepResult(
+        student_ids=np.arange(100, 100 + len(scores), dtype=np.int64),
+        simulation_ids=simulation_ids,
+        scores=scores,
+        internal_impact=scores / 100,
+        external_impact=scores / 50,
+        institutional_impact=np.ones(len(scores)),
+    )
+
+
+def test_segment_means_match_groupby_on_unsorted_rows():
+    rng = np.random.default_rng(5)
+    simulation_ids = rng.choice([4, 1, 9], size=500)
+    values = rng.random(500)
+
+    ids, inverse, counts = segments(simulation_ids)
+    means = segment_means(values, inverse, counts)
+
+    expected = {}
+    for simulation_id, value in zip(simulation_ids.tolist(), values.tolist()):
+        expected.setdefault(simulation_id, []).append(value)
+    assert ids.tolist() == sorted(expected)
+    np.testing.assert_allclose(means, [np.mean(expected[simulation_id]) for simulation_id in ids.tolist()])
+    assert counts.tolist() == [len(expected[simulation_id]) for simulation_id in ids.tolist()]
+
+
+def test_score_histograms_clamp_to_the_range():
+    _, inverse, counts = segments(np.array([1, 1, 2, 2]))
+    histograms = score_histograms(np.array([0.0, 100.0, 49.9, 50.0]), inverse, counts)
+
+    assert histograms.shape == (2, SCORE_BINS)
+    assert histograms[0, 0] == 1 and histograms[0, -1] == 1
+    assert histograms[1, SCORE_BINS // 2 - 1] == 1 and histograms[1, SCORE_BINS // 2] == 1
+
+
+def test_step_summaries_of_unsorted_rows():
+    step = _step([2, 1, 2, 1, 2], [10.0, 40.0, 30.0, 60.0, 20.0])
+
+    summaries = step_summaries(step, detail=True)
+
+    assert [s["simulation_id"] for s in summaries] == [1, 2]
+    first, second = summaries
+    assert first["students"] == 2 and second["students"] == 3
+    assert first["scores"]["mean"] == 50.0 and second["scores"]["mean"] == 20.0
+    assert second["scores"]["min"] == 10.0 and second["scores"]["max"] == 30.0
+    assert second["scores"]["quantiles"]["0.5"] == 20.0
+    assert np.isclose(first["scores"]["variance"], 100.0)
+    assert first["avg_external_factor"] == 1.0
+    assert first["student_ids"] == [101, 103] and first["student_scores"] == [40.0, 60.0]
+    assert second["student_ids"] == [100, 102, 104] and second["student_scores"] == [10.0, 30.0, 20.0]
+    assert "student_ids" not in step_summaries(step)[0]
+
+
+def test_running_stats_match_all_scores_seen():
+    rng = np.random.default_rng(2)
+    running = RunningStats()
+    batches = [rng.random(n) * 100 for n in (5, 17, 1)]
+    for number, scores in enumerate(batches):
+        if number % 2:
+            running.add_step(_step(np.full(len(scores), 3), scores))
+        else:
+            step_summaries(_step(np.full(len(scores), 3), scores), running=running)
+
+    seen = np.concatenate(batches)
+    summary = running.summary(3)
+    assert summary["count"] == len(seen)
+    assert np.isclose(summary["mean"], seen.mean())
+    assert np.isclose(summary["variance"], seen.var())
+    assert running.summary(4) == {"count": 0, "mean": None, "variance": None}
@@ -0,0 +1,66 @@
+import pytest
+
+from app.services import cache
+from app.services.simulation_engine import SimulationEngine
+from tests.helpers import assert_states_equal
+
+
+@pytest.mark.parametrize("run_id", [None, "abc123"])
+def test_cache_partition_round_trip(make_state, redis, run_id):
+    # a small block size makes the dirty write touch only some of the blocks
+    state = make_state((300, 200))
+    cache.cache_state_snapshot(state, block_size=64, run_id=run_id)
+
+    partition = cache.get_cached_partition(2, run_id=run_id)
+    assert_states_equal(partition, state.partition(2))
+
+    SimulationEngine(seed=0).step_batch(partition)
+    partition.internal_factors[:10] += 1
+    assert cache.persist_dirty_state(partition, block_size=64, run_id=run_id) > 0
+    assert not partition.dirty_rows.any()
+
+    assert_states_equal(cache.get_cached_partition(2, run_id=run_id), partition)
+    assert_states_equal(cache.get_cached_partition(1, run_id=run_id), state.partition(1))
+    assert cache.get_cached_partition(3, run_id=run_id) is None
+
+
+def test_persist_writes_only_dirty_blocks(make_state, redis):
+    state = make_state((300, 200))
+    cache.cache_state_snapshot(state, block_size=64)
+
+    state.internal_factors[70] += 1
+    state.mark_dirty(slice(70, 71))
+
+    # one block per family of simulation 1: rows 64..127 of each student family
+    assert cache.persist_dirty_state(state, block_size=64) == 2
+    assert cache.persist_dirty_state(state, block_size=64) == 0
+    assert_states_equal(cache.get_cached_state(), state)
+
+
+def test_snapshot_replaces_previous_partitions(make_state, redis):
+    cache.cache_state_snapshot(make_state((100, 100, 100)))
+    smaller = make_state((50,), seed=2)
+    cache.cache_state_snapshot(smaller)
+
+    assert cache.get_cached_partition(2) is None
+    assert_states_equal(cache.get_cached_state(), smaller)
+
+
+@pytest.mark.parametrize("family", sorted(cache.STATE_FAMILY_KEYS.values()))
+def test_partition_with_a_missing_block_is_not_cached(make_state, redis, family):
+    state = make_state((300, 200))
+    cache.cache_state_snapshot(state, block_size=64)
+
+    redis.data[cache.partition_key(family, 1).encode()].pop(b"0")
+
+    assert cache.get_cached_partition(1) is None
+    assert_states_equal(cache.get_cached_partition(2), state.partition(2))
+    assert cache.get_cached_state() is None
+
+
+def test_partition_index_must_be_binary(make_state, redis):
+    cache.cache_state_snapshot(make_state())
+    redis.set(cache.partition_key(cache.STATE_INDEX_KEY, 1), b"not a state index")
+
+    with pytest.raises(RuntimeError):
+        cache.get_cached_partition(1)
@@ -0,0 +1,145 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.live import LiveBroadcaster, room_name
+from app.views.views import stream_settings
+from tests.conftest import UNIVERSITIES
+
+
+class FakeSocketIO:
+    """Records emits; `rooms` maps room names to the sids in them"""
+
+    def __init__(self, rooms=None):
+        self.rooms = rooms or {}
+        self.emitted = []
+        self.tasks = []
+        self.server = SimpleNamespace(manager=SimpleNamespace(get_participants=self.get_participants))
+
+    def get_participants(self, namespace, room):
+        return [(sid, "eio-" + sid) for sid in self.rooms.get(room, [])]
+
+    def emit(self, event, data, to=None, namespace=None, callback=None):
+        self.emitted.append((event, data, to, callback))
+
+    def start_background_task(self, target, *args):
+        self.tasks.append((target, args))
+
+    def events(self, event):
+        return [(data, to) for name, data, to, _ in self.emitted if name == event]
+
+
+def _record(step, *simulation_ids):
+    return {"step": step, "simulations": [{"simulation_id": i, "mean": float(step)} for i in simulation_ids]}
+
+
+def test_publish_keeps_only_the_latest_frame():
+    socketio = FakeSocketIO({room_name(1): ["a"], room_name(2): ["a", "b"]})
+    broadcaster = LiveBroadcaster(socketio)
+    broadcaster.publish(_record(1, 1, 2))
+    broadcaster.publish(_record(2, 1, 2))
+
+    broadcaster.flush(max_in_flight=10)
+    assert sorted((frame["simulation_id"], frame["step"], to) for frame, to in socketio.events("sim_update")) == [
+        (1, 2, "a"), (2, 2, "a"), (2, 2, "b")
+    ]
+    # nothing new to send
+    broadcaster.flush(max_in_flight=10)
+    assert len(socketio.events("sim_update")) == 3
+
+
+def test_slow_clients_miss_frames_until_they_acknowledge():
+    socketio = FakeSocketIO({room_name(1): ["slow"]})
+    broadcaster = LiveBroadcaster(socketio)
+
+    broadcaster.publish(_record(1, 1))
+    broadcaster.flush(max_in_flight=1)
+    broadcaster.publish(_record(2, 1))
+    broadcaster.flush(max_in_flight=1)
+    assert [frame["step"] for frame, _ in socketio.events("sim_update")] == [1]
+    assert broadcaster.dropped == 1
+
+    # the acknowledgement callback opens the window again
+    socketio.emitted[0][3]()
+    broadcaster.flush(max_in_flight=1)
+    assert [frame["step"] for frame, _ in socketio.events("sim_update")] == [1, 2]
+
+
+def test_forget_drops_client_bookkeeping():
+    socketio = FakeSocketIO({room_name(1, "r"): ["a"]})
+    broadcaster = LiveBroadcaster(socketio, run_id="r")
+    broadcaster.publish(_record(1, 1))
+    broadcaster.flush(max_in_flight=1)
+
+    broadcaster.forget("a")
+    assert not broadcaster.in_flight and not broadcaster.last_sent
+
+
+def test_start_runs_once():
+    socketio = FakeSocketIO()
+    broadcaster = LiveBroadcaster(socketio)
+    for steps, fps, max_in_flight in [(0, 10, 1), (1, 0, 1), (1, 10, 0)]:
+        with pytest.raises(ValueError):
+            broadcaster.start(None, steps, fps, max_in_flight)
+
+    assert broadcaster.start(None, 5, 10, 2)
+    assert not broadcaster.start(None, 5, 10, 2)
+    assert len(socketio.tasks) == 1
+
+
+def test_run_streams_steps_and_completes(loaded_app):
+    socketio = FakeSocketIO({room_name(i): ["a"] for i in range(1, UNIVERSITIES + 1)})
+    broadcaster = LiveBroadcaster(socketio)
+    broadcaster.running = True
+
+    broadcaster.run(loaded_app, 3, fps=1000, max_in_flight=1)
+
+    assert not broadcaster.running
+    # the final frames are sent regardless of the window
+    latest = {}
+    for frame, _ in socketio.events("sim_update"):
+        latest[frame["simulation_id"]] = frame["step"]
+    assert latest == {i: 3 for i in range(1, UNIVERSITIES + 1)}
+    assert sorted(socketio.events("sim_complete"), key=lambda event: event[1]) == [
+        ({"sim_id": i, "steps": 3}, room_name(i)) for i in range(1, UNIVERSITIES + 1)
+    ]
+
+
+def test_run_reports_errors(app):
+    socketio = FakeSocketIO()
+    broadcaster = LiveBroadcaster(socketio)
+    broadcaster.running = True
+
+    broadcaster.run(app, 3, fps=1000, max_in_flight=1)
+
+    assert not broadcaster.running
+    assert [data for data, _ in socketio.events("sim_error")] == [
+        {"message": "No simulation data found in cache. Please load memory first."}
+    ]
+
+
+@pytest.mark.parametrize("data, expected", [
+    (None, (500, 10.0)),
+    ({"steps": 20, "fps": 4}, (20, 4.0)),
+    ({"steps": "20", "fps": "100"}, (20, 10.0)),
+    ({"steps": 10 ** 6}, (10000, 10.0)),
+])
+def test_stream_settings(data, expected):
+    assert stream_settings(data, {}) == expected
+
+
+@pytest.mark.parametrize("data", [{"steps": 0}, {"fps": 0}, {"steps": "many"}, {"fps": [1]}])
+def test_stream_settings_rejects(data):
+    with pytest.raises(ValueError):
+        stream_settings(data, {})
+
+
+def test_start_rejects_unknown_runs(app):
+    from app import socketio
+
+    client = socketio.test_client(app)
+    client.emit("start_simulation_spawning", {"run": "nope"})
+
+    assert [(event["name"], event["args"]) for event in client.get_received()] == [
+        ("sim_error", [{"message": "Unknown run nope"}])
+    ]
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from app import db
+from app.models import ExternalFactors, InternalFactors, Student
+from app.services import load_initial_data, load_initial_state, state_wrapper
+from tests.conftest import STUDENTS
+from tests.helpers import assert_states_equal
+
+
+@pytest.mark.parametrize("chunk_size", [50_000, 7])
+def test_loaders_agree(seeded_app, chunk_size):
+    expected = state_wrapper(load_initial_data())
+    state = load_initial_state(chunk_size=chunk_size)
+
+    assert len(state) == STUDENTS
+    assert_states_equal(expected, state)
+
+
+def test_students_without_factors_are_left_out(seeded_app):
+    ids = [s.id for s in Student.query.order_by(Student.id).limit(6)]
+    # no factors at all, then no external factors
+    for model in (InternalFactors, ExternalFactors):
+        model.query.filter(model.student_id.in_(ids[:3])).delete(synchronize_session=False)
+    ExternalFactors.query.filter(ExternalFactors.student_id.in_(ids[3:])).delete(synchronize_session=False)
+    db.session.commit()
+
+    expected = state_wrapper(load_initial_data())
+    state = load_initial_state()
+
+    assert len(state) == STUDENTS - 3
+    assert not np.isin(state.student_ids, ids[:3]).any()
+    # a missing factor family keeps NaN
+    rows = np.isin(state.student_ids, ids[3:])
+    assert rows.sum() == 3 and np.isnan(state.external_factors[rows]).all()
+    assert not np.isnan(state.internal_factors[rows]).any()
+    assert_states_equal(expected, state)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from app.utils.build_flat_lookup import RowIndex, build_lookup
+
+def test_row_index_lookups():
+    simulation_ids = np.array([2, 2, 1, 1, 1])
+    student_ids = np.array([10, 14, 11, 12, 20])
+    index = RowIndex.build(simulation_ids, student_ids)
+
+    assert len(index) == 5
+    assert index.get(1, 12) == 3
+    assert index.get(2, 12) is None
+    assert (2, 14) in index and (1, 13) not in index
+    assert index.rows([2, 1, 1, 2, 1], [10, 20, 13, 11, 99]).tolist() == [0, 4, -1, -1, -1]
+    assert index.student_rows([14, 11, 5, 13, 21]).tolist() == [1, 2, -1, -1, -1]
+
+
+def test_row_index_rejects_duplicates_and_handles_empty():
+    with pytest.raises(ValueError):
+        RowIndex.build([1, 1], [3, 3])
+    empty = RowIndex.build([], [])
+    assert len(empty) == 0
+    assert empty.rows([1], [1]).tolist() == [-1]
+    assert empty.student_rows([1]).tolist() == [-1]
+
+
+def test_row_index_insert_and_remove():
+    index = RowIndex.build([1, 1], [10, 11])
+    index.insert(2, 3, 2)
+    index.insert(2, 40, 3)
+
+    assert len(index) == 4
+    assert index.get(2, 3) == 2 and index.get(2, 40) == 3
+    assert index.remove(1, 10) == 0
+    assert index.get(1, 10) is None and len(index) == 3
+    with pytest.raises(KeyError):
+        index.remove(1, 10)
+    assert sorted(index.items()) == [((1, 11), 1), ((2, 3), 2), ((2, 40), 3)]
+
+
+def test_build_lookup_maps_every_row(make_state):
+    state = make_state()
+    index = build_lookup(state)
+    assert index.rows(state.simulation_ids, state.student_ids).tolist() == list(range(len(state)))
+
+
+def test_loading_memory_caches_the_row_index(loaded_app, monkeypatch):
+    import app.services as services
+    from app.services.cache import LOOKUP_KEY, get_cached_lookup_data, get_cached_state
+
+    state = get_cached_state()
+    cached = get_cached_lookup_data(LOOKUP_KEY)
+    assert cached.rows(state.simulation_ids, state.student_ids).tolist() == list(range(len(state)))
+
+    def build_lookup(state):
+        raise AssertionError("the cached index should be used")
+    monkeypatch.setattr(services, "build_lookup", build_lookup)
+    assert len(services.row_index(state)) == len(state)
+
+
+def test_row_index_is_rebuilt_when_the_cached_one_does_not_match(make_state, redis):
+    import app.services as services
+    from app.services.cache import LOOKUP_KEY, cache_lookup_data
+
+    state = make_state()
+    cache_lookup_data(RowIndex.build([1], [1]), LOOKUP_KEY)
+
+    index = services.row_index(state)
+    assert index.rows(state.simulation_ids, state.student_ids).tolist() == list(range(len(state)))
@@ -0,0 +1,78 @@
+import pytest
+
+from app.services import run_simulation_steps
+from app.services.metrics import REGISTRY, ROWS_STEPPED, Registry, timed
+from tests.conftest import STUDENTS
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ("stage",), buckets=(1.0, 0.1))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.labels("load").observe(value)
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="load",le="0.1"} 1',
+        'latency_seconds_bucket{stage="load",le="1.0"} 3',
+        'latency_seconds_bucket{stage="load",le="+Inf"} 4',
+        'latency_seconds_sum{stage="load"} 4.25',
+        'latency_seconds_count{stage="load"} 4',
+    ]
+
+
+def test_counter_labels_are_escaped():
+    registry = Registry()
+    counter = registry.counter("bytes_total", "Bytes.", ("operation",))
+    counter.labels(operation='a "b"\n').inc(3)
+    counter.labels(operation='a "b"\n').inc()
+
+    assert registry.render().splitlines()[-1] == 'bytes_total{operation="a \\"b\\"\\n"} 4'
+
+
+def test_disabled_registry_drops_observations():
+    registry = Registry(enabled=False)
+    histogram = registry.histogram("t_seconds", "T.")
+    counter = registry.counter("c_total", "C.")
+    with histogram.time():
+        counter.labels().inc()
+
+    assert histogram.labels().count == 0 and counter.labels().value == 0
+
+
+def test_timed_observes_every_call():
+    registry = Registry()
+    histogram = registry.histogram("call_seconds", "Calls.", ("fn",))
+
+    @timed(histogram, "double")
+    def double(value):
+        return 2 * value
+
+    assert double(2) == 4 and double(3) == 6
+    assert histogram.labels("double").count == 2
+
+
+@pytest.fixture
+def metrics_enabled():
+    enabled = REGISTRY.enabled
+    REGISTRY.enabled = True
+    yield
+    REGISTRY.enabled = enabled
+
+
+def test_metrics_endpoint(loaded_app, client, metrics_enabled):
+    rows = ROWS_STEPPED.labels().value
+    list(run_simulation_steps(2))
+    assert ROWS_STEPPED.labels().value == rows + 2 * STUDENTS
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    body = response.get_data(as_text=True)
+    assert f"simulation_rows_stepped_total {rows + 2 * STUDENTS}" in body
+    assert 'simulation_stage_seconds_count{stage="load_initial_state"}' in body
+    assert 'simulation_engine_phase_seconds_bucket{phase=' in body
+
+    REGISTRY.enabled = False
+    assert client.get("/metrics").status_code == 404
@@ -0,0 +1,54 @@
+import os
+
+import sqlalchemy as sa
+from flask_migrate import downgrade, upgrade
+
+from app import db
+from app import models
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), "migrations")
+
+
+def _columns(table):
+    return {column["name"] for column in sa.inspect(db.engine).get_columns(table)}
+
+
+def test_simulation_result_step(seeded_app):
+    db.session.add_all([
+        models.SimulationResult(simulation_id=1, step=3, graph_type="Student Performance",
+                                metric_name="score_mean", value=0.5),
+        models.SimulationResult(simulation_id=1, graph_type="Student Performance",
+                                metric_name="score_mean", value=0.25),
+    ])
+    db.session.commit()
+
+    assert sorted((row.step or 0, row.value) for row in models.SimulationResult.query) == [(0, 0.25), (3, 0.5)]
+
+
+def test_migration_adds_the_step_column_when_missing(app):
+    db.drop_all()
+    with db.engine.begin() as connection:
+        connection.execute(sa.text(
+            "CREATE TABLE simulation_result (id INTEGER PRIMARY KEY, simulation_id INTEGER NOT NULL, "
+            "graph_type VARCHAR(50) NOT NULL, metric_name VARCHAR(100) NOT NULL, value FLOAT NOT NULL)"))
+    try:
+        upgrade(directory=MIGRATIONS)
+        assert "step" in _columns("simulation_result")
+        downgrade(directory=MIGRATIONS)
+        assert "step" not in _columns("simulation_result")
+    finally:
+        with db.engine.begin() as connection:
+            connection.execute(sa.text("DROP TABLE IF EXISTS alembic_version"))
+        db.drop_all()
+
+
+def test_migration_keeps_an_existing_step_column(app):
+    db.drop_all()
+    db.create_all()
+    try:
+        upgrade(directory=MIGRATIONS)
+        assert "step" in _columns("simulation_result")
+    finally:
+        with db.engine.begin() as connection:
+            connection.execute(sa.text("DROP TABLE IF EXISTS alembic_version"))
+        db.drop_all()
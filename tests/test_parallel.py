@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from app.services.parallel import ShardedRunner, shard_bounds, shutdown_process_pool
+from app.services.simulation_engine import SimulationEngine
+
+
+@pytest.fixture
+def process_pool():
+    yield
+    shutdown_process_pool()
+
+
+def test_shard_bounds_cover_every_row_once():
+    assert shard_bounds(10, 3, min_rows=1) == [(0, 3), (3, 6), (6, 10)]
+    assert shard_bounds(10, 4, min_rows=5) == [(0, 5), (5, 10)]
+    assert shard_bounds(3, 4, min_rows=5) == [(0, 3)]
+    assert shard_bounds(0, 4) == []
+
+
+@pytest.mark.parametrize("institutional_ids", [None, [1, 2, 3, 4]], ids=["every-simulation", "studentless"])
+def test_sharded_runner_matches_inline_run(make_state, process_pool, institutional_ids):
+    # blocks of 4096 rows are cut by the shards, so shard edges must not change the draws;
+    # simulation 4 of the studentless case has institutional factors but no students
+    sizes = (6000, 3000, 5000)
+    inline = make_state(sizes, institutional_ids=institutional_ids)
+    sharded = make_state(sizes, institutional_ids=institutional_ids)
+    engine = SimulationEngine(seed=3)
+    expected = [engine.step_batch(inline, step=step) for step in (5, 6, 7)]
+
+    with ShardedRunner(sharded, workers=3, seed=3, min_shard_rows=1000, first_step=5) as runner:
+        assert len(runner.shards) > 1
+        assert runner.replay_info()["step"] == 5
+        results = [runner.step() for _ in range(3)]
+
+    for got, want in zip(results, expected):
+        np.testing.assert_array_equal(got.student_ids, want.student_ids)
+        np.testing.assert_array_equal(got.scores, want.scores)
+        np.testing.assert_array_equal(got.internal_impact, want.internal_impact)
+        np.testing.assert_array_equal(got.institutional_impact, want.institutional_impact)
+    for name in ('internal_factors', 'external_factors', 'institutional_factors'):
+        np.testing.assert_array_equal(getattr(sharded, name), getattr(inline, name))
+    assert sharded.dirty_rows.all()
+
+
+def test_sharded_runner_without_steps_leaves_the_state_clean(make_state, process_pool):
+    state = make_state((2000, 2000))
+    before = state.internal_factors.copy()
+
+    with ShardedRunner(state, workers=2, seed=3, min_shard_rows=1000):
+        pass
+
+    np.testing.assert_array_equal(state.internal_factors, before)
+    assert not state.dirty_rows.any()
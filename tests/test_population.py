@@ -0,0 +1,74 @@
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from database_population.population import (
+    PHONE_DIGITS, PHONE_PREFIXES, PopulationSampler, generate_dobs, generate_phone_numbers, make_rng, ragged
+)
+
+NAMES = {"last_names": ["Ade", "Okafor"], "male_first_names": ["Tunde", "Musa"], "female_first_names": ["Ada"]}
+PLAN = SimpleNamespace(
+    university_ids=[1, 2],
+    university_weights=[1.0, 0.9],
+    simulation_ids={1: 10, 2: 20},
+    department_ids={1: [100, 101], 2: [200]},
+    course_ids={100: [1, 2], 101: [], 200: [3]},
+)
+
+
+def _age(born, today):
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+@pytest.mark.parametrize("today", [datetime(2025, 6, 1), datetime(2024, 2, 29), datetime(2023, 3, 1)])
+def test_dates_of_birth_fall_in_the_age_window(today):
+    dobs = generate_dobs(make_rng(0), 20000, min_age=17, max_age=25, today=today)
+
+    ages = {_age(dob, today.date()) for dob in dobs.astype(date).tolist()}
+    assert ages == set(range(17, 26))
+
+
+def test_ragged_flattens_groups():
+    values, offsets, counts = ragged([[4, 5], [], [6]])
+    assert values.tolist() == [4, 5, 6]
+    assert offsets.tolist() == [0, 2, 2]
+    assert counts.tolist() == [2, 0, 1]
+
+
+def test_phone_numbers():
+    numbers = generate_phone_numbers(make_rng(0), 50)
+    assert all(len(number) == 3 + PHONE_DIGITS and number[:3] in PHONE_PREFIXES and number.isdigit()
+               for number in numbers.tolist())
+
+
+def test_sampler_columns_follow_the_plan():
+    columns = PopulationSampler(PLAN, NAMES, make_rng(1)).sample(500)
+
+    universities = columns["university_id"]
+    assert set(universities.tolist()) == {1, 2}
+    np.testing.assert_array_equal(columns["simulation_id"], np.where(universities == 1, 10, 20))
+    departments = columns["department_id"]
+    assert set(departments[universities == 1].tolist()) == {100, 101}
+    assert set(departments[universities == 2].tolist()) == {200}
+    assert set(columns["gender"].tolist()) == {"Male", "Female"}
+    female = columns["gender"] == "Female"
+    assert all(name.startswith("Ada ") for name in columns["name"][female].tolist())
+
+    # every student takes all courses of their department
+    enrollments = columns["enrollments"]
+    taken = {}
+    for student, course in zip(enrollments["student"].tolist(), enrollments["course_id"].tolist()):
+        taken.setdefault(student, []).append(course)
+    for student, department in enumerate(departments.tolist()):
+        assert taken.get(student, []) == PLAN.course_ids[department]
+
+
+def test_sampler_is_reproducible_for_a_seed():
+    first = PopulationSampler(PLAN, NAMES, make_rng(3)).sample(100)
+    second = PopulationSampler(PLAN, NAMES, make_rng(3)).sample(100)
+    for name in ("university_id", "department_id", "name", "phone_number", "date_of_birth"):
+        np.testing.assert_array_equal(first[name], second[name])
+    for name, values in first["internal_factors"].items():
+        np.testing.assert_array_equal(values, second["internal_factors"][name])
@@ -0,0 +1,73 @@
+import pytest
+
+from app import create_app
+from app.services import registry as registry_module
+from app.services import runs
+from app.services.registry import get_registry, invalidate_registry
+from tests.conftest import STUDENTS, UNIVERSITIES
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Counts the metadata queries"""
+    calls = []
+    load = registry_module.load_simulation_metadata
+
+    def counted():
+        calls.append(1)
+        return load()
+    monkeypatch.setattr(registry_module, "load_simulation_metadata", counted)
+    return calls
+
+
+def test_registry_holds_the_simulation_metadata(seeded_app):
+    registry = get_registry()
+
+    assert registry.ids() == list(range(1, UNIVERSITIES + 1))
+    assert sum(simulation.student_count for simulation in registry) == STUDENTS
+    meta = registry.get(1).to_dict()
+    assert meta["simulation_id"] == 1 and meta["student_count"] == registry.get(1).student_count
+    assert meta["student_ids"][0] <= meta["student_ids"][1]
+    assert registry.get(99) is None
+
+
+def test_registry_loads_once(seeded_app, loads):
+    registry = get_registry()
+    for _ in range(3):
+        registry.ids()
+    assert len(loads) == 1
+
+    invalidate_registry()
+    assert not registry.loaded
+    assert len(registry) == UNIVERSITIES and len(loads) == 2
+
+
+def test_other_apps_reload_after_a_reseed(seeded_app, loads):
+    from database_population.json_loader import load_university_data
+    from database_population.seeds import seed_data
+
+    # a second worker process sharing the database and Redis
+    other = create_app()
+    with other.app_context():
+        assert len(get_registry()) == UNIVERSITIES
+        get_registry().ids()
+    assert len(loads) == 1
+
+    universities = [u["name"] for u in load_university_data()["universities"]][:2]
+    seed_data(universities, 50, progress=None, seed=1)
+    with other.app_context():
+        assert len(get_registry()) == 2
+        assert sum(simulation.student_count for simulation in get_registry()) == 50
+
+
+def test_registry_without_redis_keeps_its_metadata(seeded_app, loads, monkeypatch):
+    registry = get_registry()
+    registry.ids()
+
+    def unreachable():
+        raise ConnectionError("no redis")
+    monkeypatch.setattr(runs, "database_generation", unreachable)
+    runs.bump_database_generation()
+    assert registry.ids() == list(range(1, UNIVERSITIES + 1))
+    assert len(loads) == 1
+
@@ -0,0 +1,72 @@
+import pytest
+
+from app import models
+from app.services import RunningStats, run_simulation_steps, step_summaries
+from app.services import result_writer
+from app.services.simulation_engine import SimulationEngine
+from tests.conftest import STUDENTS, UNIVERSITIES
+
+
+@pytest.fixture
+def summaries(make_state):
+    state = make_state()
+    step = SimulationEngine(1).step_batch(state, step=1)
+    return step, step_summaries(step, RunningStats())
+
+
+def test_simulation_result_rows(summaries):
+    _, summaries = summaries
+    rows = result_writer.simulation_result_rows(4, summaries)
+
+    assert {row["step"] for row in rows} == {4}
+    assert {row["simulation_id"] for row in rows} == {1, 2}
+    first = [row for row in rows if row["simulation_id"] == 1]
+    metrics = {row["metric_name"]: row["value"] for row in first}
+    assert metrics["score_mean"] == summaries[0]["scores"]["mean"]
+    assert metrics["avg_internal_factor"] == summaries[0]["avg_internal_factor"]
+    assert {"score_min", "score_max", "score_variance"} <= set(metrics)
+
+
+def test_test_result_rows(summaries):
+    step, _ = summaries
+    rows = result_writer.test_result_batch_rows([(3, step.student_ids, step.scores, "now")] * 2)
+
+    assert len(rows) == 2 * len(step)
+    assert rows[0] == {"student_id": int(step.student_ids[0]), "score": float(step.scores[0]),
+                       "timestamp": "now", "test_type": "simulation step 3"}
+
+
+def test_full_queue_drops_rows(app, summaries):
+    step, summaries = summaries
+    writer = result_writer.ResultWriter(app, max_pending_rows=10, flush_interval=60)
+    try:
+        writer.submit(1, summaries, step)
+        assert writer.dropped_rows == len(result_writer.simulation_result_rows(1, summaries)) + len(step)
+        assert writer.pending_rows == 0
+    finally:
+        writer.close()
+
+
+@pytest.mark.parametrize("insert_rows", [result_writer.INSERT_CHUNK_ROWS, 7])
+def test_run_results_are_written_behind(loaded_app, insert_rows):
+    loaded_app.config.update(SIMULATION_RESULTS_ENABLED=True, SIMULATION_RESULTS_TEST_EVERY=2)
+    writer = loaded_app.extensions["result_writer"] = result_writer.ResultWriter(
+        loaded_app, flush_interval=0.01, insert_rows=insert_rows)
+    assert result_writer.get_result_writer() is writer
+
+    records = list(run_simulation_steps(5, every=4))
+    writer.close()
+
+    # the emitted step 4, the test steps 2 and 4, and the last step
+    assert [record["step"] for record in records] == [4, 5]
+    assert sorted({row.step for row in models.SimulationResult.query}) == [2, 4, 5]
+    assert {row.simulation_id for row in models.SimulationResult.query} == set(range(1, UNIVERSITIES + 1))
+    assert sorted({row.test_type for row in models.TestResult.query}) == [
+        "simulation step 2", "simulation step 4", "simulation step 5"]
+    assert models.TestResult.query.count() == 3 * STUDENTS
+    assert writer.written_rows == models.SimulationResult.query.count() + models.TestResult.query.count()
+    assert writer.pending_rows == writer.dropped_rows == 0
+
+
+def test_disabled_results_have_no_writer(app):
+    assert result_writer.get_result_writer() is None
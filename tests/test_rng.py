@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from app.services import cache
+from app.services.rng import BLOCK_ROWS, RandomStreams
+from app.services.simulation_engine import SimulationEngine
+
+
+def test_streams_are_reproducible_from_their_entropy():
+    streams = RandomStreams()
+    again = RandomStreams.from_state(streams.state)
+    assert again.entropy == streams.entropy
+    np.testing.assert_array_equal(again.generator(3, 1, 0).random(5), streams.generator(3, 1, 0).random(5))
+
+
+def test_every_coordinate_draws_its_own_numbers():
+    streams = RandomStreams(7)
+    draws = {coordinate: streams.generator(*coordinate).random(4).tolist()
+             for coordinate in [(1, 1, 0), (2, 1, 0), (1, 2, 0), (1, 1, 1)]}
+    assert len({tuple(values) for values in draws.values()}) == len(draws)
+
+
+def test_student_draws_do_not_depend_on_how_rows_are_split(make_state):
+    state = make_state((BLOCK_ROWS + 500, 700))
+    streams = RandomStreams(5)
+    whole = streams.student_draws(state, slice(0, len(state)), 4, 0.1, 5)
+
+    edges = [0, 123, BLOCK_ROWS, BLOCK_ROWS + 600, len(state)]
+    parts = [streams.student_draws(state, slice(start, stop), 4, 0.1, 5) for start, stop in zip(edges, edges[1:])]
+
+    for family, values in enumerate(whole):
+        np.testing.assert_array_equal(np.concatenate([part[family] for part in parts]), values)
+    assert np.abs(whole[0]).max() <= 0.1 and np.abs(whole[2]).max() <= 5
+
+
+def test_step_batch_is_reproducible_for_a_seed_and_step(make_state):
+    first, second = make_state(), make_state()
+    for engine_state in (first, second):
+        engine = SimulationEngine(seed=7)
+        engine.step_batch(engine_state, step=3)
+    np.testing.assert_array_equal(first.internal_factors, second.internal_factors)
+    np.testing.assert_array_equal(first.institutional_factors, second.institutional_factors)
+
+
+def test_stepping_partitions_matches_stepping_the_whole_state(make_state):
+    state = make_state((300, 200))
+    partitions = [state.partition(simulation_id).astype(state.dtype) for simulation_id in (2, 1)]
+
+    SimulationEngine(seed=7).step_batch(state, step=2)
+    for partition in partitions:
+        SimulationEngine(seed=7).step_batch(partition, step=2)
+
+    np.testing.assert_array_equal(np.concatenate([partitions[1].internal_factors, partitions[0].internal_factors]),
+                                  state.internal_factors)
+
+
+@pytest.mark.parametrize("run_id", [None, "abc123"])
+def test_namespace_step_counter(redis, run_id):
+    assert cache.current_step(run_id) == 0
+    assert cache.reserve_steps(3, run_id) == 1
+    assert cache.reserve_steps(1, run_id) == 4
+    assert cache.current_step(run_id) == 4
+
+    cache.reset_stream_clock(9, step=2, run_id=run_id)
+    assert cache.reserve_steps(1, run_id) == 3
+    assert cache.stream_seed(1, run_id) == 9
+
+
+def test_stream_seed_is_fixed_on_first_use(redis):
+    fresh = cache.stream_seed()
+    assert cache.stream_seed() == fresh
+    assert cache.stream_seed(3) == fresh
+    assert cache.stream_seed(3, "abc123") == 3
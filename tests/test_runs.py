@@ -0,0 +1,135 @@
+import json
+import os
+import time
+
+import pytest
+
+from app.services import cache, commit_cached_state, load_memory, run_simulation_steps
+from app.services.runs import RunNotFound, RunQuotaExceeded, RunRegistry, bump_database_generation, get_runs
+from app.services.timeline import RunTimeline, list_timelines
+from tests.helpers import assert_states_equal
+
+
+def _run_keys(redis, run_id):
+    return [key for key in redis.data if key.startswith(f"run:{run_id}:".encode())]
+
+
+@pytest.fixture
+def registry(redis, tmp_path):
+    return RunRegistry(max_runs=2, snapshot_root=str(tmp_path / "runs"), timeline_root=str(tmp_path / "timelines"),
+                       seed=7)
+
+
+def test_delete_run_data_leaves_other_namespaces(make_state, redis):
+    state = make_state()
+    cache.cache_state_snapshot(state)
+    cache.cache_state_snapshot(state, run_id="abc123")
+
+    cache.delete_run_data("abc123")
+
+    assert not _run_keys(redis, "abc123")
+    assert_states_equal(cache.get_cached_state(), state)
+
+
+def test_create_publishes_the_state_under_the_run(registry, redis, make_state):
+    state = make_state()
+    run = registry.create(state, label="mine")
+
+    assert run["label"] == "mine" and run["students"] == len(state) and run["active_since"] is None
+    assert_states_equal(cache.get_cached_state(run_id=run["run_id"]), state)
+    assert cache.get_cached_state() is None
+    assert cache.current_step(run["run_id"]) == 0
+    assert [meta["run_id"] for meta in registry.runs()] == [run["run_id"]]
+
+
+def test_quota_evicts_the_least_recently_used_idle_run(registry, redis, make_state):
+    state = make_state()
+    first = registry.create(state)["run_id"]
+    second = registry.create(state)["run_id"]
+    registry.touch(first, force=True)
+
+    third = registry.create(state)["run_id"]
+    assert {meta["run_id"] for meta in registry.runs()} == {first, third}
+    assert not _run_keys(redis, second)
+
+    with registry.active(first), registry.active(third):
+        with pytest.raises(RunQuotaExceeded):
+            registry.create(state)
+    registry.run_max_bytes = state.nbytes - 1
+    with pytest.raises(RunQuotaExceeded):
+        registry.create(state)
+
+
+def test_idle_runs_expire(registry, redis, make_state):
+    state = make_state()
+    swept = registry.create(state)["run_id"]
+    required = registry.create(state)["run_id"]
+
+    assert registry.sweep(now=time.time() + registry.ttl / 2) == []
+    registry.ttl = -1
+    with pytest.raises(RunNotFound):
+        registry.require(required)
+    assert registry.sweep() == [swept]
+    assert registry.runs() == [] and not redis.data.get(b"simulation_runs")
+    assert not _run_keys(redis, swept) and not _run_keys(redis, required)
+
+
+def test_evicted_runs_are_not_written_again(registry, redis, make_state):
+    state = make_state()
+    run_id = registry.create(state)["run_id"]
+    os.makedirs(registry.snapshot_dir(run_id))
+    RunTimeline.create(registry.timeline_root, state, meta={"run": run_id}).close()
+
+    registry.evict(run_id)
+
+    assert not os.path.exists(registry.snapshot_dir(run_id))
+    assert list_timelines(registry.timeline_root) == []
+    state.internal_factors[0] += 1
+    with pytest.raises(RunNotFound):
+        registry.persist(state, run_id)
+    assert not _run_keys(redis, run_id)
+
+
+def test_runs_step_in_isolation(loaded_app):
+    shared = cache.get_cached_state()
+    run_id = get_runs().create(load_memory())["run_id"]
+
+    records = list(run_simulation_steps(2, run_id=run_id))
+    assert [(record["step"], record["run"]) for record in records] == [(1, run_id), (2, run_id)]
+    assert_states_equal(cache.get_cached_state(), shared)
+
+    # the run and the shared state draw the same streams from the same seed
+    assert [record["step"] for record in run_simulation_steps(2)] == [1, 2]
+    assert_states_equal(cache.get_cached_state(run_id=run_id), cache.get_cached_state())
+    assert cache.current_step(run_id) == cache.current_step() == 2
+
+
+def test_runs_are_never_committed_after_a_reseed(loaded_app):
+    run_id = get_runs().create(load_memory())["run_id"]
+    assert commit_cached_state(run_id)["internal_factors"] > 0
+
+    bump_database_generation()
+    with pytest.raises(RuntimeError, match="reseeded"):
+        commit_cached_state(run_id)
+
+
+def test_run_endpoints(loaded_app, client):
+    response = client.post("/simulation/api/runs", json={"label": "a"})
+    assert response.status_code == 201
+    run_id = response.get_json()["run"]["run_id"]
+    assert [run["run_id"] for run in client.get("/simulation/api/runs").get_json()["runs"]] == [run_id]
+
+    response = client.post(f"/simulation/api/run_steps?n=1&run={run_id}")
+    assert json.loads(response.get_data(as_text=True).splitlines()[0])["run"] == run_id
+    assert client.post(f"/simulation/api/snapshot?run={run_id}").get_json()["step"] == 1
+
+    get_runs().pin(run_id)
+    assert client.delete(f"/simulation/api/runs/{run_id}").status_code == 409
+    get_runs().unpin(run_id)
+    assert client.delete(f"/simulation/api/runs/{run_id}").status_code == 200
+    assert client.delete(f"/simulation/api/runs/{run_id}").status_code == 404
+    for path in ("run_step", "commit_state", "snapshot", "restore"):
+        assert client.post(f"/simulation/api/{path}?run={run_id}").status_code == 404
+
+    get_runs().run_max_bytes = 1
+    assert client.post("/simulation/api/runs").status_code == 507
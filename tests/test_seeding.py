@@ -0,0 +1,49 @@
+from functools import partial
+
+from app import db
+from app.models import Course, ExternalFactors, InternalFactors, Student, StudentCourse
+from tests.conftest import STUDENTS, UNIVERSITIES
+from database_population.json_loader import load_university_data
+from database_population.seeds import seed_data
+
+
+def _universities():
+    return [u["name"] for u in load_university_data()["universities"]][:UNIVERSITIES]
+
+
+def _students():
+    return [(s.name, s.phone_number, s.date_of_birth, s.gender, s.department_id, s.simulation_id)
+            for s in Student.query.order_by(Student.id)]
+
+
+def test_every_student_gets_factors_and_department_courses(seeded_app):
+    assert Student.query.count() == STUDENTS
+    assert InternalFactors.query.count() == STUDENTS
+    assert ExternalFactors.query.count() == STUDENTS
+    assert {f.simulation_id for f in InternalFactors.query} <= {s.simulation_id for s in Student.query}
+
+    departments = {s.id: s.department_id for s in Student.query}
+    course_departments = {c.id: c.department_id for c in Course.query}
+    enrollments = StudentCourse.query.all()
+    assert enrollments
+    assert all(course_departments[e.course_id] == departments[e.student_id] for e in enrollments)
+
+
+def test_progress_is_reported_per_chunk(app, monkeypatch):
+    from database_population import seeds
+
+    monkeypatch.setattr(seeds, "bulk_seed_students", partial(seeds.bulk_seed_students, chunk_size=120))
+    calls = []
+    seed_data(_universities(), STUDENTS, progress=lambda seeded, total: calls.append((seeded, total)), seed=1)
+
+    assert calls == [(120, STUDENTS), (240, STUDENTS), (STUDENTS, STUDENTS)]
+    assert db.session.query(Student).count() == STUDENTS
+
+
+def test_seed_reproduces_the_population(app):
+    seed_data(_universities(), 50, progress=None, seed=5)
+    first = _students()
+    seed_data(_universities(), 50, progress=None, seed=5)
+    assert _students() == first
+    seed_data(_universities(), 50, progress=None, seed=6)
+    assert _students() != first
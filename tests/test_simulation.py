@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.services.model_representation import (
+    INTERNAL_FACTOR_COLUMNS, EXTERNAL_FACTOR_COLUMNS, INSTITUTIONAL_FACTOR_COLUMNS
+)
+from app.services.simulation_engine import SimulationEngine
+
+
+def _factor_object(columns, values):
+    return SimpleNamespace(**dict(zip(columns, values.tolist())))
+
+
+def test_step_batch_matches_scalar_performance(make_state):
+    # factors up to 3.0 push some scores past 100 so clamping is covered too
+    state = make_state(high=3.0)
+    engine = SimulationEngine(seed=0)
+    engine.RANDOM_VARIATION = 0
+
+    result = engine.step_batch(state, step_size=0)
+
+    expected = [
+        engine.calculate_performance(
+            _factor_object(INTERNAL_FACTOR_COLUMNS, state.internal_factors[row]),
+            _factor_object(EXTERNAL_FACTOR_COLUMNS, state.external_factors[row]),
+            _factor_object(INSTITUTIONAL_FACTOR_COLUMNS,
+                           state.institutional_factors[state.institutional_rows[row]]),
+        )
+        for row in range(len(state))
+    ]
+    np.testing.assert_allclose(result.scores, expected, rtol=1e-12)
+    assert result.scores.max() == 100 > result.scores.min()
+
+
+def test_step_batch_walk_is_bounded_by_step_size(make_state):
+    state = make_state()
+    before = state.internal_factors.copy()
+    engine = SimulationEngine(seed=0)
+
+    engine.step_batch(state, step_size=0.1)
+
+    delta = np.abs(state.internal_factors - before)
+    assert delta.max() <= 0.1
+    assert delta.min() > 0
+    assert state.dirty_rows.all()
+
+
+def test_family_impact_ignores_missing_values():
+    values = np.array([[1.0, 3.0], [np.nan, 4.0], [np.nan, np.nan]])
+    assert SimulationEngine.family_impact(values).tolist() == [2.0, 4.0, 1.0]
+    assert SimulationEngine.family_impact(np.empty((2, 0))).tolist() == [1.0, 1.0]
+
+
+def test_step_batch_steps_only_the_given_simulations(make_state):
+    state = make_state((300, 200, 100))
+    before = state.astype(state.dtype)
+
+    result = SimulationEngine(seed=0).step_batch(state, simulation_ids=[3, 1])
+
+    assert result.simulation_ids.tolist() == [3] * 100 + [1] * 300
+    rows = state.simulation_slice(2)
+    np.testing.assert_array_equal(state.internal_factors[rows], before.internal_factors[rows])
+    np.testing.assert_array_equal(state.institutional_factors[1], before.institutional_factors[1])
+    assert not state.dirty_rows[rows].any() and state.dirty_rows.sum() == 400
+
+
+def test_step_batch_scores_students_without_institutional_factors(make_state):
+    # simulation 2 has no institutional row: its students score with an impact of 1.0
+    state = make_state((30, 20), institutional_ids=[1])
+    result = SimulationEngine(seed=0).step_batch(state)
+    assert (result.institutional_impact[30:] == 1.0).all()
+    assert np.isfinite(result.scores).all()
+
+
+def _factor_means(run_id=None):
+    from app.services.cache import get_cached_state
+    state = get_cached_state(run_id=run_id)
+    return state.internal_factors.copy(), state.institutional_factors.copy()
+
+
+def test_run_step_requests_continue_the_step_counter(loaded_app):
+    from app.services import run_simulation
+    from app.services.cache import current_step
+
+    walks = []
+    for _ in range(3):
+        before, _ = _factor_means()
+        run_simulation()
+        after, _ = _factor_means()
+        walks.append(after - before)
+
+    assert current_step() == 3
+    # every request draws a step of its own instead of re-applying step 1
+    assert not np.array_equal(walks[0], walks[1])
+    assert not np.array_equal(walks[1], walks[2])
+
+
+def test_run_steps_calls_continue_where_the_last_one_stopped(loaded_app):
+    from app.services import run_simulation_steps
+    from app.services.cache import current_step
+
+    first = [record["step"] for record in run_simulation_steps(2)]
+    second = [record["step"] for record in run_simulation_steps(3)]
+
+    assert first == [1, 2]
+    assert second == [3, 4, 5]
+    assert current_step() == 5
+
+
+def test_steps_match_one_engine_over_the_whole_run(loaded_app, redis):
+    from app.services import run_simulation, run_simulation_steps
+    from app.services.cache import get_cached_state
+
+    expected = get_cached_state()
+    engine = SimulationEngine(7)
+    for step in range(1, 5):
+        engine.step_batch(expected, step=step)
+
+    list(run_simulation_steps(2))
+    run_simulation()
+    list(run_simulation_steps(1))
+
+    got = get_cached_state()
+    np.testing.assert_allclose(got.internal_factors, expected.internal_factors, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(got.institutional_factors, expected.institutional_factors, rtol=0, atol=1e-12)
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from app.services.rng import RandomStreams
+from app.services.snapshot import read_manifest, read_snapshot, write_snapshot
+from app.utils.build_flat_lookup import RowIndex
+
+ARRAYS = ('student_ids', 'simulation_ids', 'internal_factors', 'external_factors',
+          'institutional_simulation_ids', 'institutional_factors', 'institutional_rows')
+
+
+def test_snapshot_round_trip(make_state, tmp_path):
+    state = make_state()
+    directory = str(tmp_path / "snapshot")
+
+    manifest = write_snapshot(directory, state, rng=RandomStreams(11), step=42, meta={"label": "a"})
+    snapshot = read_snapshot(directory)
+
+    assert manifest["step"] == snapshot.step == 42
+    assert snapshot.rng.entropy == 11
+    assert snapshot.meta == {"label": "a"}
+    for name in ARRAYS:
+        np.testing.assert_array_equal(getattr(snapshot.state, name), getattr(state, name))
+    assert snapshot.index.rows(state.simulation_ids, state.student_ids).tolist() == list(range(len(state)))
+
+
+def test_restored_state_is_copy_on_write(make_state, tmp_path):
+    state = make_state()
+    directory = str(tmp_path / "snapshot")
+    write_snapshot(directory, state)
+
+    read_snapshot(directory).state.internal_factors[:] = -1
+
+    np.testing.assert_array_equal(read_snapshot(directory).state.internal_factors, state.internal_factors)
+
+
+def test_snapshot_replaces_the_previous_one(make_state, tmp_path):
+    directory = str(tmp_path / "snapshot")
+    write_snapshot(directory, make_state(seed=1), step=1)
+    second = make_state(seed=2)
+    write_snapshot(directory, second, index=RowIndex.build(second.simulation_ids, second.student_ids), step=2)
+
+    snapshot = read_snapshot(directory)
+    assert snapshot.step == 2 and snapshot.rng is None
+    np.testing.assert_array_equal(snapshot.state.internal_factors, second.internal_factors)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["snapshot"]
+
+
+def test_missing_snapshot(tmp_path):
+    assert read_manifest(str(tmp_path)) is None
+    assert read_snapshot(str(tmp_path)) is None
+
+
+@pytest.mark.parametrize("seed", [7, None])
+def test_restore_then_step_matches_an_uninterrupted_run(loaded_app, seed):
+    from app.services import restore_memory, run_simulation_steps, snapshot_memory
+    from app.services.cache import current_step, get_cached_state, reset_stream_clock
+
+    loaded_app.config["SIMULATION_SEED"] = seed
+    reset_stream_clock(seed)
+    list(run_simulation_steps(2))
+    assert snapshot_memory()["step"] == 2
+    list(run_simulation_steps(3))
+    uninterrupted = get_cached_state()
+
+    snapshot = restore_memory()
+    assert snapshot.step == 2 and current_step() == 2
+    list(run_simulation_steps(3))
+    resumed = get_cached_state()
+
+    assert current_step() == 5
+    np.testing.assert_array_equal(resumed.internal_factors, uninterrupted.internal_factors)
+    np.testing.assert_array_equal(resumed.external_factors, uninterrupted.external_factors)
+    np.testing.assert_array_equal(resumed.institutional_factors, uninterrupted.institutional_factors)
+
+
+def test_flushed_cache_is_restored_from_the_snapshot(loaded_app, redis):
+    from app.services import cached_or_restored_state, snapshot_memory
+    from app.services.cache import current_step, get_cached_state
+
+    expected = get_cached_state()
+    snapshot_memory()
+    redis.data.clear()
+
+    state = cached_or_restored_state()
+
+    np.testing.assert_array_equal(state.internal_factors, expected.internal_factors)
+    assert get_cached_state() is not None and current_step() == 0
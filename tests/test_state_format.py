@@ -0,0 +1,64 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from app.services import cache, state_format
+from app.utils.build_flat_lookup import RowIndex
+from tests.helpers import assert_states_equal
+
+
+def test_state_format_round_trip(make_state):
+    state = make_state()
+    assert_states_equal(state_format.loads(state_format.dumps(state)), state)
+
+    values = np.arange(12, dtype=np.float32).reshape(3, 4)
+    loaded = state_format.loads(state_format.dumps(values))
+    assert loaded.dtype == np.float32
+    np.testing.assert_array_equal(loaded, values)
+
+    assert state_format.loads(state_format.dumps({"steps": 3})) == {"steps": 3}
+
+
+def test_decoded_state_views_the_payload(make_state):
+    payload = state_format.encode_state(make_state(), meta={"step": 4})
+    state, meta = state_format.decode_state(payload)
+
+    assert meta["step"] == 4
+    assert not state.internal_factors.flags.writeable
+    with pytest.raises(ValueError):
+        state_format.decode_state(state_format.encode_arrays({"values": np.zeros(3)}))
+
+
+def test_state_file_round_trip(make_state, tmp_path):
+    state = make_state()
+    path = str(tmp_path / "state.sims")
+    state_format.write_state_file(path, state, meta={"label": "a"})
+
+    restored, meta = state_format.read_state_file(path)
+
+    assert meta["label"] == "a"
+    assert_states_equal(restored, state)
+
+
+def test_row_index_is_not_pickled():
+    index = RowIndex.build([2, 2, 1], [10, 14, 11])
+    payload = state_format.dumps(index)
+
+    assert state_format.is_binary(payload)
+    restored = state_format.loads(payload)
+    assert isinstance(restored, RowIndex) and len(restored) == 3
+    assert restored.rows([2, 2, 1], [10, 14, 11]).tolist() == [0, 1, 2]
+    # the decoded index owns its arrays, so it can still grow
+    restored.insert(1, 30, 3)
+    assert restored.get(1, 30) == 3
+
+
+def test_cached_lookup_round_trip_and_legacy_pickles(redis):
+    index = RowIndex.build([1, 1], [5, 6])
+    cache.cache_lookup_data(index, cache.LOOKUP_KEY)
+    assert state_format.is_binary(redis.get(cache.LOOKUP_KEY))
+    assert cache.get_cached_lookup_data(cache.LOOKUP_KEY).get(1, 6) == 1
+
+    redis.set(cache.LOOKUP_KEY, pickle.dumps(index))
+    assert cache.get_cached_lookup_data(cache.LOOKUP_KEY).get(1, 5) == 0
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import db
+from app import models
+from app.services import cache, load_initial_state, run_simulation_steps
+from app.services.simulation_engine import SimulationEngine
+from app.services.state_sync import GradeBook, grade_points, sync_in_app_context, sync_state
+from tests.conftest import STUDENTS
+from tests.helpers import assert_states_equal
+
+
+def test_grade_points():
+    scores = np.array([0, 39.9, 40, 44.9, 45, 50, 59.9, 60, 70, 100])
+    np.testing.assert_array_equal(grade_points(scores), [0, 0, 1, 1, 2, 3, 3, 4, 5, 5])
+
+
+def test_grade_book_averages_the_steps(make_state):
+    state = make_state(sizes=(3, 2))
+    grades = GradeBook(state)
+
+    def step(rows, scores):
+        rows = np.asarray(rows)
+        return SimpleNamespace(simulation_ids=state.simulation_ids[rows], student_ids=state.student_ids[rows],
+                               scores=np.asarray(scores, dtype=np.float64))
+
+    grades.add(step([4, 0, 2], [70, 40, 55]))
+    grades.add(step([0, 4], [65, 30]))
+    # a student the book does not know is ignored
+    grades.add(SimpleNamespace(simulation_ids=np.array([1]), student_ids=np.array([99]), scores=np.array([70.0])))
+
+    student_ids, gpa = grades.gpa()
+    assert student_ids.tolist() == [1, 3, 5]
+    np.testing.assert_array_equal(gpa, [2.5, 3.0, 2.5])
+
+
+@pytest.mark.parametrize("chunk_size", [50000, 7])
+def test_sync_state_writes_factors_and_gpa(loaded_app, chunk_size):
+    state = cache.get_cached_state()
+    before = state.internal_factors[0].copy()
+    grades = GradeBook(state)
+    engine = SimulationEngine(1)
+    for step in range(1, 4):
+        grades.add(engine.step_batch(state, step=step))
+    # a row with a NaN keeps what the database has
+    state.internal_factors[0, 0] = np.nan
+
+    synced = sync_in_app_context(loaded_app, state, grades.gpa(), chunk_size)
+
+    assert synced == {"internal_factors": STUDENTS - 1, "external_factors": STUDENTS,
+                      "institutional_factors": len(state.institutional_simulation_ids), "gpa": STUDENTS}
+    loaded = load_initial_state()
+    np.testing.assert_array_equal(loaded.internal_factors[0], before)
+    state.internal_factors[0] = before
+    assert_states_equal(loaded, state)
+
+    student_ids, gpa = grades.gpa()
+    stored = dict(db.session.query(models.Student.id, models.Student.gpa))
+    np.testing.assert_allclose([stored[i] for i in student_ids.tolist()], gpa)
+
+
+def test_completed_runs_are_committed(loaded_app):
+    loaded_app.config["SIMULATION_COMMIT_ON_RUN_END"] = True
+    list(run_simulation_steps(2))
+
+    assert_states_equal(load_initial_state(), cache.get_cached_state())
+    assert db.session.query(models.Student).filter(models.Student.gpa.is_(None)).count() == 0
+
+
+def test_commit_endpoint(loaded_app, client):
+    state = cache.get_cached_state()
+    SimulationEngine(1).step_batch(state, step=1)
+    cache.persist_dirty_state(state)
+
+    response = client.post("/simulation/api/commit_state")
+
+    assert response.status_code == 200
+    assert response.get_json()["synced"]["internal_factors"] == STUDENTS
+    assert_states_equal(load_initial_state(), state)
+
+
+def test_sync_errors_are_wrapped(app, make_state):
+    db.drop_all()
+    with pytest.raises(RuntimeError, match="Error syncing simulation state"):
+        sync_state(make_state())
@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.services import cache, run_simulation_steps
+from app.services.parallel import ShardedRunner, shutdown_process_pool
+from app.services.simulation_engine import SimulationEngine
+from app.services.timeline import (
+    DELTA_LOG, RunTimeline, delete_timelines, inline_replay, list_timelines, timeline_dir
+)
+from tests.conftest import UNIVERSITIES
+from tests.helpers import assert_states_equal
+
+
+def _copy(state):
+    return state.astype(state.dtype)
+
+
+def _record_inline(root, state, steps, first_step=1, **options):
+    """Record `steps` steps drawn from step first_step on; returns the timeline and the states after each step"""
+    engine = SimulationEngine(3)
+    timeline = RunTimeline.create(root, state, **options)
+    states = [_copy(state)]
+    for i in range(1, steps + 1):
+        replay = inline_replay(engine, first_step + i - 1)
+        engine.step_batch(state, step=first_step + i - 1)
+        timeline.record(i, state, replay)
+        states.append(_copy(state))
+    timeline.close()
+    return timeline, states
+
+
+@pytest.mark.parametrize("first_step", [1, 11])
+def test_rng_deltas_replay_bit_identically(tmp_path, make_state, first_step):
+    timeline, states = _record_inline(str(tmp_path), make_state(), 9, first_step, keyframe_every=4)
+
+    reopened = RunTimeline.open(str(tmp_path), timeline.run_id)
+    assert reopened.steps == 9 and reopened.keyframes == [0, 4, 8]
+    # forward seeks continue from the cursor, backward ones restart from a keyframe
+    for step in (0, 3, 7, 9, 2, 5, 6):
+        assert_states_equal(reopened.seek(step), states[step])
+
+
+def test_seek_returns_a_private_copy(tmp_path, make_state):
+    timeline, states = _record_inline(str(tmp_path), make_state(), 3, keyframe_every=10)
+
+    first = timeline.seek(2)
+    first.internal_factors[:] = 0
+    assert_states_equal(timeline.seek(3), states[3])
+
+
+def test_quantized_deltas_stay_close(tmp_path, make_state):
+    timeline, states = _record_inline(str(tmp_path), make_state(), 9, keyframe_every=4, deltas="quantized")
+
+    for step in (9, 1, 4, 6):
+        got = timeline.seek(step)
+        for family in ("internal_factors", "external_factors", "institutional_factors"):
+            np.testing.assert_allclose(getattr(got, family), getattr(states[step], family), atol=1e-3)
+    # keyframes are exact
+    assert_states_equal(timeline.seek(8), states[8])
+
+
+def test_sharded_runs_replay_inline(tmp_path, make_state):
+    state = make_state((3000, 2000))
+    expected = [_copy(state)]
+    try:
+        with ShardedRunner(state, workers=2, seed=3, min_shard_rows=1000, first_step=4) as runner:
+            timeline = RunTimeline.create(str(tmp_path), runner.state, keyframe_every=10)
+            for i in range(1, 4):
+                replay = runner.replay_info()
+                runner.step()
+                timeline.record(i, runner.state, replay)
+                expected.append(_copy(runner.state))
+            timeline.close()
+    finally:
+        shutdown_process_pool()
+
+    for step in (3, 1, 2):
+        assert_states_equal(timeline.seek(step), expected[step])
+
+
+def test_a_torn_delta_record_is_ignored(tmp_path, make_state):
+    timeline, states = _record_inline(str(tmp_path), make_state(), 3, keyframe_every=10)
+    with open(os.path.join(timeline_dir(str(tmp_path), timeline.run_id), DELTA_LOG), "ab") as log:
+        log.write(b"\xff" * 12)
+
+    reopened = RunTimeline.open(str(tmp_path), timeline.run_id)
+    assert_states_equal(reopened.seek(3), states[3])
+
+
+def test_timeline_errors(tmp_path, make_state):
+    root = str(tmp_path)
+    with pytest.raises(ValueError):
+        RunTimeline.create(root, make_state(), deltas="zip")
+    with pytest.raises(KeyError):
+        RunTimeline.open(root, "nope")
+    timeline = RunTimeline.create(root, make_state(), keyframe_every=10)
+    with pytest.raises(ValueError):
+        timeline.record(1, make_state())
+    with pytest.raises(RuntimeError):
+        timeline.seek(1)
+
+
+def test_retention_and_run_deletion(tmp_path, make_state):
+    root = str(tmp_path)
+    state = make_state((5, 5))
+    RunTimeline.create(root, state, meta={"run": "abc"}).close()
+    for _ in range(4):
+        RunTimeline.create(root, state, retention=3).close()
+    assert len(list_timelines(root)) == 3
+
+    RunTimeline.create(root, state, meta={"run": "abc"}).close()
+    deleted = delete_timelines(root, run="abc")
+    assert len(deleted) == 1
+    assert [timeline["meta"] for timeline in list_timelines(root)] == [{}, {}, {}]
+
+
+def test_recorded_runs_can_be_sought(loaded_app, client):
+    loaded_app.config.update(SIMULATION_TIMELINE_ENABLED=True, SIMULATION_TIMELINE_KEYFRAME_EVERY=2)
+    # the timeline's steps count from its own start, not the namespace's
+    list(run_simulation_steps(2))
+    records = list(run_simulation_steps(3))
+    run_id = records[-1]["run_id"]
+    assert [record["step"] for record in records] == [3, 4, 5]
+
+    timeline = RunTimeline.open(loaded_app.config["SIMULATION_TIMELINE_DIR"], run_id)
+    assert_states_equal(timeline.seek(3), cache.get_cached_state())
+
+    response = client.get(f"/simulation/api/timelines/{run_id}?step=3")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["steps"] == 3 and len(body["simulations"]) == UNIVERSITIES
+    assert client.get("/simulation/api/timelines").get_json()["runs"][0]["run_id"] == run_id
+    assert client.get(f"/simulation/api/timelines/{run_id}").status_code == 400
+    assert client.get(f"/simulation/api/timelines/{run_id}?step=4").status_code == 400
+    assert client.get("/simulation/api/timelines/nope?step=1").status_code == 404
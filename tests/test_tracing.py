@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from app.services import run_simulation_steps
+from app.services.offload import offload
+from app.services.tracing import NO_SPAN, TRACER, Tracer
+
+
+def _spans(tracer):
+    return [(event["name"], event["args"].get("step")) for event in tracer.export()["traceEvents"]
+            if event["ph"] == "X"]
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    assert tracer.span("load") is NO_SPAN and tracer.step(1) is NO_SPAN
+    with tracer.span("load"):
+        pass
+    assert _spans(tracer) == []
+
+
+def test_steps_are_sampled_and_inner_spans_inherit_the_step():
+    tracer = Tracer(sample_every=3, enabled=True)
+    for step in range(1, 7):
+        with tracer.step(step):
+            with tracer.span("inner"):
+                pass
+    with tracer.span("outside"):
+        pass
+
+    assert sorted(_spans(tracer), key=lambda span: (span[1] or 0, span[0])) == [
+        ("outside", None), ("inner", 1), ("step", 1), ("inner", 3), ("step", 3), ("inner", 6), ("step", 6)]
+
+
+def test_offloaded_calls_keep_their_step():
+    tracer = Tracer(sample_every=1, enabled=True)
+    assert offload(tracer.traced(sum, "sum", step=4), [1, 2]) == 3
+
+    assert _spans(tracer) == [("sum", 4)]
+    threads = [event for event in tracer.export()["traceEvents"] if event["name"] == "thread_name"]
+    assert len(threads) == 1
+
+
+def test_ring_buffer_keeps_the_newest_spans(tmp_path):
+    tracer = Tracer(capacity=2, sample_every=1, enabled=True)
+    for name in ("a", "b", "c"):
+        with tracer.span(name):
+            pass
+
+    assert [name for name, _ in _spans(tracer)] == ["b", "c"]
+    with open(tracer.dump(str(tmp_path / "trace.json"))) as file:
+        trace = json.load(file)
+    assert trace["otherData"] == {"sample_every": 1, "capacity": 2, "dropped": 1}
+    assert all(event["dur"] >= 0 and event["ts"] >= 0 for event in trace["traceEvents"] if event["ph"] == "X")
+
+
+@pytest.fixture
+def tracer():
+    yield TRACER
+    TRACER.configure(enabled=False, capacity=100_000, sample_every=10)
+    TRACER.clear()
+
+
+def test_trace_endpoints(loaded_app, client, tracer):
+    response = client.post("/simulation/api/trace", json={"enabled": True, "sample_every": 2, "capacity": 1000})
+    assert response.get_json() == {"status": "success", "enabled": True, "sample_every": 2, "capacity": 1000}
+
+    list(run_simulation_steps(4))
+    response = client.get("/simulation/api/trace?clear=1")
+    assert response.headers["Content-Disposition"] == "attachment; filename=simulation-trace.json"
+    spans = [(event["name"], event["args"].get("step")) for event in response.get_json()["traceEvents"]
+             if event["ph"] == "X"]
+    assert {step for name, step in spans if name == "step"} == {1, 2, 4}
+    assert ("persist_dirty_state", None) in spans
+    assert not tracer.events
+
+
+@pytest.mark.parametrize("data", [{"sample_every": "x"}, {"capacity": 0}, {"sample_every": -1}])
+def test_trace_configuration_is_validated(client, tracer, data):
+    assert client.post("/simulation/api/trace", json=data).status_code == 400
+    assert not tracer.enabled
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from tests.conftest import UNIVERSITIES
+
+
+def _lines(response):
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_run_steps_streams_one_record_per_step(loaded_app, client):
+    lines = _lines(client.post("/simulation/api/run_steps?n=3"))
+
+    assert [line["step"] for line in lines[:-1]] == [1, 2, 3]
+    assert all(len(line["simulations"]) == UNIVERSITIES for line in lines[:-1])
+    assert lines[-1] == {"status": "success", "steps": 3}
+
+
+def test_run_steps_every_and_continuation(loaded_app, client):
+    lines = _lines(client.post("/simulation/api/run_steps?n=5&every=2"))
+    # every 2nd step and the last one
+    assert [line["step"] for line in lines[:-1]] == [2, 4, 5]
+
+    lines = _lines(client.post("/simulation/api/run_steps?n=2"))
+    assert [line["step"] for line in lines[:-1]] == [6, 7]
+
+
+def test_run_steps_detail(loaded_app, client):
+    plain, _ = _lines(client.post("/simulation/api/run_steps?n=1"))
+    detailed, _ = _lines(client.post("/simulation/api/run_steps?n=1&detail=students"))
+
+    assert set(detailed["simulations"][0]) - set(plain["simulations"][0])
+
+
+@pytest.mark.parametrize("query", ["", "?n=0", "?n=x", "?n=10001", "?n=2&every=0"])
+def test_run_steps_rejects_bad_arguments(loaded_app, client, query):
+    response = client.post("/simulation/api/run_steps" + query)
+    assert response.status_code == 400
+    assert response.get_json()["status"] == "error"
+
+
+def test_run_steps_is_post_only(client):
+    assert client.get("/simulation/api/run_steps?n=1").status_code == 405
+
+
+def test_run_steps_unknown_run(client):
+    assert client.post("/simulation/api/run_steps?n=1&run=nope").status_code == 404
+
+
+def test_run_steps_without_data_reports_the_error(app, client):
+    lines = _lines(client.post("/simulation/api/run_steps?n=1"))
+    assert lines == [{"status": "error", "message": "No simulation data found in cache. Please load memory first."}]
+
+
+def test_run_step(loaded_app, client):
+    response = client.post("/simulation/api/run_step")
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["status"] == "success"
+    assert len(body["result"]) == UNIVERSITIES
+    # the next batch of steps continues after it
+    lines = _lines(client.post("/simulation/api/run_steps?n=1"))
+    assert lines[0]["step"] == 2
+
+
+def test_run_step_unknown_run(client):
+    assert client.post("/simulation/api/run_step?run=nope").status_code == 404